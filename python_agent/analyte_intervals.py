@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+analyte_intervals.py
+
+Rangos de PREDEFINED_ANALYTES compilados a intervalos numéricos.
+- Los rangos de analyte_ranges.py son texto libre ('M: 9-46\\nF: 6-25',
+  '≤ 6.5 o ≥ 13', bandas de edad, múltiplos del límite superior normal): se
+  interpretan una sola vez al importar y quedan como intervalos por analito,
+  sexo y banda de edad (`RANGE_INDEX`); entre bandas contiguas ('200-239' y
+  '≥ 240') no queda hueco
+- `classify` etiqueta un arreglo de valores (normal, riesgo moderado, riesgo
+  elevado o fuera de rango) con numpy, sin volver a leer los textos
+- Lo que tiene números pero no se pudo interpretar queda en `RANGE_ISSUES` y
+  se reporta con logging (warning); lo cualitativo ('Negativo', 'Amarillo
+  claro', 'E3/E4', 'modestamente > 0') no es un error, solo no se clasifica
+"""
+
+import logging
+import math
+import re
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from analyte_ranges import PREDEFINED_ANALYTES, get_analyte_info
+
+log = logging.getLogger(__name__)
+
+LEVELS = ("normal", "moderate_risk", "high_risk")
+
+# Códigos de `classify`
+UNKNOWN = -1  # sin rangos numéricos que apliquen (o valor NaN)
+NORMAL = 0
+MODERATE_RISK = 1
+HIGH_RISK = 2
+OUT_OF_RANGE = 3  # fuera de lo normal, pero ningún rango de riesgo lo cubre
+CODE_LABELS = {
+    UNKNOWN: None,
+    NORMAL: "normal",
+    MODERATE_RISK: "moderate_risk",
+    HIGH_RISK: "high_risk",
+    OUT_OF_RANGE: "out_of_range",
+}
+_LEVEL_CODES = {"normal": NORMAL, "moderate_risk": MODERATE_RISK, "high_risk": HIGH_RISK}
+
+_INF = math.inf
+_NUM = r"\d+(?:\.\d+)?"
+# Un número de verdad (no el 3 de 'E3/E4')
+_HAS_NUMBER_RE = re.compile(r"(?<![A-Za-z])\d")
+# 'F (depende de edad)' / 'M (depende de fase)': encabezado de los renglones que siguen
+_SEX_HEADER_RE = re.compile(r"^([MF])\s*\(depende de [^)]*\)\s*$")
+# 'M: 9-46', 'F que menstrúa: 15-350'
+_SEX_RE = re.compile(r"^([MF])(?:\s+([^:()\d]+?))?\s*:\s*(.*)$")
+# '20-29 años: ...', '≥ 50 años de edad: ...' (también el 'de dad' de la tabla)
+_AGE_RE = re.compile(r"^(?:(\d+)\s*-\s*(\d+)|≥\s*(\d+))\s*años(?:\s+de\s+e?dad)?\s*:\s*(.*)$")
+# 'Anemia leve: 11-11.9', 'folicular: 3.5-12.5'
+_LABEL_RE = re.compile(r"^([^\d:<>≤≥()]+?)\s*:\s*(.*)$")
+_PAREN_RE = re.compile(r"^(.*?)\s*\(([^)]*)\)\s*$")
+_UNIT_RE = re.compile(r"\s*(?:mg/dl|%)", re.IGNORECASE)
+_OR_RE = re.compile(r"\s+o\s+")
+# 'título bajo ≤ 3x ...', 'modestamente > 0': palabras antes del número o del operador
+_PREFIX_RE = re.compile(r"^([^\W\d_]+(?:\s+[^\W\d_]+)*)\s+(?=[<>≤≥\d])")
+# '1-3x mayor que el límite superior de la normal', '≥ 3x mayor que ...'
+_ULN_RE = re.compile(rf"^(?:({_NUM})\s*-\s*({_NUM})|([<>≤≥])\s*({_NUM}))\s*x\b.*l[íi]mite superior", re.IGNORECASE)
+# 'a-b', 'a–b', '3:1-5:1' (proporción a 1), '< 1.3-10.8' (límite inferior bajo detección)
+# y '> 8-9' (el corte no es exacto: se toma el extremo alto)
+_RANGE_RE = re.compile(rf"^([<>]\s*)?({_NUM})(?::1)?\s*[-–]\s*({_NUM})(?::1)?$")
+_BOUND_RE = re.compile(rf"^([<>≤≥])\s*({_NUM})(?::1)?$")
+_POINT_RE = re.compile(rf"^({_NUM})(?::1)?$")
+
+
+@dataclass(frozen=True)
+class Interval:
+    """Intervalo de valores; `label` es el texto que lo acompaña ('Anemia leve', 'folicular')."""
+
+    lo: float = -_INF
+    hi: float = _INF
+    lo_closed: bool = True
+    hi_closed: bool = True
+    label: Optional[str] = None
+    # Decimales con que se escribió cada límite en la tabla (None: calculado, p. ej. 3x el límite superior)
+    lo_decimals: Optional[int] = field(default=None, compare=False)
+    hi_decimals: Optional[int] = field(default=None, compare=False)
+
+    def contains(self, value: float) -> bool:
+        above = value >= self.lo if self.lo_closed else value > self.lo
+        below = value <= self.hi if self.hi_closed else value < self.hi
+        return above and below
+
+
+@dataclass(frozen=True)
+class RangeKey:
+    """A quién aplica un rango: sexo ('M', 'F' o None = ambos) y edad en años [age_min, age_max)."""
+
+    sex: Optional[str] = None
+    age_min: float = 0.0
+    age_max: float = _INF
+
+    @property
+    def specificity(self) -> int:
+        return (self.sex is not None) + (self.age_min > 0 or self.age_max < _INF)
+
+    def covers(self, other: "RangeKey") -> bool:
+        return (
+            self.sex in (None, other.sex)
+            and self.age_min <= other.age_min
+            and self.age_max >= other.age_max
+        )
+
+    def applies(self, sexes: np.ndarray, ages: np.ndarray) -> np.ndarray:
+        """`sexes` con los códigos de _SEX_CODES; `ages` en años (NaN si no se sabe)."""
+        mask = np.ones(sexes.shape, dtype=bool) if self.sex is None else sexes == _SEX_CODES[self.sex]
+        if self.age_min > 0 or self.age_max < _INF:
+            # Edad desconocida (NaN) no entra en ninguna banda
+            mask &= (ages >= self.age_min) & (ages < self.age_max)
+        return mask
+
+
+@dataclass(frozen=True)
+class RangeIssue:
+    analyte: str
+    level: str
+    text: str
+    reason: str
+
+
+class _CompiledBand:
+    """Intervalos de una banda como arreglos, por nivel, para comparar todos los valores a la vez."""
+
+    def __init__(self, levels: Dict[str, Tuple[Interval, ...]]):
+        self.levels = levels
+        self._arrays = []
+        for level in LEVELS:  # en este orden: el riesgo más alto gana si se traslapan
+            intervals = levels.get(level)
+            if intervals:
+                self._arrays.append((
+                    _LEVEL_CODES[level],
+                    np.array([i.lo for i in intervals], dtype=float),
+                    np.array([i.hi for i in intervals], dtype=float),
+                    np.array([i.lo_closed for i in intervals], dtype=bool),
+                    np.array([i.hi_closed for i in intervals], dtype=bool),
+                ))
+
+    def classify(self, values: np.ndarray) -> np.ndarray:
+        codes = np.full(values.shape, OUT_OF_RANGE, dtype=np.int8)
+        column = values[:, None]
+        for code, lo, hi, lo_closed, hi_closed in self._arrays:
+            above = np.where(lo_closed, column >= lo, column > lo)
+            below = np.where(hi_closed, column <= hi, column < hi)
+            codes[(above & below).any(axis=1)] = code
+        return codes
+
+
+def _close_gaps(levels: Dict[str, Tuple[Interval, ...]]) -> Dict[str, Tuple[Interval, ...]]:
+    """
+    Las tablas escriben bandas contiguas con la precisión del reporte ('5.7-6.4'
+    y '≥ 6.5', '200-239' y '≥ 240'): entre un límite superior y el inferior de
+    la banda siguiente queda un hueco de una unidad del último decimal escrito,
+    y 6.45 o 239.5 no caían en ninguna. Ese límite superior se toma como
+    exclusivo hasta el inferior de la siguiente.
+    """
+    everything = [i for found in levels.values() for i in found]
+
+    def widen(interval: Interval) -> Interval:
+        if not interval.hi_closed or interval.hi_decimals is None:
+            return interval
+        following = [i for i in everything if i.lo > interval.hi and i.lo_decimals is not None]
+        if not following:
+            return interval
+        nxt = min(following, key=lambda i: i.lo)
+        gap = nxt.lo - interval.hi
+        unit = 10.0 ** -max(interval.hi_decimals, nxt.lo_decimals)
+        if gap > unit * 1.000001 or any(i.contains(interval.hi + gap / 2) for i in everything):
+            return interval
+        return replace(interval, hi=nxt.lo, hi_closed=False)
+
+    return {level: tuple(widen(i) for i in found) for level, found in levels.items()}
+
+
+@dataclass
+class AnalyteRanges:
+    """Rangos de un analito: intervalos por banda (sexo, edad) y nivel, y el texto cualitativo."""
+
+    name: str
+    bands: Dict[RangeKey, Dict[str, Tuple[Interval, ...]]] = field(default_factory=dict)
+    qualitative: Dict[str, List[str]] = field(default_factory=dict)
+    _compiled: List[Tuple[RangeKey, _CompiledBand]] = field(default_factory=list, repr=False)
+
+    def compile(self) -> None:
+        """Cada banda hereda los niveles que no define de la banda más específica que la cubre."""
+        keys = sorted(self.bands, key=lambda k: -k.specificity)
+        self._compiled = []
+        for key in keys:
+            levels = dict(self.bands[key])
+            for level in LEVELS:
+                if level in levels:
+                    continue
+                for parent in keys:
+                    if parent != key and parent.covers(key) and level in self.bands[parent]:
+                        levels[level] = self.bands[parent][level]
+                        break
+            self._compiled.append((key, _CompiledBand(_close_gaps(levels))))
+
+    def intervals(self, sex: Optional[str] = None, age: Optional[float] = None) -> Dict[str, Tuple[Interval, ...]]:
+        """Intervalos por nivel que aplican a una persona ({} si ninguna banda aplica)."""
+        sexes = _sex_array(sex, (1,))
+        ages = np.array([math.nan if age is None else age], dtype=float)
+        for key, band in self._compiled:
+            if key.applies(sexes, ages)[0]:
+                return band.levels
+        return {}
+
+
+# ---------------------------------------------------------------------------
+# Interpretación de los textos
+# ---------------------------------------------------------------------------
+
+
+def _bound(op: str, value: float, label: Optional[str], decimals: Optional[int] = None) -> Interval:
+    if op in "<≤":
+        return Interval(hi=value, hi_closed=op == "≤", label=label, hi_decimals=decimals)
+    return Interval(lo=value, lo_closed=op == "≥", label=label, lo_decimals=decimals)
+
+
+def _decimals(number: str) -> int:
+    return len(number.partition(".")[2])
+
+
+def _parse_alternative(text: str, label: Optional[str]) -> Interval:
+    match = _RANGE_RE.match(text)
+    if match:
+        op, lo, hi = match.groups()
+        if op and op.strip() == "<":
+            return Interval(hi=float(hi), label=label, hi_decimals=_decimals(hi))
+        if op:
+            return Interval(lo=float(hi), lo_closed=False, label=label, lo_decimals=_decimals(hi))
+        return Interval(lo=float(lo), hi=float(hi), label=label, lo_decimals=_decimals(lo), hi_decimals=_decimals(hi))
+    match = _BOUND_RE.match(text)
+    if match:
+        return _bound(match.group(1), float(match.group(2)), label, _decimals(match.group(2)))
+    match = _POINT_RE.match(text)
+    if match:
+        value, decimals = float(match.group(1)), _decimals(match.group(1))
+        return Interval(lo=value, hi=value, label=label, lo_decimals=decimals, hi_decimals=decimals)
+    raise ValueError(f"no se entiende '{text}'")
+
+
+def _parse_body(body: str, label: Optional[str]):
+    """
+    Intervalos de un renglón ('< 4.5 o > 11.7', 'Negativo (< 15 mg/dl)'), None si
+    es cualitativo, o ('uln', ...) si es relativo al límite superior normal.
+    Lanza ValueError si trae números que no se entienden.
+    """
+    body = body.strip().lstrip("Δ").strip()
+    if not _HAS_NUMBER_RE.search(body):
+        return None
+    match = _PAREN_RE.match(body)
+    if match:
+        outside, inside = match.groups()
+        if _HAS_NUMBER_RE.search(inside) and not _HAS_NUMBER_RE.search(outside):
+            label = outside.strip() or label  # 'Negativo (< 15)'
+            body = inside.strip()
+        elif _HAS_NUMBER_RE.search(outside) and not _HAS_NUMBER_RE.search(inside):
+            body = outside.strip()  # '8-60 (rango de referencia de lab)': nota
+        else:
+            raise ValueError("números dentro y fuera del paréntesis")
+    body = _UNIT_RE.sub("", body).strip()
+    match = _PREFIX_RE.match(body)
+    if match:
+        prefix = match.group(1)
+        if prefix.lower().endswith("mente"):
+            return None  # 'modestamente > 0': no fija un límite
+        label = label or prefix
+        body = body[match.end():]
+
+    match = _ULN_RE.match(body)
+    if match:
+        lo, hi, op, times = match.groups()
+        return ("uln", lo, hi, op, times, label)
+    return [_parse_alternative(alternative.strip(), label) for alternative in _OR_RE.split(body)]
+
+
+def _entry_lines(text: str) -> List[Tuple[RangeKey, Optional[str], str]]:
+    """(banda, etiqueta, texto del rango) de cada renglón de una entrada."""
+    lines = []
+    sex: Optional[str] = None
+    for raw_line in text.split("\n"):
+        line = raw_line.strip()
+        if not line:
+            continue
+        match = _SEX_HEADER_RE.match(line)
+        if match:
+            sex = match.group(1)
+            continue
+        label = None
+        match = _SEX_RE.match(line)
+        if match:
+            sex, label, line = match.group(1), match.group(2), match.group(3)
+        key = RangeKey(sex=sex)
+        match = _AGE_RE.match(line)
+        if match:
+            lo, hi, at_least, line = match.groups()
+            if at_least:
+                key = RangeKey(sex=sex, age_min=float(at_least))
+            else:
+                key = RangeKey(sex=sex, age_min=float(lo), age_max=float(hi) + 1)
+        else:
+            match = _LABEL_RE.match(line)
+            if match:
+                label, line = match.groups()
+        lines.append((key, label, line))
+    return lines
+
+
+def _upper_normal(levels: Dict[str, List[Interval]]) -> Optional[float]:
+    highs = [i.hi for i in levels.get("normal", []) if i.hi < _INF]
+    return max(highs) if highs else None
+
+
+def _resolve_uln(ranges: AnalyteRanges, bands, level: str, key: RangeKey, spec, text: str, issues) -> None:
+    """'1-3x mayor que el límite superior' contra el límite superior normal de cada banda que aplica."""
+    _, lo, hi, op, times, label = spec
+    targets = [k for k in bands if key.covers(k) and _upper_normal(bands[k]) is not None]
+    if not targets:
+        issues.append(RangeIssue(ranges.name, level, text, "relativo al límite superior, pero sin rango normal numérico"))
+        return
+    for target in targets:
+        uln = _upper_normal(bands[target])
+        if op:
+            interval = _bound(op, float(times) * uln, label)
+        else:
+            # 'mayor que': el límite superior mismo sigue siendo normal
+            interval = Interval(lo=float(lo) * uln, hi=float(hi) * uln, lo_closed=False, label=label)
+        bands[target].setdefault(level, []).append(interval)
+
+
+def _compile_analyte(name: str, info: dict, issues: List[RangeIssue]) -> AnalyteRanges:
+    ranges = AnalyteRanges(name)
+    bands: Dict[RangeKey, Dict[str, List[Interval]]] = {}
+    relative = []
+    for level in LEVELS:
+        text = info.get(level)
+        if not text:
+            continue
+        parsed: List[Tuple[RangeKey, List[Interval]]] = []
+        for key, label, body in _entry_lines(text):
+            try:
+                result = _parse_body(body, label)
+            except ValueError as e:
+                issues.append(RangeIssue(name, level, body, str(e)))
+                continue
+            if result is None:
+                ranges.qualitative.setdefault(level, []).append(body if label is None else f"{label}: {body}")
+            elif isinstance(result, tuple):
+                relative.append((level, key, result, text))
+            else:
+                parsed.append((key, result))
+
+        # Un valor puntual entre renglones con rangos suele ser un guion perdido ('F: 60160')
+        has_ranges = any(i.lo < i.hi for _, found in parsed for i in found)
+        for key, found in parsed:
+            if has_ranges and len(parsed) > 1 and all(i.lo == i.hi for i in found):
+                issues.append(RangeIssue(name, level, text, f"valor puntual {found[0].lo:g} entre rangos (¿falta el guion?)"))
+                continue
+            bands.setdefault(key, {}).setdefault(level, []).extend(found)
+
+    for level, key, spec, text in relative:
+        _resolve_uln(ranges, bands, level, key, spec, text, issues)
+    ranges.bands = {key: {level: tuple(found) for level, found in levels.items()} for key, levels in bands.items()}
+    ranges.compile()
+    return ranges
+
+
+def build_range_index(table: Dict[str, dict]) -> Tuple[Dict[str, AnalyteRanges], List[RangeIssue]]:
+    """Índice {analito: AnalyteRanges} de una tabla con la forma de PREDEFINED_ANALYTES, y lo que no se entendió."""
+    issues: List[RangeIssue] = []
+    index = {name: _compile_analyte(name, info, issues) for name, info in table.items()}
+    return index, issues
+
+
+# ---------------------------------------------------------------------------
+# Clasificación
+# ---------------------------------------------------------------------------
+
+# El sexo se compara como entero: mucho más rápido que comparar strings elemento por elemento
+_SEX_CODES = {None: 0, "M": 1, "F": 2}
+_SEX_ALIASES = {
+    "m": "M", "h": "M", "masculino": "M", "hombre": "M", "male": "M",
+    "f": "F", "femenino": "F", "mujer": "F", "female": "F",
+}
+
+
+def _normalize_sex(sex) -> Optional[str]:
+    if not isinstance(sex, str):
+        return None
+    return _SEX_ALIASES.get(sex.strip().lower())
+
+
+def _sex_array(sex, shape) -> np.ndarray:
+    """Códigos de sexo (_SEX_CODES) con la forma de los valores; cada texto distinto se normaliza una vez."""
+    if sex is None or isinstance(sex, str):
+        return np.full(shape, _SEX_CODES[_normalize_sex(sex)], dtype=np.int8)
+    raw = np.asarray(sex)
+    unique, inverse = np.unique(raw.astype(str), return_inverse=True)
+    mapped = np.array([_SEX_CODES[_normalize_sex(s)] for s in unique], dtype=np.int8)
+    return np.broadcast_to(mapped[inverse].reshape(raw.shape), shape)
+
+
+def _ranges_for(analyte: str) -> Optional[AnalyteRanges]:
+    ranges = RANGE_INDEX.get(analyte)
+    if ranges is None:
+        info = get_analyte_info(analyte or "")
+        ranges = RANGE_INDEX.get(info["name"]) if info else None
+    return ranges
+
+
+def classify(analyte: str, values, sex=None, age=None) -> np.ndarray:
+    """
+    Códigos (NORMAL, MODERATE_RISK, HIGH_RISK, OUT_OF_RANGE o UNKNOWN; ver
+    CODE_LABELS) de `values` para un analito (nombre de la tabla o sinónimo).
+    `sex` ('M'/'F', 'masculino', 'mujer'...) y `age` (años) pueden ser
+    escalares o arreglos del largo de `values`. UNKNOWN: valor NaN, analito sin
+    rangos numéricos, o rangos por sexo/edad y la persona no cae en ninguno.
+    """
+    values = np.asarray(values, dtype=float)
+    codes = np.full(values.shape, UNKNOWN, dtype=np.int8)
+    ranges = _ranges_for(analyte)
+    if ranges is None or not ranges._compiled or values.size == 0:
+        return codes
+    flat = values.reshape(-1)
+    sexes = _sex_array(sex, values.shape).reshape(-1)
+    ages = np.broadcast_to(np.asarray(math.nan if age is None else age, dtype=float), values.shape).reshape(-1)
+    out = codes.reshape(-1)
+    pending = ~np.isnan(flat)
+    for key, band in ranges._compiled:  # las bandas más específicas primero
+        mask = pending & key.applies(sexes, ages)
+        if mask.any():
+            out[mask] = band.classify(flat[mask])
+            pending &= ~mask
+        if not pending.any():
+            break
+    return out.reshape(values.shape)
+
+
+def classify_value(analyte: str, value: float, sex: Optional[str] = None, age: Optional[float] = None) -> Optional[str]:
+    """Nivel de un solo valor: 'normal', 'moderate_risk', 'high_risk', 'out_of_range' o None."""
+    return CODE_LABELS[int(classify(analyte, [value], sex, age)[0])]
+
+
+# Se construye una vez al importar; lo que no se entendió queda en RANGE_ISSUES
+RANGE_INDEX, RANGE_ISSUES = build_range_index(PREDEFINED_ANALYTES)
+for _issue in RANGE_ISSUES:
+    log.warning("[ranges] %s (%s): %r — %s", _issue.analyte, _issue.level, _issue.text, _issue.reason)
+
+
+def range_summary() -> str:
+    """Resumen para el arranque (warmup.py) y para `python analyte_intervals.py`."""
+    total = sum(len(found) for r in RANGE_INDEX.values() for levels in r.bands.values() for found in levels.values())
+    analytes = sum(1 for r in RANGE_INDEX.values() if r.bands)
+    return f"{total} intervalos en {analytes} analitos; {len(RANGE_ISSUES)} entradas sin interpretar"
+
+
+if __name__ == "__main__":
+    # Las entradas sin interpretar ya salieron arriba como advertencias
+    print(f"[ranges] {range_summary()}")
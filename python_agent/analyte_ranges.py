@@ -1,3 +1,6 @@
+import hashlib
+import json
+
 PREDEFINED_ANALYTES = {
     "ALT": {
         "unit": "U/L",
@@ -379,7 +382,7 @@ PREDEFINED_ANALYTES = {
     },
     "Hierro": {
         "unit": "µg/dl",
-        "normal": "M: 80-180\nF: 60160",
+        "normal": "M: 80-180\nF: 60-160",
         "moderate_risk": None,
         "high_risk": None
     },
@@ -861,6 +864,12 @@ ANALYTE_SYNONYMS = {
     "peptido c": "Péptido C (ng/mL)",
 }
 
+# Huella de las tablas de arriba: cambia si se edita cualquier analito, rango o sinónimo.
+# Sirve para invalidar lo que depende de ellas (p. ej. la caché de OCR).
+ANALYTE_TABLE_VERSION = hashlib.sha256(
+    json.dumps([PREDEFINED_ANALYTES, ANALYTE_SYNONYMS], sort_keys=True, ensure_ascii=False).encode("utf-8")
+).hexdigest()[:16]
+
 def get_analyte_info(name: str) -> dict:
     """
     Obtiene información de un analito por nombre.
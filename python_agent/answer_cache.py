@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+answer_cache.py
+
+Caché semántica de respuestas para /ask.
+- Una pregunta reutiliza una respuesta previa si su embedding es suficientemente
+  parecido (similitud coseno ≥ umbral) al de una pregunta ya respondida
+- Solo se comparan preguntas con el mismo "alcance": versión del índice,
+  banderas de saludo, mensajes previos, números de la pregunta y, si la
+  respuesta saluda por nombre, el nombre
+- Las entradas expiran por TTL y se descartan por LRU al llenarse
+- Se vacía por completo cuando se publica una nueva versión del índice
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+_EPS = 1e-12
+
+
+@dataclass
+class _Entry:
+    scope: Hashable
+    vec: np.ndarray  # normalizado
+    answer: str
+    created: float
+
+
+@dataclass
+class _Bucket:
+    """Entradas de un mismo alcance, con su matriz para comparar de una vez."""
+
+    keys: List[int] = field(default_factory=list)
+    matrix: Optional[np.ndarray] = None  # None = hay que reconstruirla
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float = 0.95, ttl: float = 86400.0, max_items: int = 1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[Hashable, _Bucket] = {}
+        self._next_key = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vec: np.ndarray) -> np.ndarray:
+        vec = np.asarray(vec, dtype=np.float32).ravel()
+        return vec / (np.linalg.norm(vec) + _EPS)
+
+    def _drop(self, key: int) -> None:
+        entry = self._entries.pop(key)
+        bucket = self._buckets[entry.scope]
+        bucket.keys.remove(key)
+        bucket.matrix = None
+        if not bucket.keys:
+            del self._buckets[entry.scope]
+
+    def lookup(self, query_vec: np.ndarray, scope: Hashable) -> Optional[Tuple[str, float]]:
+        """Devuelve (respuesta, similitud) de la pregunta más parecida, o None."""
+        q = self._normalize(query_vec)
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.get(scope)
+            if bucket is not None:
+                expired = [k for k in bucket.keys if now - self._entries[k].created > self.ttl]
+                for k in expired:
+                    self._drop(k)
+                bucket = self._buckets.get(scope)
+
+            if bucket is None:
+                self.misses += 1
+                return None
+
+            if bucket.matrix is None:
+                bucket.matrix = np.vstack([self._entries[k].vec for k in bucket.keys])
+            sims = bucket.matrix @ q
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            key = bucket.keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key].answer, float(sims[best])
+
+    def store(self, query_vec: np.ndarray, scope: Hashable, answer: str) -> None:
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = _Entry(scope, self._normalize(query_vec), answer, time.time())
+            bucket = self._buckets.setdefault(scope, _Bucket())
+            bucket.keys.append(key)
+            bucket.matrix = None
+            while len(self._entries) > self.max_items:
+                self._drop(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"items": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Caché compartida por todo el proceso
+ANSWER_CACHE = SemanticAnswerCache(
+    threshold=float(os.getenv("EVITY_ANSWER_CACHE_THRESHOLD", "0.95")),
+    ttl=float(os.getenv("EVITY_ANSWER_CACHE_TTL", "86400")),
+    max_items=int(os.getenv("EVITY_ANSWER_CACHE_MAX_ITEMS", "1000")),
+)
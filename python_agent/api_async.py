@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API asíncrona (Quart) para el Agente de IA de Evity.
+
+Mismas rutas y mismos contratos que api_server.py (lo que usa server/routes.ts),
+pero las llamadas a OpenAI se esperan en el event loop en lugar de ocupar un
+hilo: un solo proceso puede tener cientos de solicitudes esperando a la vez.
+Lo que sí usa CPU o disco (PDF -> imágenes, búsqueda en el índice, SQLite)
+corre en hilos con `asyncio.to_thread`.
+
+Uso:
+    python3 api_async.py                      # un proceso
+    python3 start_service.py --mode async     # hypercorn con varios workers
+"""
+
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+from quart import Quart, Response, jsonify, request
+
+# Agregar el directorio actual al path para importar los módulos del agente
+sys.path.insert(0, str(Path(__file__).parent))
+
+from evity_qa_agent import REBUILDER, IndexNotReadyError, preguntar_qa_async, preguntar_qa_stream_async
+from lab_ocr import ocr_and_extract_labs_async, ocr_and_extract_labs_stream_async
+from ocr_jobs import OCR_JOBS, QueueFullError
+from openai_client import aclose_async_openai_clients
+from warmup import warmup
+
+app = Quart(__name__)
+# Igual que Flask: sin tope de tamaño para los archivos de laboratorio
+app.config["MAX_CONTENT_LENGTH"] = None
+# El OCR con visión puede tardar minutos
+app.config["RESPONSE_TIMEOUT"] = int(os.getenv("EVITY_REQUEST_TIMEOUT", "300"))
+
+# Carpeta base donde están los contenidos
+BASE_DIR = Path(__file__).parent
+
+
+@app.after_request
+async def cors(response):
+    """Mismos encabezados CORS que flask_cors en api_server.py"""
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    return response
+
+
+@app.before_serving
+async def startup():
+    await asyncio.to_thread(warmup, BASE_DIR)
+    # Los trabajos de OCR corren en hilos propios (cliente síncrono), fuera del event loop
+    await asyncio.to_thread(OCR_JOBS.start)
+
+
+@app.after_serving
+async def shutdown():
+    await asyncio.to_thread(OCR_JOBS.stop)
+    await aclose_async_openai_clients()
+
+
+async def _uploaded_file():
+    """(bytes, nombre) del archivo: form-data (campo 'file') o body crudo + X-File-Name"""
+    files = await request.files
+    if 'file' in files:
+        file_storage = files['file']
+        return file_storage.read(), file_storage.filename or "archivo_sin_nombre"
+    return await request.get_data(), request.headers.get("X-File-Name", "archivo_sin_nombre")
+
+
+def _flag(value, default=True):
+    """Interpreta un booleano que puede llegar como texto o número ('false', '0', 0, "no")"""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() not in ('0', 'false', 'no')
+    return bool(value)
+
+
+def _use_ocr_cache():
+    """`?useCache=false` fuerza el OCR aunque el mismo archivo ya se haya procesado"""
+    return _flag(request.args.get('useCache'))
+
+
+@app.route('/labs/ocr', methods=['POST'])
+async def labs_ocr():
+    """Igual que en api_server.py: form-data (campo 'file') o bytes crudos + X-File-Name."""
+    file_bytes, filename = await _uploaded_file()
+
+    try:
+        result = await ocr_and_extract_labs_async(file_bytes, filename, use_cache=_use_ocr_cache())
+        return jsonify(result)
+    except Exception as e:
+        print(f"Error en OCR: {e}")
+        return jsonify({
+            "error": "Error procesando archivo de laboratorio en Python",
+            "details": str(e),
+        }), 500
+
+
+@app.route('/labs/ocr/stream', methods=['POST'])
+async def labs_ocr_stream():
+    """Mismos eventos que /labs/ocr/stream en api_server.py"""
+    file_bytes, filename = await _uploaded_file()
+    if not file_bytes:
+        return jsonify({"error": "No se recibió ningún archivo"}), 400
+
+    events = ocr_and_extract_labs_stream_async(file_bytes, filename, use_cache=_use_ocr_cache())
+    try:
+        first = await events.__anext__()
+    except Exception as e:
+        print(f"Error en OCR: {e}")
+        return jsonify({
+            "error": "Error procesando archivo de laboratorio en Python",
+            "details": str(e),
+        }), 500
+
+    async def generate():
+        yield _sse(*first)
+        try:
+            async for event in events:
+                yield _sse(*event)
+        except Exception as e:
+            print(f"Error en OCR: {e}")
+            yield _sse("error", {
+                "error": "Error procesando archivo de laboratorio en Python",
+                "details": str(e),
+            })
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+@app.route('/labs/ocr/jobs', methods=['POST'])
+async def labs_ocr_submit():
+    """Igual que en api_server.py: forma el archivo en la cola y responde 202 con el job_id."""
+    file_bytes, filename = await _uploaded_file()
+    if not file_bytes:
+        return jsonify({"error": "No se recibió ningún archivo"}), 400
+    try:
+        job = await asyncio.to_thread(
+            OCR_JOBS.submit, file_bytes, filename, use_cache=_use_ocr_cache())
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 429
+    except Exception as e:
+        print(f"Error formando trabajo de OCR: {e}")
+        return jsonify({
+            "error": "Error guardando el archivo de laboratorio",
+            "details": str(e),
+        }), 500
+    return jsonify(job), 202
+
+
+@app.route('/labs/ocr/jobs/<job_id>', methods=['GET'])
+async def labs_ocr_status(job_id):
+    """Estado del trabajo: queued (con queue_position), running, done o error"""
+    job = await asyncio.to_thread(OCR_JOBS.status, job_id)
+    if job is None:
+        return jsonify({"error": "No existe el trabajo de OCR"}), 404
+    return jsonify(job)
+
+
+@app.route('/labs/ocr/jobs/<job_id>/result', methods=['GET'])
+async def labs_ocr_result(job_id):
+    """200 con el JSON de /labs/ocr si terminó; 202 si sigue pendiente; 500 si falló."""
+    job = await asyncio.to_thread(OCR_JOBS.status, job_id)
+    if job is None:
+        return jsonify({"error": "No existe el trabajo de OCR"}), 404
+    if job["status"] == "error":
+        return jsonify({
+            "error": "Error procesando archivo de laboratorio en Python",
+            "details": job["error"],
+            "job": job,
+        }), 500
+    if job["status"] != "done":
+        return jsonify(job), 202
+    return jsonify(await asyncio.to_thread(OCR_JOBS.result, job_id))
+
+
+@app.route('/health', methods=['GET'])
+async def health():
+    """Health check endpoint"""
+    return jsonify({"status": "ok", "service": "evity-qa-agent"})
+
+
+def _ask_params(data):
+    """Valida el cuerpo de /ask; devuelve (kwargs, None) o (None, respuesta de error)."""
+    if not data or 'question' not in data:
+        return None, (jsonify({"error": "Se requiere el campo 'question'"}), 400)
+
+    question = data['question']
+    if not question or not question.strip():
+        return None, (jsonify({"error": "La pregunta no puede estar vacía"}), 400)
+
+    return {
+        "pregunta": question,
+        "carpeta_base": str(BASE_DIR),
+        "nombre_usuario": data.get('userName', None),
+        "historial": data.get('history', []),
+        "ya_saludo": data.get('hasSentPersonalGreeting', False),
+        "mensaje_tiene_saludo": data.get('messageHasGreeting', False),
+        "usar_cache": _flag(data.get('useCache')),
+    }, None
+
+
+def _ask_error(e):
+    """Traduce los errores de /ask a la misma respuesta que api_server.py"""
+    if isinstance(e, IndexNotReadyError):
+        return jsonify({
+            "error": str(e),
+            "rebuild": REBUILDER.status(BASE_DIR),
+        }), 503
+    if isinstance(e, FileNotFoundError):
+        return jsonify({
+            "error":
+            "No se encontró el índice. Por favor, agrega documentos a la carpeta 'contenidos' primero.",
+            "details": str(e)
+        }), 404
+    print(f"Error procesando pregunta: {e}")
+    return jsonify({
+        "error": "Error interno del servidor",
+        "details": str(e)
+    }), 500
+
+
+@app.route('/ask', methods=['POST'])
+async def ask():
+    """Mismo contrato que /ask en api_server.py: { "answer", "question" }"""
+    params, error = _ask_params(await request.get_json(silent=True))
+    if error:
+        return error
+    try:
+        answer = await preguntar_qa_async(**params)
+        return jsonify({"answer": answer, "question": params["pregunta"]})
+    except Exception as e:
+        return _ask_error(e)
+
+
+def _sse(event, data):
+    """Formatea un evento server-sent events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route('/ask/stream', methods=['POST'])
+async def ask_stream():
+    """Mismos eventos que /ask/stream en api_server.py"""
+    params, error = _ask_params(await request.get_json(silent=True))
+    if error:
+        return error
+
+    events = preguntar_qa_stream_async(**params)
+    try:
+        # El primer evento se pide aquí para que los errores de índice lleguen como código HTTP
+        first = await events.__anext__()
+    except Exception as e:
+        return _ask_error(e)
+
+    async def generate():
+        yield _sse(*first)
+        try:
+            async for event in events:
+                yield _sse(*event)
+        except Exception as e:
+            print(f"Error durante el streaming: {e}")
+            yield _sse("error", {"error": "Error interno del servidor", "details": str(e)})
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+@app.route('/rebuild-index', methods=['POST'])
+async def rebuild_index():
+    """Igual que en api_server.py: lanza la reconstrucción en segundo plano (202)."""
+    try:
+        data = await request.get_json(silent=True) or {}
+        started, status = REBUILDER.trigger(
+            BASE_DIR, full=_flag(data.get('full'), default=False), reason="POST /rebuild-index")
+
+        message = ("Reconstrucción del índice iniciada" if started else
+                   "Ya hay una reconstrucción en curso")
+        return jsonify({"message": message, "started": started, "status": status}), 202
+
+    except Exception as e:
+        print(f"Error reconstruyendo índice: {e}")
+        return jsonify({
+            "error": "Error reconstruyendo el índice",
+            "details": str(e)
+        }), 500
+
+
+@app.route('/rebuild-index/status', methods=['GET'])
+async def rebuild_index_status():
+    """Estado y progreso de la reconstrucción en curso (o de la última)"""
+    return jsonify(REBUILDER.status(BASE_DIR))
+
+
+if __name__ == '__main__':
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    port = int(os.getenv('PYTHON_API_PORT', 5001))
+    config = Config()
+    config.bind = [f"0.0.0.0:{port}"]
+    config.graceful_timeout = float(os.getenv("EVITY_GRACEFUL_TIMEOUT", "30"))
+    config.keep_alive_timeout = float(os.getenv("EVITY_HTTP_KEEPALIVE", "5"))
+    print(f"🚀 Iniciando API asíncrona del Agente IA en puerto {port}")
+    asyncio.run(serve(app, config))
@@ -5,8 +5,9 @@ API Flask para el Agente de IA de Evity
 Expone un endpoint HTTP para que el backend Node.js pueda comunicarse con el agente Python
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+import json
 import os
 import sys
 from pathlib import Path
@@ -14,8 +15,9 @@ from pathlib import Path
 # Agregar el directorio actual al path para importar evity_qa_agent
 sys.path.insert(0, str(Path(__file__).parent))
 
-from evity_qa_agent import preguntar_qa
-from lab_ocr import ocr_and_extract_labs  # 👈 NUEVO: módulo de OCR de laboratorios
+from evity_qa_agent import REBUILDER, IndexNotReadyError, preguntar_qa, preguntar_qa_stream
+from lab_ocr import ocr_and_extract_labs, ocr_and_extract_labs_stream  # 👈 NUEVO: módulo de OCR de laboratorios
+from ocr_jobs import OCR_JOBS, QueueFullError
 
 app = Flask(__name__)
 CORS(app)
@@ -24,6 +26,28 @@ CORS(app)
 BASE_DIR = Path(__file__).parent
 
 
+def _uploaded_file():
+    """(bytes, nombre) del archivo: form-data (campo 'file') o body crudo + X-File-Name"""
+    if 'file' in request.files:
+        file_storage = request.files['file']
+        return file_storage.read(), file_storage.filename or "archivo_sin_nombre"
+    return request.get_data(), request.headers.get("X-File-Name", "archivo_sin_nombre")
+
+
+def _flag(value, default=True):
+    """Interpreta un booleano que puede llegar como texto o número ('false', '0', 0, "no")"""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() not in ('0', 'false', 'no')
+    return bool(value)
+
+
+def _use_ocr_cache():
+    """`?useCache=false` fuerza el OCR aunque el mismo archivo ya se haya procesado"""
+    return _flag(request.args.get('useCache'))
+
+
 @app.route('/labs/ocr', methods=['POST'])
 def labs_ocr():
     """
@@ -33,18 +57,10 @@ def labs_ocr():
     - Un archivo subido como form-data (campo 'file'), o
     - Bytes crudos en el body (lo que hace tu backend Node con axios)
     """
-    # 1) Intentar leer como archivo (form-data)
-    if 'file' in request.files:
-        file_storage = request.files['file']
-        file_bytes = file_storage.read()
-        filename = file_storage.filename or "archivo_sin_nombre"
-    else:
-        # 2) Si no hay 'file', leer el body crudo (lo que usamos desde Node)
-        file_bytes = request.get_data()
-        filename = request.headers.get("X-File-Name", "archivo_sin_nombre")
+    file_bytes, filename = _uploaded_file()
 
     try:
-        result = ocr_and_extract_labs(file_bytes, filename)
+        result = ocr_and_extract_labs(file_bytes, filename, use_cache=_use_ocr_cache())
         return jsonify(result)
     except Exception as e:
         print(f"Error en OCR: {e}")
@@ -54,6 +70,109 @@ def labs_ocr():
         }), 500
 
 
+@app.route('/labs/ocr/stream', methods=['POST'])
+def labs_ocr_stream():
+    """
+    Igual que /labs/ocr (mismo cuerpo y ?useCache), pero responde con
+    server-sent events conforme el modelo lee los analitos:
+        event: analito   data: {"nombre": ..., "valor": ..., "unidad": ..., ...}
+        ...
+        event: result    data: el mismo JSON que /labs/ocr
+    `result` es el definitivo (la validación de la biometría puede corregir
+    lo adelantado). Si algo falla a mitad del stream llega `event: error` y se
+    cierra; los errores antes del primer evento (archivo vacío, tipo no
+    soportado, PDF ilegible) responden 400/500 igual que /labs/ocr.
+    """
+    file_bytes, filename = _uploaded_file()
+    if not file_bytes:
+        return jsonify({"error": "No se recibió ningún archivo"}), 400
+
+    events = ocr_and_extract_labs_stream(file_bytes, filename, use_cache=_use_ocr_cache())
+    try:
+        # El primer evento se pide aquí para que una falla antes de empezar llegue como código HTTP
+        first = next(events)
+    except Exception as e:
+        print(f"Error en OCR: {e}")
+        return jsonify({
+            "error": "Error procesando archivo de laboratorio en Python",
+            "details": str(e),
+        }), 500
+
+    @stream_with_context
+    def generate():
+        yield _sse(*first)
+        try:
+            for event in events:
+                yield _sse(*event)
+        except Exception as e:
+            print(f"Error en OCR: {e}")
+            yield _sse("error", {
+                "error": "Error procesando archivo de laboratorio en Python",
+                "details": str(e),
+            })
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # que un proxy (nginx) no acumule el stream
+    })
+
+
+@app.route('/labs/ocr/jobs', methods=['POST'])
+def labs_ocr_submit():
+    """
+    Versión asíncrona de /labs/ocr: recibe el archivo igual, lo forma en la
+    cola y responde 202 de inmediato con { "job_id", "status", ... }.
+    El estado se consulta en GET /labs/ocr/jobs/<job_id> y el resultado
+    (el mismo JSON que /labs/ocr) en GET /labs/ocr/jobs/<job_id>/result.
+    """
+    file_bytes, filename = _uploaded_file()
+    if not file_bytes:
+        return jsonify({"error": "No se recibió ningún archivo"}), 400
+    try:
+        OCR_JOBS.start()
+        job = OCR_JOBS.submit(file_bytes, filename, use_cache=_use_ocr_cache())
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 429
+    except Exception as e:
+        print(f"Error formando trabajo de OCR: {e}")
+        return jsonify({
+            "error": "Error guardando el archivo de laboratorio",
+            "details": str(e),
+        }), 500
+    return jsonify(job), 202
+
+
+@app.route('/labs/ocr/jobs/<job_id>', methods=['GET'])
+def labs_ocr_status(job_id):
+    """Estado del trabajo: queued (con queue_position), running, done o error"""
+    OCR_JOBS.start()
+    job = OCR_JOBS.status(job_id)
+    if job is None:
+        return jsonify({"error": "No existe el trabajo de OCR"}), 404
+    return jsonify(job)
+
+
+@app.route('/labs/ocr/jobs/<job_id>/result', methods=['GET'])
+def labs_ocr_result(job_id):
+    """
+    200 con el mismo JSON que /labs/ocr si el trabajo terminó; 202 con el
+    estado si sigue en cola o corriendo; 500 si el OCR falló.
+    """
+    OCR_JOBS.start()
+    job = OCR_JOBS.status(job_id)
+    if job is None:
+        return jsonify({"error": "No existe el trabajo de OCR"}), 404
+    if job["status"] == "error":
+        return jsonify({
+            "error": "Error procesando archivo de laboratorio en Python",
+            "details": job["error"],
+            "job": job,
+        }), 500
+    if job["status"] != "done":
+        return jsonify(job), 202
+    return jsonify(OCR_JOBS.result(job_id))
+
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
@@ -69,7 +188,8 @@ def ask():
         "userName": "Nombre (opcional)",
         "history": [{"role": "user|assistant", "content": "...", "containsGreeting": bool}],
         "hasSentPersonalGreeting": bool,
-        "messageHasGreeting": bool
+        "messageHasGreeting": bool,
+        "useCache": bool (opcional, default true)
     }
     Devuelve: { "answer": "respuesta del agente" }
     """
@@ -84,6 +204,7 @@ def ask():
         history = data.get('history', [])
         has_sent_personal_greeting = data.get('hasSentPersonalGreeting', False)
         message_has_greeting = data.get('messageHasGreeting', False)
+        use_cache = _flag(data.get('useCache'))
 
         if not question or not question.strip():
             return jsonify({"error": "La pregunta no puede estar vacía"}), 400
@@ -94,10 +215,17 @@ def ask():
                               nombre_usuario=user_name,
                               historial=history,
                               ya_saludo=has_sent_personal_greeting,
-                              mensaje_tiene_saludo=message_has_greeting)
+                              mensaje_tiene_saludo=message_has_greeting,
+                              usar_cache=use_cache)
 
         return jsonify({"answer": answer, "question": question})
 
+    except IndexNotReadyError as e:
+        return jsonify({
+            "error": str(e),
+            "rebuild": REBUILDER.status(BASE_DIR),
+        }), 503
+
     except FileNotFoundError as e:
         return jsonify({
             "error":
@@ -113,18 +241,97 @@ def ask():
         }), 500
 
 
+def _sse(event, data):
+    """Formatea un evento server-sent events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route('/ask/stream', methods=['POST'])
+def ask_stream():
+    """
+    Igual que /ask (mismo cuerpo), pero responde con server-sent events
+    conforme el modelo genera la respuesta:
+        event: delta      data: {"text": "fragmento"}
+        ...
+        event: metadata   data: {"cached": bool, "sources": [...], "timings": {...}}
+    Si algo falla a mitad de la respuesta llega `event: error` y se cierra el stream.
+    Los errores antes de empezar (400, 404, 503) responden igual que /ask.
+    """
+    try:
+        data = request.get_json()
+
+        if not data or 'question' not in data:
+            return jsonify({"error": "Se requiere el campo 'question'"}), 400
+
+        question = data['question']
+        if not question or not question.strip():
+            return jsonify({"error": "La pregunta no puede estar vacía"}), 400
+
+        events = preguntar_qa_stream(question,
+                                     carpeta_base=str(BASE_DIR),
+                                     nombre_usuario=data.get('userName', None),
+                                     historial=data.get('history', []),
+                                     ya_saludo=data.get('hasSentPersonalGreeting', False),
+                                     mensaje_tiene_saludo=data.get('messageHasGreeting', False),
+                                     usar_cache=_flag(data.get('useCache')))
+        # El primer evento se pide aquí para que los errores de índice lleguen como código HTTP
+        first = next(events)
+
+    except IndexNotReadyError as e:
+        return jsonify({
+            "error": str(e),
+            "rebuild": REBUILDER.status(BASE_DIR),
+        }), 503
+
+    except FileNotFoundError as e:
+        return jsonify({
+            "error":
+            "No se encontró el índice. Por favor, agrega documentos a la carpeta 'contenidos' primero.",
+            "details": str(e)
+        }), 404
+
+    except Exception as e:
+        print(f"Error procesando pregunta: {e}")
+        return jsonify({
+            "error": "Error interno del servidor",
+            "details": str(e)
+        }), 500
+
+    @stream_with_context
+    def generate():
+        yield _sse(*first)
+        try:
+            for event in events:
+                yield _sse(*event)
+        except Exception as e:
+            print(f"Error durante el streaming: {e}")
+            yield _sse("error", {"error": "Error interno del servidor", "details": str(e)})
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # que un proxy (nginx) no acumule el stream
+    })
+
+
 @app.route('/rebuild-index', methods=['POST'])
 def rebuild_index():
     """
     Endpoint para forzar la reconstrucción del índice
     Útil cuando se agregan nuevos documentos
+
+    La reconstrucción corre en segundo plano; mientras tanto /ask sigue
+    respondiendo con el índice anterior. Si ya hay una en curso, no se lanza otra.
+    Acepta (opcional): { "full": bool } para re-embeber todo el corpus.
+    Devuelve 202 con el estado; el progreso se consulta en GET /rebuild-index/status
     """
     try:
-        from evity_qa_agent import build_index
-
-        build_index(BASE_DIR)
+        data = request.get_json(silent=True) or {}
+        started, status = REBUILDER.trigger(
+            BASE_DIR, full=_flag(data.get('full'), default=False), reason="POST /rebuild-index")
 
-        return jsonify({"message": "Índice reconstruido exitosamente"})
+        message = ("Reconstrucción del índice iniciada" if started else
+                   "Ya hay una reconstrucción en curso")
+        return jsonify({"message": message, "started": started, "status": status}), 202
 
     except Exception as e:
         print(f"Error reconstruyendo índice: {e}")
@@ -134,10 +341,17 @@ def rebuild_index():
         }), 500
 
 
+@app.route('/rebuild-index/status', methods=['GET'])
+def rebuild_index_status():
+    """Estado y progreso de la reconstrucción en curso (o de la última)"""
+    return jsonify(REBUILDER.status(BASE_DIR))
+
+
 if __name__ == '__main__':
     port = int(os.getenv('PYTHON_API_PORT', 5001))
     print(f"🚀 Iniciando API del Agente IA en puerto {port}")
     print(f"📁 Carpeta base: {BASE_DIR}")
     print(f"📂 Carpeta de contenidos: {BASE_DIR / 'contenidos'}")
+    OCR_JOBS.start()
 
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark de búsqueda vectorial: ciclo coseno por fila (implementación
+anterior de `search_similar`) vs. `VectorSearchEngine`.
+
+Uso:
+    python3 bench_retrieval.py                      # 1k, 100k y 1M filas, d=256
+    python3 bench_retrieval.py --rows 1000,100000 --dim 1536 --queries 8
+
+Nota: 1M filas con d=1536 en float32 ocupan ~6 GB; por eso el default es d=256.
+"""
+
+import argparse
+import time
+from typing import Callable, List
+
+import numpy as np
+
+from retrieval import VectorSearchEngine
+
+
+def _legacy_cosine(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-12))
+
+
+def _legacy_search_similar(query_emb: np.ndarray, index_embs: np.ndarray, k: int = 5):
+    """Implementación original: un coseno por fila en Python + argsort completo."""
+    sims = [_legacy_cosine(query_emb, emb) for emb in index_embs]
+    top_k = np.argsort(sims)[::-1][:k]
+    return top_k, [sims[i] for i in top_k]
+
+
+def _time_it(fn: Callable[[], object], repeat: int) -> float:
+    """Mejor tiempo (segundos) de `repeat` ejecuciones."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run(rows_list: List[int], dim: int, k: int, n_queries: int, legacy_max_rows: int):
+    rng = np.random.default_rng(0)
+    print(f"d={dim}  k={k}  consultas por lote={n_queries}\n")
+    header = f"{'filas':>10} {'legacy/q':>12} {'engine/q':>12} {'batch/q':>12} {'speedup':>9} {'carga':>9}"
+    print(header)
+    print("-" * len(header))
+
+    for n in rows_list:
+        embs = rng.standard_normal((n, dim), dtype=np.float32)
+        queries = rng.standard_normal((n_queries, dim), dtype=np.float32)
+
+        t0 = time.perf_counter()
+        # Normaliza en su lugar: el coseno del método legacy no cambia con la escala
+        engine = VectorSearchEngine(embs, copy=False)
+        load_s = time.perf_counter() - t0
+
+        repeat = 3 if n <= 100_000 else 1
+        engine_s = _time_it(lambda: engine.search(queries[0], k=k), repeat=repeat * 5)
+        batch_s = _time_it(lambda: engine.search_batch(queries, k=k), repeat=repeat) / n_queries
+
+        if n <= legacy_max_rows:
+            legacy_s = _time_it(lambda: _legacy_search_similar(queries[0], embs, k=k), repeat=repeat)
+            # Verificación: ambos métodos deben devolver los mismos resultados
+            legacy_idx, _ = _legacy_search_similar(queries[0], embs, k=k)
+            engine_idx, _ = engine.search(queries[0], k=k)
+            assert list(legacy_idx) == list(engine_idx), "Resultados distintos entre métodos"
+            legacy_txt = f"{legacy_s * 1e3:10.2f}ms"
+            speedup_txt = f"{legacy_s / engine_s:8.0f}x"
+        else:
+            legacy_txt = f"{'(omitido)':>12}"
+            speedup_txt = f"{'-':>9}"
+
+        print(
+            f"{n:>10,} {legacy_txt} {engine_s * 1e3:10.3f}ms {batch_s * 1e3:10.3f}ms "
+            f"{speedup_txt} {load_s * 1e3:7.1f}ms"
+        )
+        del embs, engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de búsqueda vectorial de Evity")
+    parser.add_argument("--rows", type=str, default="1000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=16, help="Consultas por lote en search_batch")
+    parser.add_argument(
+        "--legacy-max-rows",
+        type=int,
+        default=1_000_000,
+        help="No corre el método legacy por encima de este número de filas",
+    )
+    args = parser.parse_args()
+
+    rows_list = [int(r) for r in args.rows.split(",") if r.strip()]
+    run(rows_list, args.dim, args.k, args.queries, args.legacy_max_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+chunking.py
+
+Divide documentos en pasajes cortos y traslapados para indexarlos por separado.
+- Cada pasaje tiene un tope aproximado de tokens (sin depender de un tokenizer)
+- Los pasajes se traslapan para no cortar ideas a la mitad
+- Se intenta cortar al final de una oración cuando es posible
+- Cada pasaje guarda el documento de origen, sus páginas y offsets de caracteres
+"""
+
+import bisect
+import re
+from dataclasses import dataclass
+from typing import List, Sequence
+
+DEFAULT_MAX_TOKENS = 350
+DEFAULT_OVERLAP_TOKENS = 60
+
+# Separador entre páginas al reconstruir el texto completo del documento
+PAGE_SEPARATOR = "\n\n"
+
+_WORD_RE = re.compile(r"\S+")
+_SENTENCE_END_RE = re.compile(r"[.!?…:;][\"')\]]*$")
+
+
+@dataclass(frozen=True)
+class Passage:
+    """Fragmento de un documento listo para embeber."""
+
+    doc_name: str
+    text: str
+    page_start: int  # 1-based, inclusiva
+    page_end: int  # 1-based, inclusiva
+    char_start: int  # offset en el texto completo del documento
+    char_end: int
+
+
+def approx_tokens(word: str) -> int:
+    """
+    Estimación de tokens de una palabra (≈ 1 token cada 4-6 caracteres).
+    Suficiente para acotar el tamaño de los pasajes sin cargar un tokenizer.
+    """
+    return 1 + len(word) // 6
+
+
+def chunk_pages(
+    doc_name: str,
+    pages: Sequence[str],
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+) -> List[Passage]:
+    """
+    Divide las páginas de un documento en pasajes traslapados.
+    `pages` es la lista de textos por página (un TXT es un documento de una página).
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens debe ser menor que max_tokens")
+
+    # Texto completo + offset de inicio de cada página
+    page_offsets: List[int] = []
+    pos = 0
+    for i, page in enumerate(pages):
+        if i:
+            pos += len(PAGE_SEPARATOR)
+        page_offsets.append(pos)
+        pos += len(page)
+    full_text = PAGE_SEPARATOR.join(pages)
+
+    words = [(m.start(), m.end(), approx_tokens(m.group())) for m in _WORD_RE.finditer(full_text)]
+    if not words:
+        return []
+
+    def page_of(offset: int) -> int:
+        return bisect.bisect_right(page_offsets, offset)  # 1-based
+
+    passages: List[Passage] = []
+    start = 0
+    n = len(words)
+    while start < n:
+        # Avanza hasta llenar el presupuesto de tokens
+        end = start
+        budget = 0
+        while end < n and (budget + words[end][2] <= max_tokens or end == start):
+            budget += words[end][2]
+            end += 1
+
+        # Si no es el último pasaje, intenta cortar al final de una oración
+        # (sin retroceder más de un tercio del pasaje)
+        if end < n:
+            min_end = start + max(1, (end - start) * 2 // 3)
+            for j in range(end, min_end, -1):
+                w_start, w_end, _ = words[j - 1]
+                if _SENTENCE_END_RE.search(full_text[w_start:w_end]):
+                    end = j
+                    break
+
+        char_start = words[start][0]
+        char_end = words[end - 1][1]
+        passages.append(
+            Passage(
+                doc_name=doc_name,
+                text=full_text[char_start:char_end],
+                page_start=page_of(char_start),
+                page_end=page_of(char_end - 1),
+                char_start=char_start,
+                char_end=char_end,
+            )
+        )
+
+        if end >= n:
+            break
+
+        # Retrocede `overlap_tokens` para el siguiente pasaje (siempre avanzando)
+        next_start = end
+        overlap = 0
+        while next_start > start + 1 and overlap + words[next_start - 1][2] <= overlap_tokens:
+            next_start -= 1
+            overlap += words[next_start][2]
+        start = next_start
+
+    return passages
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+embedding_cache.py
+
+Caché persistente de embeddings (preguntas y pasajes).
+- La llave es el modelo + hash del texto normalizado (espacios, mayúsculas, Unicode)
+- Un LRU en memoria responde las preguntas frecuentes sin tocar disco
+- En disco se usa SQLite (seguro entre hilos y procesos) con tope de tamaño:
+  al pasarse, se eliminan primero las entradas usadas hace más tiempo
+  (ver sqlite_store.py)
+"""
+
+import hashlib
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+from sqlite_store import SqliteLRUStore
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / "cache" / "embeddings.sqlite3"
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza el texto para que variaciones triviales compartan embedding."""
+    text = unicodedata.normalize("NFC", text)
+    return _WS_RE.sub(" ", text).strip().casefold()
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache(SqliteLRUStore):
+    """LRU en memoria delante de una tabla SQLite acotada por tamaño."""
+
+    TABLE = "embeddings"
+    COLUMNS = "model TEXT NOT NULL, vec BLOB NOT NULL, nbytes INTEGER NOT NULL, last_used REAL NOT NULL"
+    LAST_USED_INDEX = "idx_last_used"
+    LABEL = "Embeddings"
+
+    def __init__(
+        self,
+        path: Path = DEFAULT_CACHE_PATH,
+        max_bytes: int = 256 * 1024 * 1024,
+        memory_items: int = 2048,
+    ):
+        super().__init__(path, max_bytes)
+        self.memory_items = memory_items
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    # -- Memoria -----------------------------------------------------------
+
+    def _remember(self, key: str, vec: np.ndarray) -> None:
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    # -- API pública -------------------------------------------------------
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Busca cada texto; devuelve el vector o None si no está en caché."""
+        keys = [cache_key(model, t) for t in texts]
+        result: List[Optional[np.ndarray]] = [None] * len(keys)
+        missing = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                vec = self._memory.get(key)
+                if vec is not None:
+                    self._memory.move_to_end(key)
+                    result[i] = vec
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if missing:
+                conn = self._db()
+                found = {
+                    key: np.frombuffer(blob, dtype=np.float32).copy()
+                    for key, blob in self._select_keys(conn, "vec", list(missing))
+                }
+                if found:
+                    now = time.time()
+                    conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key in found],
+                    )
+                    conn.commit()
+                for key, vec in found.items():
+                    self._remember(key, vec)
+                    for i in missing[key]:
+                        result[i] = vec
+
+            n_hits = sum(1 for v in result if v is not None)
+            self.hits += n_hits
+            self.misses += len(result) - n_hits
+        return result
+
+    def put_many(self, model: str, texts: Sequence[str], vecs: Sequence[np.ndarray]) -> None:
+        """Guarda vectores en memoria y en disco."""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vec in zip(texts, vecs):
+                vec = np.asarray(vec, dtype=np.float32)
+                key = cache_key(model, text)
+                self._remember(key, vec)
+                blob = vec.tobytes()
+                rows.append((key, model, blob, len(blob), now))
+            conn = self._db()
+            # Un texto que ya estaba (o repetido en el mismo lote) reemplaza su fila: solo cuenta la diferencia
+            new_sizes = {r[0]: r[3] for r in rows}
+            old_sizes = dict(self._select_keys(conn, "nbytes", list(new_sizes)))
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vec, nbytes, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._disk_bytes += sum(new_sizes.values()) - sum(old_sizes.values())
+            self._evict_if_needed(conn)
+            conn.commit()
+
+    def embed(
+        self,
+        model: str,
+        texts: Sequence[str],
+        embed_fn: Callable[[List[str]], np.ndarray],
+    ) -> np.ndarray:
+        """
+        Devuelve los embeddings de `texts`, llamando a `embed_fn` solo para
+        los que no están en caché (y sin repetir textos equivalentes).
+        """
+        cached = self.get_many(model, texts)
+        pending: "OrderedDict[str, str]" = OrderedDict()
+        for text, vec in zip(texts, cached):
+            if vec is None:
+                pending.setdefault(cache_key(model, text), text)
+
+        if pending:
+            new_texts = list(pending.values())
+            new_vecs = np.asarray(embed_fn(new_texts), dtype=np.float32)
+            self.put_many(model, new_texts, new_vecs)
+            by_key = dict(zip(pending.keys(), new_vecs))
+            cached = [
+                vec if vec is not None else by_key[cache_key(model, text)]
+                for text, vec in zip(texts, cached)
+            ]
+
+        if not cached:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack(cached).astype(np.float32, copy=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_items": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Caché compartida por todo el proceso
+EMBEDDING_CACHE = EmbeddingCache(
+    path=Path(os.getenv("EVITY_EMBED_CACHE_PATH", str(DEFAULT_CACHE_PATH))),
+    max_bytes=int(float(os.getenv("EVITY_EMBED_CACHE_MAX_MB", "256")) * 1024 * 1024),
+    memory_items=int(os.getenv("EVITY_EMBED_CACHE_MEM_ITEMS", "2048")),
+)
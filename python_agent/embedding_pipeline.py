@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+embedding_pipeline.py
+
+Envío de embeddings a la API en paralelo y con tolerancia a límites de tasa.
+- Los batches se arman por presupuesto de tokens (no por número fijo de textos)
+- Hay un máximo de solicitudes en vuelo a la vez
+- Los 429 y errores transitorios (timeouts, conexión, 5xx) se reintentan con
+  backoff exponencial con jitter, respetando `Retry-After` si viene
+- El resultado sale en el mismo orden que los textos de entrada
+
+Para probarlo sin gastar cuota, apunta el cliente a un stub local
+(ver embeddings_stub.py): `OPENAI_BASE_URL=http://127.0.0.1:5055/v1`.
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple, TypeVar
+
+import numpy as np
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
+
+from chunking import approx_tokens
+
+ProgressFn = Callable[[str, int, int], None]
+T = TypeVar("T")
+
+# Límites de la API de embeddings (con margen): tokens por texto y textos por solicitud
+MAX_INPUT_TOKENS = 8000
+MAX_BATCH_ITEMS = 2048
+
+DEFAULT_BATCH_TOKENS = int(os.getenv("EVITY_EMBED_BATCH_TOKENS", "20000"))
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("EVITY_EMBED_MAX_IN_FLIGHT", "4"))
+DEFAULT_MAX_RETRIES = int(os.getenv("EVITY_EMBED_MAX_RETRIES", "6"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación barata de tokens (la misma que usa chunking.py)."""
+    return max(1, sum(approx_tokens(w) for w in text.split()))
+
+
+def plan_batches(
+    texts: Sequence[str],
+    max_tokens: int = DEFAULT_BATCH_TOKENS,
+    max_items: int = MAX_BATCH_ITEMS,
+) -> List[Tuple[int, int]]:
+    """
+    Parte `texts` en rangos [inicio, fin) contiguos cuya suma estimada de tokens
+    no pasa de `max_tokens` (un texto más grande que el presupuesto va solo).
+    """
+    batches: List[Tuple[int, int]] = []
+    start, used = 0, 0
+    for i, text in enumerate(texts):
+        cost = min(estimate_tokens(text), MAX_INPUT_TOKENS)
+        if i > start and (used + cost > max_tokens or i - start >= max_items):
+            batches.append((start, i))
+            start, used = i, 0
+        used += cost
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)):
+        return True
+    # 408/409 también son transitorios según la API
+    return isinstance(exc, APIStatusError) and exc.status_code in (408, 409)
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    """Segundos sugeridos por el servidor (`Retry-After`), si los manda."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, exc: Exception, base_delay: float = 0.5, max_delay: float = 30.0) -> float:
+    """Backoff exponencial con jitter; si el servidor manda `Retry-After`, se respeta."""
+    delay = min(max_delay, base_delay * (2 ** attempt))
+    delay = random.uniform(delay / 2, delay)  # jitter: evita que los hilos reintenten juntos
+    hint = _retry_after(exc)
+    return min(max_delay, max(delay, hint)) if hint else delay
+
+
+def call_with_backoff(
+    fn: Callable[[], T],
+    label: str,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    base_delay: float = 0.5,
+    max_delay: float = 30.0,
+    on_retry: Optional[Callable[[Exception], None]] = None,
+) -> T:
+    """
+    Llama a `fn()` reintentando los 429 y errores transitorios. Cualquier otro
+    error, o agotar los reintentos, se propaga.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt, e, base_delay, max_delay)
+            if on_retry:
+                on_retry(e)
+            print(f"[{label}] ⚠️ {type(e).__name__}; reintento {attempt + 1}/{max_retries} en {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+@dataclass
+class PipelineStats:
+    requests: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    texts: int = 0
+
+
+class EmbeddingPipeline:
+    """
+    Manda los batches con hasta `max_in_flight` solicitudes simultáneas.
+    El cliente se usa sin reintentos propios: los reintentos los lleva este módulo.
+    """
+
+    def __init__(
+        self,
+        client: OpenAI,
+        model: str,
+        batch_tokens: int = DEFAULT_BATCH_TOKENS,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ):
+        self.client = client.with_options(max_retries=0)
+        self.model = model
+        self.batch_tokens = batch_tokens
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = PipelineStats()
+        self._lock = threading.Lock()
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self.stats, name, getattr(self.stats, name) + delta)
+
+    def _request(self, batch: List[str]) -> np.ndarray:
+        self._count(requests=1)
+        resp = self.client.embeddings.create(model=self.model, input=batch)
+        # La API devuelve `index`; ordenamos por si acaso
+        data = sorted(resp.data, key=lambda d: d.index)
+        if len(data) != len(batch):
+            raise ValueError(f"La API devolvió {len(data)} embeddings para {len(batch)} textos")
+        return np.array([d.embedding for d in data], dtype=np.float32)
+
+    def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        return call_with_backoff(
+            lambda: self._request(batch),
+            label="embed",
+            max_retries=self.max_retries,
+            base_delay=self.base_delay,
+            max_delay=self.max_delay,
+            on_retry=lambda e: self._count(retries=1, rate_limited=int(isinstance(e, RateLimitError))),
+        )
+
+    def embed(self, texts: Sequence[str], progress: Optional[ProgressFn] = None) -> np.ndarray:
+        """Embeddings de `texts` en el mismo orden. Si un batch agota sus reintentos, se propaga el error."""
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        batches = plan_batches(texts, self.batch_tokens)
+        results: List[Optional[np.ndarray]] = [None] * len(batches)
+        done_texts = 0
+        pending = list(enumerate(batches))
+        pending.reverse()  # pop() saca en orden
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embed") as pool:
+            running = {}
+            try:
+                while pending or running:
+                    while pending and len(running) < self.max_in_flight:
+                        b, (start, end) = pending.pop()
+                        running[pool.submit(self._embed_batch, texts[start:end])] = b
+                    finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        b = running.pop(fut)
+                        results[b] = fut.result()
+                        start, end = batches[b]
+                        done_texts += end - start
+                        if progress:
+                            progress("embebiendo", done_texts, len(texts))
+            except BaseException:
+                for fut in running:
+                    fut.cancel()
+                raise
+
+        self._count(texts=len(texts))
+        return np.vstack(results)
+
+
+def embed_with_pipeline(
+    client: OpenAI,
+    texts: Sequence[str],
+    model: str,
+    progress: Optional[ProgressFn] = None,
+) -> np.ndarray:
+    """Atajo con la configuración por defecto (variables EVITY_EMBED_*)."""
+    pipeline = EmbeddingPipeline(client, model)
+    vecs = pipeline.embed(texts, progress=progress)
+    s = pipeline.stats
+    if s.retries:
+        print(f"[embed] {s.requests} solicitudes, {s.retries} reintentos ({s.rate_limited} por 429)")
+    return vecs
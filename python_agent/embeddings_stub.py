@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+embeddings_stub.py
+
+Stub local del endpoint /v1/embeddings de OpenAI, para probar el pipeline de
+embeddings (concurrencia, backoff, orden) sin red ni cuota. También responde
+/v1/chat/completions con un texto fijo, para pruebas de carga del servicio.
+- Vectores deterministas: el mismo texto siempre da el mismo vector
+- Puede simular latencia, 429 con Retry-After y 500 con cierta probabilidad
+- Cuenta solicitudes en vuelo para verificar el tope de concurrencia
+
+Uso:
+    python3 embeddings_stub.py --port 5055 --latency 0.2 --rate-limit 0.2
+    OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:5055/v1 \\
+        python3 evity_qa_agent.py --carpeta . --build --full
+"""
+
+import argparse
+import hashlib
+import random
+import threading
+import time
+
+import numpy as np
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+
+CONFIG = {"dim": 1536, "latency": 0.0, "rate_limit": 0.0, "server_error": 0.0}
+STATS = {"requests": 0, "inputs": 0, "rate_limited": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+_lock = threading.Lock()
+
+
+def fake_embedding(text: str, dim: int) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vec / np.linalg.norm(vec)).tolist()
+
+
+def _error(status: int, message: str, kind: str, headers=None):
+    resp = jsonify({"error": {"message": message, "type": kind, "code": None}})
+    resp.status_code = status
+    for k, v in (headers or {}).items():
+        resp.headers[k] = v
+    return resp
+
+
+@app.route("/v1/embeddings", methods=["POST"])
+def embeddings():
+    with _lock:
+        STATS["requests"] += 1
+        STATS["in_flight"] += 1
+        STATS["max_in_flight"] = max(STATS["max_in_flight"], STATS["in_flight"])
+    try:
+        time.sleep(CONFIG["latency"])
+        roll = random.random()
+        if roll < CONFIG["rate_limit"]:
+            with _lock:
+                STATS["rate_limited"] += 1
+            return _error(429, "Rate limit reached (stub)", "requests", {"retry-after-ms": "200"})
+        if roll < CONFIG["rate_limit"] + CONFIG["server_error"]:
+            with _lock:
+                STATS["errors"] += 1
+            return _error(500, "Internal error (stub)", "server_error")
+
+        data = request.get_json(force=True) or {}
+        inputs = data.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        with _lock:
+            STATS["inputs"] += len(inputs)
+        return jsonify(
+            {
+                "object": "list",
+                "model": data.get("model", "stub"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": fake_embedding(t, CONFIG["dim"])}
+                    for i, t in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            }
+        )
+    finally:
+        with _lock:
+            STATS["in_flight"] -= 1
+
+
+@app.route("/v1/chat/completions", methods=["POST"])
+def chat_completions():
+    """Respuesta fija (sin streaming) con la misma latencia simulada, para pruebas de carga."""
+    with _lock:
+        STATS["requests"] += 1
+        STATS["in_flight"] += 1
+        STATS["max_in_flight"] = max(STATS["max_in_flight"], STATS["in_flight"])
+    try:
+        time.sleep(CONFIG["latency"])
+        data = request.get_json(force=True) or {}
+        return jsonify(
+            {
+                "id": "stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": data.get("model", "stub"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": "Respuesta de prueba (stub)."},
+                    }
+                ],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+        )
+    finally:
+        with _lock:
+            STATS["in_flight"] -= 1
+
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    with _lock:
+        return jsonify(dict(STATS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub local del endpoint de embeddings")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--latency", type=float, default=0.0, help="Segundos por solicitud")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Probabilidad de responder 429")
+    parser.add_argument("--server-error", type=float, default=0.0, help="Probabilidad de responder 500")
+    args = parser.parse_args()
+    CONFIG.update(
+        dim=args.dim, latency=args.latency, rate_limit=args.rate_limit, server_error=args.server_error
+    )
+    app.run(host="127.0.0.1", port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,82 +4,81 @@
 """
 Evity QA Agent – versión bilingüe (ES/EN) con reconstrucción automática del índice.
 - Lee .txt y .pdf de ./contenidos
-- Detecta idioma y traduce al español si hace falta (para uniformar la búsqueda)
-- Genera embeddings y guarda un índice local
+- Divide cada documento en pasajes cortos y traslapados (con página de origen)
+- Genera embeddings por pasaje y guarda un índice local
 - Si agregas/actualizas archivos, se reconstruye automáticamente al preguntar
 - Responde con un tono empático y comprensible para pacientes
 - Personalización: usa nombre de la persona usuaria, responde saludos y agradecimientos
 """
 
 import argparse
+import asyncio
+import hashlib
+import json
+import logging
 import os
 import re
+import threading
 import time
+from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
-from openai import OpenAI
-from pypdf import PdfReader
+from openai import AsyncOpenAI, OpenAI
 from tqdm import tqdm
 
+from answer_cache import ANSWER_CACHE
+from chunking import Passage, chunk_pages
+from embedding_cache import EMBEDDING_CACHE
+from embedding_pipeline import embed_with_pipeline
+from extraction import clean_text, extract_documents
+from index_manifest import (
+    diff_manifest,
+    load_manifest,
+    save_manifest,
+    scan_content_files,
+    stat_changed,
+)
+from index_rebuilder import IndexRebuilder
+from index_store import DiskIndex, build_lock, index_exists, open_index, read_all_rows, write_index
+from openai_client import get_async_openai_client, get_openai_client
+from retrieval import VectorSearchEngine
+from translation import needs_translation, translate_passages
+
+log = logging.getLogger(__name__)
+
 # ---------------------------------------------------------------------------
-# Utilidades de lectura
+# Utilidades de lectura (la extracción vive en extraction.py)
 # ---------------------------------------------------------------------------
 
 
-def _read_txt(p: Path) -> str:
-    return p.read_text(encoding="utf-8", errors="ignore")
-
-
-def _read_pdf(p: Path) -> str:
-    """Extrae texto de un PDF usando pypdf."""
-    text_parts = []
-    try:
-        reader = PdfReader(str(p))
-        for page in reader.pages:
-            txt = page.extract_text() or ""
-            if txt:
-                text_parts.append(txt)
-    except Exception as e:
-        print(f"[pdf] ⚠️ No pude leer {p.name}: {e}")
-    text = "\n".join(text_parts)
-    text = re.sub(r"[ \t]+", " ", text)
-    text = re.sub(r"\n{3,}", "\n\n", text).strip()
-    return text
-
-
-def collect_documents(contenidos_dir: Path) -> List[Tuple[str, str]]:
-    """Lee .txt y .pdf dentro de la carpeta `contenidos/` y devuelve [(nombre, texto)]."""
-    docs: List[Tuple[str, str]] = []
+def collect_document_pages(contenidos_dir: Path) -> List[Tuple[str, List[str]]]:
+    """
+    Lee .txt y .pdf dentro de la carpeta `contenidos/` y devuelve [(nombre, [texto por página])].
+    """
+    docs: List[Tuple[str, List[str]]] = []
     if not contenidos_dir.exists():
         print(f"[warn] No existe carpeta: {contenidos_dir}")
         return docs
 
-    # .txt
-    for p in sorted(contenidos_dir.glob("*.txt")):
-        try:
-            txt = _read_txt(p)
-            if txt.strip():
-                docs.append((p.name, txt))
-        except Exception as e:
-            print(f"[txt] ⚠️ Error leyendo {p.name}: {e}")
-
-    # .pdf
-    for p in sorted(contenidos_dir.glob("*.pdf")):
-        try:
-            txt = _read_pdf(p)
-            if txt.strip():
-                docs.append((p.name, txt))
-            else:
-                print(f"[pdf] ⚠️ PDF vacío o sin texto: {p.name}")
-        except Exception as e:
-            print(f"[pdf] ⚠️ Error leyendo {p.name}: {e}")
+    files = scan_content_files(contenidos_dir)
+    for name, pages in zip(files, extract_documents(list(files.values()))):
+        if pages:
+            docs.append((name, pages))
 
     print(f"[info] Documentos cargados desde {contenidos_dir}: {len(docs)}")
     return docs
 
 
+def collect_documents(contenidos_dir: Path) -> List[Tuple[str, str]]:
+    """Lee .txt y .pdf dentro de la carpeta `contenidos/` y devuelve [(nombre, texto)]."""
+    return [
+        (name, clean_text("\n".join(t for t in pages if t)))
+        for name, pages in collect_document_pages(contenidos_dir)
+    ]
+
+
 # ---------------------------------------------------------------------------
 # Embeddings y helpers
 # ---------------------------------------------------------------------------
@@ -87,45 +86,76 @@ def collect_documents(contenidos_dir: Path) -> List[Tuple[str, str]]:
 
 def detect_and_translate(client: OpenAI, text: str) -> str:
     """
-    Detecta idioma y traduce al español si el texto está en inglés (usa un fragmento).
+    Traduce al español un texto completo si está en inglés (detección local).
+    Se trocea sin traslape y se traduce pasaje por pasaje (ver translation.py).
     Si ya está en español, devuelve el texto sin cambios.
     """
-    try:
-        frag = text[:3000]  # suficiente para decidir idioma y traducir gist
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "Detecta el idioma del mensaje del usuario. "
-                        "Si está en inglés, tradúcelo al español conservando el significado. "
-                        "Si ya está en español, regrésalo igual. "
-                        "Devuelve solo el texto resultante, sin comentarios."
-                    ),
-                },
-                {"role": "user", "content": frag},
-            ],
-            temperature=0.0,
-        )
-        return resp.choices[0].message.content.strip() or text
-    except Exception as e:
-        print(f"[trans] ⚠️ Error traduciendo: {e}")
+    if not needs_translation(text):
         return text
+    parts = [ps.text for ps in chunk_pages("", [text], overlap_tokens=0)]
+    return "\n".join(translate_passages(client, parts))
+
+
+# Traducir al español los pasajes en inglés antes de embeberlos (EVITY_TRANSLATE=0 lo desactiva)
+TRANSLATE_PASSAGES = os.getenv("EVITY_TRANSLATE", "1") != "0"
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+
+def _embed_batches_openai(
+    client: OpenAI,
+    texts: List[str],
+    model: str = EMBEDDING_MODEL,
+    progress: Optional[Callable[[str, int, int], None]] = None,
+    show_progress: bool = False,
+) -> np.ndarray:
+    """
+    Crea embeddings con OpenAI (sin caché): batches por presupuesto de tokens,
+    varias solicitudes en paralelo y reintentos con backoff (ver embedding_pipeline.py).
+    La barra de tqdm solo se muestra con `show_progress` (construcción del índice),
+    no en cada pregunta.
+    """
+    if not show_progress:
+        return embed_with_pipeline(client, texts, model, progress=progress)
+    with tqdm(total=len(texts), desc="Creando embeddings") as bar:
+
+        def report(stage: str, done: int, total: int) -> None:
+            bar.update(done - bar.n)
+            if progress:
+                progress(stage, done, total)
+
+        return embed_with_pipeline(client, texts, model, progress=report)
 
 
 def embed_texts_openai(
-    client: OpenAI, texts: List[str], model: str = "text-embedding-3-small"
+    client: OpenAI,
+    texts: List[str],
+    model: str = EMBEDDING_MODEL,
+    progress: Optional[Callable[[str, int, int], None]] = None,
+    show_progress: bool = False,
 ) -> np.ndarray:
-    """Crea embeddings con OpenAI en batches."""
-    batch_size = 50
-    all_vecs: List[List[float]] = []
-    for i in tqdm(range(0, len(texts), batch_size), desc="Creando embeddings"):
-        batch = texts[i : i + batch_size]
-        resp = client.embeddings.create(model=model, input=batch)
-        vecs = [d.embedding for d in resp.data]
-        all_vecs.extend(vecs)
-    return np.array(all_vecs, dtype=np.float32)
+    """
+    Crea embeddings con OpenAI en batches, reutilizando la caché persistente:
+    solo se mandan a la API los textos que no se habían embebido antes.
+    """
+    return EMBEDDING_CACHE.embed(
+        model, texts, lambda missing: _embed_batches_openai(client, missing, model, progress, show_progress)
+    )
+
+
+def embed_query(client: OpenAI, text: str, model: str = EMBEDDING_MODEL) -> np.ndarray:
+    """
+    Embedding de una pregunta; las preguntas repetidas salen de la caché.
+    Una sola llamada directa (sin el pipeline de batches ni su pool de hilos):
+    los reintentos son los del cliente, `get_openai_client("query")`.
+    """
+    cached = EMBEDDING_CACHE.get_many(model, [text])[0]
+    if cached is not None:
+        return cached
+    resp = client.embeddings.create(model=model, input=[text])
+    vec = np.array(resp.data[0].embedding, dtype=np.float32)
+    EMBEDDING_CACHE.put_many(model, [text], [vec])
+    return vec
 
 
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
@@ -133,9 +163,12 @@ def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
 
 
 def search_similar(query_emb: np.ndarray, index_embs: np.ndarray, k: int = 5):
-    sims = [cosine_similarity(query_emb, emb) for emb in index_embs]
-    top_k = np.argsort(sims)[::-1][:k]
-    return top_k, [sims[i] for i in top_k]
+    """
+    Búsqueda puntual (normaliza la matriz en cada llamada).
+    Para el índice en memoria usa `IndexSnapshot.engine`, que ya viene normalizado.
+    """
+    top_k, sims = VectorSearchEngine(index_embs).search(query_emb, k=k)
+    return top_k, sims.tolist()
 
 
 # ---------------------------------------------------------------------------
@@ -143,40 +176,170 @@ def search_similar(query_emb: np.ndarray, index_embs: np.ndarray, k: int = 5):
 # ---------------------------------------------------------------------------
 
 
-def build_index(base: Path):
+def build_index(
+    base: Path,
+    full: bool = False,
+    progress: Optional[Callable[[str, int, int], None]] = None,
+):
+    """
+    Construye el índice con un candado entre procesos: si otro proceso (otro
+    worker del servidor) ya está construyendo, se espera a que termine y luego
+    solo se procesa lo que haya quedado pendiente.
+    """
+    with build_lock(base / "vector_index"):
+        _build_index_locked(base, full=full, progress=progress)
+
+
+def _build_index_locked(
+    base: Path,
+    full: bool = False,
+    progress: Optional[Callable[[str, int, int], None]] = None,
+):
+    """
+    Reconstruye el índice de forma incremental usando el manifiesto:
+    solo se extraen, trocean y embeben los archivos nuevos o modificados,
+    y se eliminan las filas de los archivos borrados.
+    Con `full=True` (o si no hay manifiesto) se reconstruye todo.
+    `progress(etapa, hechos, total)` se llama conforme avanza.
+    """
+    if progress is None:
+        progress = lambda stage, done, total: None  # noqa: E731
+
     contenidos_dir = base / "contenidos"
     out_dir = base / "vector_index"
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    docs = collect_documents(contenidos_dir)
-    if not docs:
+    files = scan_content_files(contenidos_dir)
+    if not files:
         print("[warn] No hay documentos para indexar.")
         return
 
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", ""))
+    manifest = None if full else load_manifest(out_dir)
+    old_rows = read_all_rows(out_dir) if manifest is not None else None
+    if old_rows is None:
+        manifest = None
+    diff = diff_manifest(files, manifest)
 
-    names: List[str] = []
-    texts: List[str] = []
+    if manifest is not None and not diff.has_changes:
+        # Solo cambiaron mtimes: actualizamos el manifiesto sin tocar el índice
+        save_manifest(out_dir, diff.entries)
+        print("[info] Sin cambios de contenido; el índice sigue vigente.")
+        return
 
-    print("\n🧠 Detectando idioma y traduciendo si es necesario...\n")
-    for name, text in tqdm(docs):
-        translated = detect_and_translate(client, text)
-        texts.append(translated)
-        names.append(name)
+    print(
+        f"[info] Archivos: {len(diff.changed)} nuevos/modificados, "
+        f"{len(diff.unchanged)} sin cambios, {len(diff.removed)} eliminados"
+    )
+
+    # Solo los archivos nuevos o modificados se leen, se trocean y se traducen.
+    # La extracción corre en procesos en paralelo (ver extraction.py).
+    progress("extrayendo", 0, len(diff.changed))
+    extracted = extract_documents(
+        [files[name] for name in diff.changed],
+        on_done=lambda done, total: progress("extrayendo", done, total),
+    )
+    new_passages: Dict[str, List[Passage]] = {}
+    failed: List[str] = []
+    for name, pages in zip(diff.changed, extracted):
+        if pages is None:
+            failed.append(name)
+            continue
+        passages = chunk_pages(name, pages)
+        new_passages[name] = passages
+        diff.entries[name].passages = len(passages)
+    if failed:
+        # Un archivo que no se pudo extraer conserva sus filas anteriores (si las había) y
+        # queda marcado como fallido en el manifiesto: la siguiente reconstrucción lo reintenta
+        log.warning("[index] No se pudo extraer %s; se reintentará en la siguiente reconstrucción",
+                    ", ".join(failed))
+        for name in failed:
+            prev = (manifest or {}).get(name)
+            diff.entries[name].passages = prev.passages if prev is not None else 0
+            diff.entries[name].failed = True
+
+    new_texts = [ps.text for passages in new_passages.values() for ps in passages]
+    if new_texts:
+        if TRANSLATE_PASSAGES:
+            # Pasaje por pasaje: solo los que están en inglés, con caché por contenido.
+            # Los offsets siguen apuntando al texto original del documento.
+            new_texts = translate_passages(get_openai_client("translation"), new_texts, progress=progress)
+            pos = 0
+            for name in new_passages:
+                passages = new_passages[name]
+                new_passages[name] = [
+                    replace(ps, text=t) for ps, t in zip(passages, new_texts[pos : pos + len(passages)])
+                ]
+                pos += len(passages)
+        new_embs = embed_texts_openai(
+            get_openai_client("embeddings"), new_texts, progress=progress, show_progress=True
+        )
+    else:
+        new_embs = None
 
-    embs = embed_texts_openai(client, texts)
+    # Ensamblamos el índice en el orden de contenidos/ reutilizando las filas intactas
+    old_by_doc: Dict[str, List[int]] = {}
+    if old_rows is not None:
+        for i, name in enumerate(old_rows["names"]):
+            old_by_doc.setdefault(name, []).append(i)
+
+    names: List[str] = []
+    texts: List[str] = []
+    page_rows: List[Tuple[int, int]] = []
+    offset_rows: List[Tuple[int, int]] = []
+    emb_parts: List[np.ndarray] = []
+    new_pos = 0
+    for name in files:
+        if name in new_passages:
+            passages = new_passages[name]
+            names.extend(ps.doc_name for ps in passages)
+            texts.extend(ps.text for ps in passages)
+            page_rows.extend((ps.page_start, ps.page_end) for ps in passages)
+            offset_rows.extend((ps.char_start, ps.char_end) for ps in passages)
+            if passages:
+                emb_parts.append(new_embs[new_pos : new_pos + len(passages)])
+            new_pos += len(passages)
+        elif name in old_by_doc:
+            # Sin cambios, o falló su extracción: se reutilizan sus filas
+            rows = old_by_doc[name]
+            names.extend(old_rows["names"][i] for i in rows)
+            texts.extend(old_rows["texts"][i] for i in rows)
+            page_rows.extend(map(tuple, old_rows["pages"][rows]))
+            offset_rows.extend(map(tuple, old_rows["offsets"][rows]))
+            emb_parts.append(old_rows["embeddings"][rows])
+
+    if not names:
+        print("[warn] Ningún documento tiene texto indexable.")
+        return
 
-    # Guardamos todo lo necesario para reconstruir el contexto sin leer otra vez
-    np.savez(
-        out_dir / "index_evity.npz",
-        names=np.array(names, dtype=object),
-        texts=np.array(texts, dtype=object),
-        embeddings=embs,
+    progress("guardando", len(names), len(names))
+    embs = np.concatenate(emb_parts).astype(np.float32, copy=False)
+    pages_arr = np.array(page_rows, dtype=np.int32).reshape(-1, 2)
+    offsets_arr = np.array(offset_rows, dtype=np.int64).reshape(-1, 2)
+
+    # Guardamos todo lo necesario para reconstruir el contexto sin leer otra vez.
+    # Cada versión va en su propia carpeta y se activa reemplazando CURRENT de golpe,
+    # así nadie lee un índice a medio escribir.
+    version = str(time.time())
+    write_index(
+        out_dir,
+        names,
+        texts,
+        embs,
+        pages_arr,
+        offsets_arr,
+        version,
+        dtype=os.getenv("EVITY_INDEX_DTYPE", "float32"),
     )
+    save_manifest(out_dir, diff.entries)
+
+    # timestamp para invalidación rápida (también funciona como versión del índice)
+    (out_dir / "index_ts").write_text(version, encoding="utf-8")
+    n_docs = sum(1 for e in diff.entries.values() if e.passages)
+    print(f"[ok] Guardado índice con {len(texts)} pasajes de {n_docs} documentos en {out_dir}")
 
-    # timestamp para invalidación rápida
-    (out_dir / "index_ts").write_text(str(time.time()), encoding="utf-8")
-    print(f"[ok] Guardado índice con {len(texts)} documentos en {out_dir}")
+    # Publicamos la nueva versión en memoria: las preguntas en curso siguen
+    # usando la anterior hasta terminar.
+    INDEX_HOLDER.publish(base, IndexSnapshot.from_disk(open_index(out_dir)))
 
 
 def latest_content_mtime(contenidos_dir: Path) -> float:
@@ -193,35 +356,55 @@ def latest_content_mtime(contenidos_dir: Path) -> float:
 
 def index_mtime(out_dir: Path) -> float:
     """Lee el mtime guardado del índice (o 0 si no existe)."""
-    npz = out_dir / "index_evity.npz"
     tsfile = out_dir / "index_ts"
-    if npz.exists() and tsfile.exists():
+    if index_exists(out_dir) and tsfile.exists():
         try:
             return float(tsfile.read_text(encoding="utf-8").strip())
         except Exception:
-            return npz.stat().st_mtime
+            return tsfile.stat().st_mtime
     return 0.0
 
 
-def ensure_index_fresh(base: Path):
-    """Reconstruye el índice automáticamente si hay cambios en contenidos/."""
+def index_needs_rebuild(base: Path) -> bool:
+    """
+    ¿Hay cambios en contenidos/ que el índice no refleja?
+    (archivos nuevos, modificados o eliminados según el manifiesto).
+    """
     contenidos_dir = base / "contenidos"
     out_dir = base / "vector_index"
-    latest_mt = latest_content_mtime(contenidos_dir)
-    idx_mt = index_mtime(out_dir)
+    files = scan_content_files(contenidos_dir)
 
-    if latest_mt == 0.0:
-        return
+    if not files:
+        return False
+
+    manifest = load_manifest(out_dir)
+    if not index_exists(out_dir):
+        return True
+    if manifest is not None:
+        return stat_changed(files, manifest)
+    # Índice anterior al manifiesto: solo podemos comparar mtimes
+    return latest_content_mtime(contenidos_dir) > index_mtime(out_dir)
 
-    need_build = False
-    if not (out_dir / "index_evity.npz").exists():
-        need_build = True
-    elif latest_mt > idx_mt:
-        need_build = True
 
-    if need_build:
-        print("\n🔄 Cambios detectados en 'contenidos/'. Reconstruyendo índice...")
-        build_index(base)
+# Reconstrucciones en segundo plano (una a la vez por carpeta base)
+REBUILDER = IndexRebuilder(build_index)
+
+
+def ensure_index_fresh(base: Path, wait: bool = False):
+    """
+    Si hay cambios en contenidos/, lanza la reconstrucción del índice en segundo
+    plano (mientras tanto se sigue usando el índice anterior).
+    Con `wait=True` espera a que termine (útil para la CLI).
+    """
+    if not REBUILDER.is_running(base) and index_needs_rebuild(base):
+        print("\n🔄 Cambios detectados en 'contenidos/'. Reconstruyendo índice en segundo plano...")
+        REBUILDER.trigger(base, reason="cambios en contenidos/")
+    if wait:
+        REBUILDER.wait(base)
+
+
+class IndexNotReadyError(RuntimeError):
+    """El índice todavía no existe y se está construyendo por primera vez."""
 
 
 # ---------------------------------------------------------------------------
@@ -229,15 +412,185 @@ def ensure_index_fresh(base: Path):
 # ---------------------------------------------------------------------------
 
 
-def load_index(base: Path):
-    path = base / "vector_index" / "index_evity.npz"
-    if not path.exists():
-        raise FileNotFoundError(f"No se encontró el índice: {path}")
-    npz = np.load(path, allow_pickle=True)
-    names = list(npz["names"])
-    texts = list(npz["texts"])
-    embs = np.array(npz["embeddings"], dtype=np.float32)
-    return names, texts, embs
+def load_index(base: Path) -> DiskIndex:
+    """
+    Abre el índice en disco (memmap, sin pickle). Un index_evity.npz antiguo
+    se convierte al formato nuevo la primera vez.
+    """
+    return open_index(base / "vector_index")
+
+
+def index_version(out_dir: Path) -> str:
+    """Versión del índice en disco (contenido de `index_ts`, o "" si no existe)."""
+    try:
+        return (out_dir / "index_ts").read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return ""
+
+
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """
+    Versión inmutable del índice abierta en el proceso.
+    Cada fila es un pasaje: `names[i]` es su documento de origen y
+    `pages[i]` su rango de páginas (1-based; 0 si se desconoce).
+    Los textos se leen del disco solo para los pasajes recuperados.
+    """
+
+    names: Sequence[str]
+    texts: Sequence[str]
+    embeddings: np.ndarray
+    pages: np.ndarray
+    version: str
+    engine: VectorSearchEngine
+
+    @classmethod
+    def from_disk(cls, disk: DiskIndex, version: Optional[str] = None) -> "IndexSnapshot":
+        """Snapshot sobre un índice en disco; la matriz ya viene normalizada."""
+        return cls(
+            names=disk.names,
+            texts=disk.texts,
+            embeddings=disk.embeddings,
+            pages=disk.pages,
+            version=version if version is not None else disk.version,
+            engine=VectorSearchEngine(disk.embeddings, normalized=True),
+        )
+
+
+class IndexHolder:
+    """
+    Mantiene el índice cargado en memoria para todo el proceso.
+
+    - La primera pregunta abre el índice en disco (memmap); las siguientes lo reutilizan.
+    - La revisión de cambios en `contenidos/` se hace como máximo cada
+      `check_interval` segundos, no en cada pregunta.
+    - Cuando termina una reconstrucción, la nueva versión se publica reemplazando
+      la referencia completa: quien ya tenía un snapshot lo sigue usando intacto.
+    """
+
+    def __init__(self, check_interval: float = 10.0):
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._snapshots: Dict[Path, IndexSnapshot] = {}
+        self._last_check: Dict[Path, float] = {}
+
+    def get(self, base: Path, wait: bool = False) -> IndexSnapshot:
+        """
+        Devuelve el snapshot vigente, revisando frescura solo si ya toca.
+        Si hay cambios, la reconstrucción corre en segundo plano y mientras tanto
+        se sirve la versión anterior. Con `wait=True` se espera a la nueva versión.
+        """
+        base = base.resolve()
+        snap = self._snapshots.get(base)
+        if snap is not None and not self._check_due(base):
+            return snap
+
+        # Fuera del lock: la reconstrucción publica su resultado con `publish`
+        ensure_index_fresh(base, wait=wait)
+
+        with self._lock:
+            # Otro hilo pudo haber hecho la revisión mientras esperábamos el lock
+            snap = self._snapshots.get(base)
+            if snap is not None and not self._check_due(base):
+                return snap
+
+            out_dir = base / "vector_index"
+            version = index_version(out_dir)
+            if snap is None or snap.version != version:
+                if not index_exists(out_dir) and REBUILDER.is_running(base):
+                    raise IndexNotReadyError(
+                        "El índice se está construyendo por primera vez; intenta de nuevo en unos momentos."
+                    )
+                snap = IndexSnapshot.from_disk(load_index(base), version=version)
+                self._snapshots[base] = snap
+            self._last_check[base] = time.monotonic()
+            return snap
+
+    def preload(self, base: Path) -> Optional[IndexSnapshot]:
+        """
+        Abre el índice que ya está en disco sin revisar frescura ni lanzar
+        reconstrucciones (para calentar el proceso antes de recibir tráfico,
+        p. ej. en el maestro de gunicorn antes de hacer fork). La primera
+        pregunta sí revisa cambios. Devuelve None si todavía no hay índice.
+        """
+        base = base.resolve()
+        out_dir = base / "vector_index"
+        if not index_exists(out_dir):
+            return None
+        snap = IndexSnapshot.from_disk(load_index(base), version=index_version(out_dir))
+        # Recorre la matriz una vez para dejarla en la caché de páginas del sistema
+        float(np.sum(snap.embeddings, dtype=np.float64))
+        with self._lock:
+            self._snapshots[base] = snap
+            self._last_check.pop(base, None)
+        return snap
+
+    def publish(self, base: Path, snapshot: IndexSnapshot) -> None:
+        """
+        Reemplaza atómicamente la versión en memoria (tras una reconstrucción).
+        Las respuestas en caché se basaban en el índice anterior: se descartan.
+        """
+        base = base.resolve()
+        with self._lock:
+            self._snapshots[base] = snapshot
+            self._last_check[base] = time.monotonic()
+        ANSWER_CACHE.clear()
+
+    def invalidate(self, base: Optional[Path] = None) -> None:
+        """Olvida el índice en memoria; se recargará en la siguiente pregunta."""
+        with self._lock:
+            if base is None:
+                self._snapshots.clear()
+                self._last_check.clear()
+            else:
+                self._snapshots.pop(base.resolve(), None)
+                self._last_check.pop(base.resolve(), None)
+
+    def _check_due(self, base: Path) -> bool:
+        last = self._last_check.get(base, 0.0)
+        return time.monotonic() - last >= self.check_interval
+
+
+# Índice compartido por todo el proceso (API Flask, CLI, integraciones)
+INDEX_HOLDER = IndexHolder(
+    check_interval=float(os.getenv("EVITY_INDEX_CHECK_INTERVAL", "10"))
+)
+
+
+# Tope del contexto que se manda al modelo (unos pocos KB de pasajes relevantes)
+MAX_CONTEXT_PASSAGES = 5
+MAX_CONTEXT_CHARS = 8000
+
+
+def source_label(index: IndexSnapshot, i: int) -> str:
+    """Etiqueta legible de la fuente de un pasaje: 'documento.pdf, pág. 3-4'."""
+    start, end = (int(x) for x in index.pages[i])
+    if start <= 0:
+        return index.names[i]
+    pags = f"pág. {start}" if start == end else f"págs. {start}-{end}"
+    return f"{index.names[i]}, {pags}"
+
+
+def source_info(index: IndexSnapshot, i: int, score: Optional[float] = None) -> dict:
+    """Fuente de un pasaje como diccionario (para la metadata de las respuestas)."""
+    start, end = (int(x) for x in index.pages[i])
+    info = {"document": index.names[i], "page_start": start, "page_end": end}
+    if score is not None:
+        info["score"] = round(float(score), 4)
+    return info
+
+
+def build_context(index: IndexSnapshot, top_k: np.ndarray) -> str:
+    """Arma el contexto con los pasajes recuperados, citando su fuente."""
+    parts: List[str] = []
+    total = 0
+    for i in list(top_k)[:MAX_CONTEXT_PASSAGES]:
+        part = f"[Fuente: {source_label(index, i)}]\n{index.texts[i]}"
+        if parts and total + len(part) > MAX_CONTEXT_CHARS:
+            break
+        parts.append(part)
+        total += len(part)
+    return "\n\n".join(parts)
 
 
 # ---------------------------------------------------------------------------
@@ -245,19 +598,70 @@ def load_index(base: Path):
 # ---------------------------------------------------------------------------
 
 
-def _empathetic_completion(
-    client: OpenAI,
+# Mensajes previos de la conversación que van en el prompt
+HISTORY_TURNS = 6
+
+
+def _history_fingerprint(historial: Optional[list]) -> Optional[str]:
+    """Huella de los últimos HISTORY_TURNS mensajes (los que ve el modelo); None sin historial."""
+    turns = [
+        (msg.get("role"), msg.get("content")) if isinstance(msg, dict) else msg
+        for msg in (historial or [])[-HISTORY_TURNS:]
+    ]
+    if not turns:
+        return None
+    return hashlib.sha256(json.dumps(turns, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+# Números sueltos de la pregunta ("90", "1.5", "7,2"); no los que son parte de
+# un nombre como HbA1c o B12
+_NUMBER_RE = re.compile(r"(?<![^\W\d])\d+(?:[.,]\d+)?")
+
+
+def _question_numbers(pregunta: str) -> Tuple[str, ...]:
+    """Los números de la pregunta, en orden y con punto decimal."""
+    return tuple(n.replace(",", ".") for n in _NUMBER_RE.findall(pregunta or ""))
+
+
+def answer_cache_scope(
+    index_version: str,
+    nombre_usuario: Optional[str],
+    ya_saludo: bool,
+    mensaje_tiene_saludo: bool,
+    historial: Optional[list] = None,
+    pregunta: str = "",
+) -> tuple:
+    """
+    Alcance de la caché de respuestas: solo se reutiliza una respuesta entre
+    preguntas con la misma versión del índice, las mismas banderas de saludo,
+    los mismos mensajes previos (una pregunta de seguimiento como "¿y en
+    niños?" depende de la conversación) y los mismos números: "glucosa de 90"
+    y "glucosa de 190" tienen embeddings casi iguales pero no la misma
+    respuesta. El nombre solo cuenta cuando la respuesta va a saludar usándolo.
+    """
+    debe_saludar = bool(mensaje_tiene_saludo and not ya_saludo and nombre_usuario)
+    return (
+        index_version,
+        bool(ya_saludo),
+        bool(mensaje_tiene_saludo),
+        nombre_usuario if debe_saludar else None,
+        _history_fingerprint(historial),
+        _question_numbers(pregunta),
+    )
+
+
+def _empathetic_messages(
     contexto: str,
     pregunta: str,
     nombre_usuario: Optional[str] = None,
     historial: Optional[list] = None,
     ya_saludo: bool = False,
     mensaje_tiene_saludo: bool = False,
-) -> str:
+) -> List[dict]:
     """
-    Genera la respuesta con tono empático, usando el contexto y cuidando
-    que Evity responda saludos, agradecimientos y use el nombre de la persona
-    cuando esté disponible. Respuestas más bien cortas.
+    Mensajes para generar la respuesta con tono empático, usando el contexto y
+    cuidando que Evity responda saludos, agradecimientos y use el nombre de la
+    persona cuando esté disponible. Respuestas más bien cortas.
     """
     if historial is None:
         historial = []
@@ -293,63 +697,81 @@ def _empathetic_completion(
     historial_text = ""
     if historial:
         historial_text = "\n\nHistorial de la conversación:\n"
-        for msg in historial[-6:]:  # Solo últimos 6 mensajes
+        for msg in historial[-HISTORY_TURNS:]:  # Solo los últimos mensajes
             rol = "Usuario" if msg.get("role") == "user" else "Evity"
             historial_text += f"{rol}: {msg.get('content', '')}\n"
 
+    return [
+        {
+            "role": "system",
+            "content": (
+                "Te llamas Evity. Eres un asistente de salud y longevidad especializado. "
+                "Tu propósito es ayudar a las personas a resolver sus dudas específicas sobre salud, "
+                "longevidad, nutrición, ejercicio y bienestar de forma clara y práctica. "
+                "Explicas temas médicos con palabras sencillas, sin jerga técnica, "
+                "y ofreces orientación útil, específica y tranquilizadora.\n\n"
+                "Brevedad:\n"
+                "- Responde en un máximo de 2–3 párrafos cortos o 5–7 oraciones en total.\n"
+                "- Si el mensaje es solo un saludo o un agradecimiento, responde con 1–2 frases breves.\n\n"
+                "Interacción y tono:\n"
+                "- Para preguntas médicas SIN saludo, NO digas 'hola' ni saludes. En su lugar, usa "
+                "transiciones amables como: 'Perfecto, te explico...', '¡Excelente pregunta!', "
+                "'¡Qué interesante!', 'Claro, hablemos de esto...', o simplemente responde directamente.\n"
+                "- Si detectas agradecimientos (ej: 'gracias', 'muchas gracias'), respóndelos de manera "
+                "cálida y breve, agradeciendo la confianza.\n"
+                "- Usa un tono cercano pero profesional, como si hablaras con alguien "
+                "a quien quieres ayudar genuinamente.\n\n"
+                "Estructura general cuando hay una duda de salud (manteniendo brevedad):\n"
+                "1) Explicación sencilla y clara del concepto o problema.\n"
+                "2) 2–4 consejos o pasos prácticos específicos que la persona puede aplicar.\n"
+                "3) Información adicional relevante o matices importantes.\n\n"
+                "IMPORTANTE: Tu objetivo es ayudar a resolver dudas específicas directamente. "
+                "NO termines tus respuestas diciendo 'consulta a un médico' o 'esto no sustituye una consulta médica', "
+                "a menos que la situación sea una emergencia médica real (ej: dolor de pecho intenso, sangrado severo). "
+                "Tu propósito es ser útil y resolver las inquietudes de salud de las personas con información práctica y accionable."
+            ),
+        },
+        {
+            "role": "system",
+            "content": nombre_info,
+        },
+        {
+            "role": "user",
+            "content": (
+                "Usa el siguiente contexto de documentos para responder a la pregunta "
+                "de forma breve, amable y comprensible.\n\n"
+                f"Contexto:\n{contexto}\n"
+                f"{historial_text}\n"
+                f"Pregunta actual de la persona usuaria: {pregunta}\n\n"
+                "Responde de acuerdo a las instrucciones anteriores sobre saludos y tono."
+            ),
+        },
+    ]
+
+
+def _empathetic_completion(client: OpenAI, contexto: str, pregunta: str, **kwargs) -> str:
+    """Genera la respuesta completa (ver `_empathetic_messages` para los parámetros)."""
     resp = client.chat.completions.create(
         model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "Te llamas Evity. Eres un asistente de salud y longevidad especializado. "
-                    "Tu propósito es ayudar a las personas a resolver sus dudas específicas sobre salud, "
-                    "longevidad, nutrición, ejercicio y bienestar de forma clara y práctica. "
-                    "Explicas temas médicos con palabras sencillas, sin jerga técnica, "
-                    "y ofreces orientación útil, específica y tranquilizadora.\n\n"
-                    "Brevedad:\n"
-                    "- Responde en un máximo de 2–3 párrafos cortos o 5–7 oraciones en total.\n"
-                    "- Si el mensaje es solo un saludo o un agradecimiento, responde con 1–2 frases breves.\n\n"
-                    "Interacción y tono:\n"
-                    "- Para preguntas médicas SIN saludo, NO digas 'hola' ni saludes. En su lugar, usa "
-                    "transiciones amables como: 'Perfecto, te explico...', '¡Excelente pregunta!', "
-                    "'¡Qué interesante!', 'Claro, hablemos de esto...', o simplemente responde directamente.\n"
-                    "- Si detectas agradecimientos (ej: 'gracias', 'muchas gracias'), respóndelos de manera "
-                    "cálida y breve, agradeciendo la confianza.\n"
-                    "- Usa un tono cercano pero profesional, como si hablaras con alguien "
-                    "a quien quieres ayudar genuinamente.\n\n"
-                    "Estructura general cuando hay una duda de salud (manteniendo brevedad):\n"
-                    "1) Explicación sencilla y clara del concepto o problema.\n"
-                    "2) 2–4 consejos o pasos prácticos específicos que la persona puede aplicar.\n"
-                    "3) Información adicional relevante o matices importantes.\n\n"
-                    "IMPORTANTE: Tu objetivo es ayudar a resolver dudas específicas directamente. "
-                    "NO termines tus respuestas diciendo 'consulta a un médico' o 'esto no sustituye una consulta médica', "
-                    "a menos que la situación sea una emergencia médica real (ej: dolor de pecho intenso, sangrado severo). "
-                    "Tu propósito es ser útil y resolver las inquietudes de salud de las personas con información práctica y accionable."
-                ),
-            },
-            {
-                "role": "system",
-                "content": nombre_info,
-            },
-            {
-                "role": "user",
-                "content": (
-                    "Usa el siguiente contexto de documentos para responder a la pregunta "
-                    "de forma breve, amable y comprensible.\n\n"
-                    f"Contexto:\n{contexto}\n"
-                    f"{historial_text}\n"
-                    f"Pregunta actual de la persona usuaria: {pregunta}\n\n"
-                    "Responde de acuerdo a las instrucciones anteriores sobre saludos y tono."
-                ),
-            },
-        ],
+        messages=_empathetic_messages(contexto, pregunta, **kwargs),
         temperature=0.4,
     )
     return resp.choices[0].message.content.strip()
 
 
+def _empathetic_completion_stream(client: OpenAI, contexto: str, pregunta: str, **kwargs) -> Iterator[str]:
+    """Igual que `_empathetic_completion`, pero va entregando los fragmentos de texto conforme llegan."""
+    stream = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=_empathetic_messages(contexto, pregunta, **kwargs),
+        temperature=0.4,
+        stream=True,
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
 def answer_question(
     base: Path,
     pregunta: str,
@@ -357,25 +779,18 @@ def answer_question(
     nombre_usuario: Optional[str] = None,
 ):
     """CLI: imprime respuesta en consola con tono empático y algo de personalización."""
-    ensure_index_fresh(base)
-
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", ""))
-    names, texts, embs = load_index(base)
+    client = get_openai_client("chat")
+    index = INDEX_HOLDER.get(base, wait=True)
 
-    query_emb = (
-        client.embeddings.create(model="text-embedding-3-small", input=pregunta)
-        .data[0]
-        .embedding
-    )
-    query_emb = np.array(query_emb, dtype=np.float32)
+    query_emb = embed_query(get_openai_client("query"), pregunta)
 
-    top_k, sims = search_similar(query_emb, embs, k=k)
+    top_k, sims = index.engine.search(query_emb, k=k)
 
     print("\n📚 Contexto relevante encontrado:\n")
     for idx, score in zip(top_k, sims):
-        print(f"→ ({score:.3f}) {names[idx]}")
+        print(f"→ ({score:.3f}) {source_label(index, idx)}")
 
-    contexto = "\n\n".join([texts[i] for i in top_k][:3]) if top_k.size > 0 else ""
+    contexto = build_context(index, top_k)
 
     respuesta = _empathetic_completion(
         client,
@@ -404,9 +819,14 @@ def main():
     parser.add_argument(
         "--build", action="store_true", help="Reconstruye el índice de embeddings"
     )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Con --build, re-embebe todo el corpus en lugar de solo lo que cambió",
+    )
     parser.add_argument("--ask", type=str, help="Pregunta en lenguaje natural")
     parser.add_argument(
-        "--k", type=int, default=5, help="Número de documentos relevantes a recuperar"
+        "--k", type=int, default=5, help="Número de pasajes relevantes a recuperar"
     )
     # El nombre de usuario para uso desde CLI (opcional)
     parser.add_argument(
@@ -419,7 +839,7 @@ def main():
     base = Path(args.carpeta).resolve()
 
     if args.build:
-        build_index(base)
+        build_index(base, full=args.full)
 
     if args.ask:
         answer_question(base, args.ask, k=args.k, nombre_usuario=args.nombre)
@@ -434,6 +854,65 @@ if __name__ == "__main__":
 # ---------------------------------------------------------------------------
 
 
+@dataclass
+class _PreparedAnswer:
+    """Lo que se necesita para generar (o reutilizar) una respuesta."""
+
+    client: Union[OpenAI, AsyncOpenAI]
+    query_emb: np.ndarray
+    scope: tuple
+    cached: Optional[Tuple[str, float]]
+    top_k: np.ndarray
+    sims: np.ndarray
+    index: Optional[IndexSnapshot]
+    contexto: str
+    timings: Dict[str, float]
+
+
+def _ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def _search_context(index: IndexSnapshot, query_emb: np.ndarray) -> Tuple[np.ndarray, np.ndarray, str]:
+    """Pasajes más parecidos a la pregunta y el contexto armado con ellos."""
+    top_k, sims = index.engine.search(query_emb, k=5)
+    return top_k, sims, build_context(index, top_k)
+
+
+def _prepare_answer(
+    pregunta: str,
+    base: Path,
+    nombre_usuario: Optional[str],
+    ya_saludo: bool,
+    mensaje_tiene_saludo: bool,
+    usar_cache: bool,
+    historial: Optional[list] = None,
+) -> _PreparedAnswer:
+    """Embedding de la pregunta, caché de respuestas y recuperación del contexto."""
+    timings: Dict[str, float] = {}
+    # Cliente compartido por el proceso: reutiliza conexiones abiertas con la API
+    client = get_openai_client("chat")
+    # Índice en memoria: la revisión de cambios en contenidos/ está acotada en el tiempo
+    index = INDEX_HOLDER.get(base)
+
+    t = time.perf_counter()
+    query_emb = embed_query(get_openai_client("query"), pregunta)
+    timings["embed_ms"] = _ms(t)
+
+    scope = answer_cache_scope(
+        index.version, nombre_usuario, ya_saludo, mensaje_tiene_saludo, historial, pregunta
+    )
+    cached = ANSWER_CACHE.lookup(query_emb, scope) if usar_cache else None
+    if cached is not None:
+        empty = np.empty(0, dtype=np.int64)
+        return _PreparedAnswer(client, query_emb, scope, cached, empty, empty, None, "", timings)
+
+    t = time.perf_counter()
+    top_k, sims, contexto = _search_context(index, query_emb)
+    timings["search_ms"] = _ms(t)
+    return _PreparedAnswer(client, query_emb, scope, None, top_k, sims, index, contexto, timings)
+
+
 def preguntar_qa(
     pregunta: str,
     carpeta_base: str = ".",
@@ -441,9 +920,11 @@ def preguntar_qa(
     historial: Optional[list] = None,
     ya_saludo: bool = False,
     mensaje_tiene_saludo: bool = False,
+    usar_cache: bool = True,
 ) -> str:
     """
-    Devuelve una respuesta en tono empático usando el índice local (si hay cambios, se reconstruye).
+    Devuelve una respuesta en tono empático usando el índice local en memoria
+    (si hay cambios en contenidos/, se reconstruye y se publica la nueva versión).
     Puede personalizar el trato usando el nombre del usuario si se proporciona.
 
     Parámetros:
@@ -453,31 +934,227 @@ def preguntar_qa(
     - historial: (opcional) lista de mensajes previos en la conversación.
     - ya_saludo: (opcional) si ya se envió un saludo personalizado en esta conversación.
     - mensaje_tiene_saludo: (opcional) si el mensaje actual contiene un saludo.
+    - usar_cache: (opcional) si se puede reutilizar la respuesta de una pregunta
+      casi idéntica con los mismos mensajes previos (caché semántica).
     """
     if historial is None:
         historial = []
     base = Path(carpeta_base).resolve()
-    ensure_index_fresh(base)
 
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", ""))
-    names, texts, embs = load_index(base)
+    prep = _prepare_answer(pregunta, base, nombre_usuario, ya_saludo, mensaje_tiene_saludo, usar_cache, historial)
+    if prep.cached is not None:
+        return prep.cached[0]
 
-    query_emb = (
-        client.embeddings.create(model="text-embedding-3-small", input=pregunta)
-        .data[0]
-        .embedding
+    respuesta = _empathetic_completion(
+        prep.client,
+        prep.contexto,
+        pregunta,
+        nombre_usuario=nombre_usuario,
+        historial=historial,
+        ya_saludo=ya_saludo,
+        mensaje_tiene_saludo=mensaje_tiene_saludo,
     )
-    query_emb = np.array(query_emb, dtype=np.float32)
+    if usar_cache:
+        ANSWER_CACHE.store(prep.query_emb, prep.scope, respuesta)
+    return respuesta
 
-    top_k, _ = search_similar(query_emb, embs, k=5)
-    contexto = "\n\n".join([texts[i] for i in top_k][:3]) if top_k.size > 0 else ""
 
-    return _empathetic_completion(
-        client,
-        contexto,
+def preguntar_qa_stream(
+    pregunta: str,
+    carpeta_base: str = ".",
+    nombre_usuario: Optional[str] = None,
+    historial: Optional[list] = None,
+    ya_saludo: bool = False,
+    mensaje_tiene_saludo: bool = False,
+    usar_cache: bool = True,
+) -> Iterator[Tuple[str, dict]]:
+    """
+    Versión en streaming de `preguntar_qa` (mismos parámetros). Genera eventos
+    (nombre, datos):
+    - ("delta", {"text": ...}) por cada fragmento de la respuesta
+    - ("metadata", {...}) al final: fuentes recuperadas, tiempos y si vino de caché
+
+    Los errores previos a la respuesta (índice no listo, índice inexistente) se
+    lanzan al pedir el primer evento, igual que en `preguntar_qa`.
+    """
+    if historial is None:
+        historial = []
+    base = Path(carpeta_base).resolve()
+    start = time.perf_counter()
+
+    prep = _prepare_answer(pregunta, base, nombre_usuario, ya_saludo, mensaje_tiene_saludo, usar_cache, historial)
+    timings = prep.timings
+
+    if prep.cached is not None:
+        timings["first_token_ms"] = _ms(start)
+        yield "delta", {"text": prep.cached[0]}
+        timings["total_ms"] = _ms(start)
+        yield "metadata", {"cached": True, "similarity": round(prep.cached[1], 4), "sources": [], "timings": timings}
+        return
+
+    parts: List[str] = []
+    for delta in _empathetic_completion_stream(
+        prep.client,
+        prep.contexto,
         pregunta,
         nombre_usuario=nombre_usuario,
         historial=historial,
         ya_saludo=ya_saludo,
         mensaje_tiene_saludo=mensaje_tiene_saludo,
+    ):
+        if not parts:
+            timings["first_token_ms"] = _ms(start)
+        parts.append(delta)
+        yield "delta", {"text": delta}
+    timings["total_ms"] = _ms(start)
+
+    respuesta = "".join(parts).strip()
+    if usar_cache and respuesta:
+        ANSWER_CACHE.store(prep.query_emb, prep.scope, respuesta)
+
+    sources = [source_info(prep.index, i, score) for i, score in zip(prep.top_k, prep.sims)]
+    yield "metadata", {"cached": False, "sources": sources, "timings": timings}
+
+
+# ---------------------------------------------------------------------------
+# Versión asíncrona (para el servicio asyncio, ver api_async.py)
+# ---------------------------------------------------------------------------
+
+
+async def embed_query_async(client: AsyncOpenAI, text: str, model: str = EMBEDDING_MODEL) -> np.ndarray:
+    """Igual que `embed_query`; la caché (SQLite) se consulta en un hilo."""
+    cached = (await asyncio.to_thread(EMBEDDING_CACHE.get_many, model, [text]))[0]
+    if cached is not None:
+        return cached
+    resp = await client.embeddings.create(model=model, input=[text])
+    vec = np.array(resp.data[0].embedding, dtype=np.float32)
+    await asyncio.to_thread(EMBEDDING_CACHE.put_many, model, [text], [vec])
+    return vec
+
+
+async def _prepare_answer_async(
+    pregunta: str,
+    base: Path,
+    nombre_usuario: Optional[str],
+    ya_saludo: bool,
+    mensaje_tiene_saludo: bool,
+    usar_cache: bool,
+    historial: Optional[list] = None,
+) -> _PreparedAnswer:
+    """Como `_prepare_answer`: el disco y numpy corren en hilos, la red en el event loop."""
+    timings: Dict[str, float] = {}
+    client = get_async_openai_client("chat")
+    index = await asyncio.to_thread(INDEX_HOLDER.get, base)
+
+    t = time.perf_counter()
+    query_emb = await embed_query_async(get_async_openai_client("query"), pregunta)
+    timings["embed_ms"] = _ms(t)
+
+    scope = answer_cache_scope(
+        index.version, nombre_usuario, ya_saludo, mensaje_tiene_saludo, historial, pregunta
+    )
+    cached = ANSWER_CACHE.lookup(query_emb, scope) if usar_cache else None
+    if cached is not None:
+        empty = np.empty(0, dtype=np.int64)
+        return _PreparedAnswer(client, query_emb, scope, cached, empty, empty, None, "", timings)
+
+    t = time.perf_counter()
+    top_k, sims, contexto = await asyncio.to_thread(_search_context, index, query_emb)
+    timings["search_ms"] = _ms(t)
+    return _PreparedAnswer(client, query_emb, scope, None, top_k, sims, index, contexto, timings)
+
+
+async def preguntar_qa_async(
+    pregunta: str,
+    carpeta_base: str = ".",
+    nombre_usuario: Optional[str] = None,
+    historial: Optional[list] = None,
+    ya_saludo: bool = False,
+    mensaje_tiene_saludo: bool = False,
+    usar_cache: bool = True,
+) -> str:
+    """Versión asíncrona de `preguntar_qa` (mismos parámetros y resultado)."""
+    if historial is None:
+        historial = []
+    base = Path(carpeta_base).resolve()
+
+    prep = await _prepare_answer_async(
+        pregunta, base, nombre_usuario, ya_saludo, mensaje_tiene_saludo, usar_cache, historial
+    )
+    if prep.cached is not None:
+        return prep.cached[0]
+
+    resp = await prep.client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=_empathetic_messages(
+            prep.contexto,
+            pregunta,
+            nombre_usuario=nombre_usuario,
+            historial=historial,
+            ya_saludo=ya_saludo,
+            mensaje_tiene_saludo=mensaje_tiene_saludo,
+        ),
+        temperature=0.4,
+    )
+    respuesta = resp.choices[0].message.content.strip()
+    if usar_cache:
+        ANSWER_CACHE.store(prep.query_emb, prep.scope, respuesta)
+    return respuesta
+
+
+async def preguntar_qa_stream_async(
+    pregunta: str,
+    carpeta_base: str = ".",
+    nombre_usuario: Optional[str] = None,
+    historial: Optional[list] = None,
+    ya_saludo: bool = False,
+    mensaje_tiene_saludo: bool = False,
+    usar_cache: bool = True,
+) -> AsyncIterator[Tuple[str, dict]]:
+    """Versión asíncrona de `preguntar_qa_stream` (mismos eventos)."""
+    if historial is None:
+        historial = []
+    base = Path(carpeta_base).resolve()
+    start = time.perf_counter()
+
+    prep = await _prepare_answer_async(
+        pregunta, base, nombre_usuario, ya_saludo, mensaje_tiene_saludo, usar_cache, historial
+    )
+    timings = prep.timings
+
+    if prep.cached is not None:
+        timings["first_token_ms"] = _ms(start)
+        yield "delta", {"text": prep.cached[0]}
+        timings["total_ms"] = _ms(start)
+        yield "metadata", {"cached": True, "similarity": round(prep.cached[1], 4), "sources": [], "timings": timings}
+        return
+
+    stream = await prep.client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=_empathetic_messages(
+            prep.contexto,
+            pregunta,
+            nombre_usuario=nombre_usuario,
+            historial=historial,
+            ya_saludo=ya_saludo,
+            mensaje_tiene_saludo=mensaje_tiene_saludo,
+        ),
+        temperature=0.4,
+        stream=True,
     )
+    parts: List[str] = []
+    async for chunk in stream:
+        if not (chunk.choices and chunk.choices[0].delta.content):
+            continue
+        if not parts:
+            timings["first_token_ms"] = _ms(start)
+        parts.append(chunk.choices[0].delta.content)
+        yield "delta", {"text": parts[-1]}
+    timings["total_ms"] = _ms(start)
+
+    respuesta = "".join(parts).strip()
+    if usar_cache and respuesta:
+        ANSWER_CACHE.store(prep.query_emb, prep.scope, respuesta)
+
+    sources = [source_info(prep.index, i, score) for i, score in zip(prep.top_k, prep.sims)]
+    yield "metadata", {"cached": False, "sources": sources, "timings": timings}
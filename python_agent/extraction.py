@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+extraction.py
+
+Extracción de texto de los documentos de `contenidos/` (.txt y .pdf).
+- Cada archivo se procesa en su propio proceso hijo, hasta N en paralelo
+- Un PDF que tarda demasiado se cancela (timeout por archivo) y uno que
+  tumba al proceso (p. ej. un PDF corrupto) solo afecta a ese archivo
+- El resultado siempre sale en el mismo orden que la lista de entrada
+
+Este módulo es ligero a propósito: el forkserver lo precarga (junto con
+pypdf) para que cada hijo nazca ya con el lector importado. Ojo: con
+forkserver/spawn cada hijo vuelve a importar el `__main__` del padre (como
+`__mp_main__`), así que los puntos de entrada que usan este módulo
+(evity_qa_agent.py, api_server.py, api_async.py) deben dejar su
+arranque bajo `if __name__ == "__main__":`.
+"""
+
+import logging
+import multiprocessing as mp
+import os
+import re
+import time
+from collections import deque
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from pypdf import PdfReader
+
+DEFAULT_WORKERS = int(os.getenv("EVITY_EXTRACT_WORKERS", "0")) or (os.cpu_count() or 1)
+DEFAULT_TIMEOUT = float(os.getenv("EVITY_EXTRACT_TIMEOUT", "120"))
+
+log = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Utilidades de lectura
+# ---------------------------------------------------------------------------
+
+
+def read_txt(p: Path) -> str:
+    return p.read_text(encoding="utf-8", errors="ignore")
+
+
+def clean_text(text: str) -> str:
+    text = re.sub(r"[ \t]+", " ", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def read_pdf_pages(p: Path) -> List[str]:
+    """
+    Extrae el texto de cada página de un PDF usando pypdf (una entrada por página).
+    Lanza la excepción de pypdf si el archivo no se puede leer.
+    """
+    reader = PdfReader(str(p))
+    return [clean_text(page.extract_text() or "") for page in reader.pages]
+
+
+def read_pdf(p: Path) -> str:
+    """Extrae texto de un PDF usando pypdf ('' si no se pudo leer)."""
+    try:
+        pages = read_pdf_pages(p)
+    except Exception as e:
+        print(f"[pdf] ⚠️ No pude leer {p.name}: {e}")
+        return ""
+    return clean_text("\n".join(t for t in pages if t))
+
+
+def read_document_pages(p: Path) -> Optional[List[str]]:
+    """
+    Texto por página de un .txt o .pdf (un .txt es un documento de una sola página).
+    Devuelve lista vacía si el archivo no tiene texto, y None si no se pudo leer:
+    quien indexa necesita distinguirlos para volver a intentar solo los que fallaron.
+    """
+    kind = "pdf" if p.suffix.lower() == ".pdf" else "txt"
+    try:
+        pages = read_pdf_pages(p) if kind == "pdf" else [read_txt(p)]
+    except Exception as e:
+        log.warning("[%s] No pude leer %s: %s", kind, p.name, e)
+        return None
+    if not any(t.strip() for t in pages):
+        if kind == "pdf":
+            print(f"[pdf] ⚠️ PDF vacío o sin texto: {p.name}")
+        return []
+    return pages
+
+
+# ---------------------------------------------------------------------------
+# Extracción en paralelo
+# ---------------------------------------------------------------------------
+
+
+def _extract_worker(path: str, conn) -> None:
+    """Proceso hijo: extrae un archivo y manda el resultado por el pipe."""
+    try:
+        conn.send(read_document_pages(Path(path)))
+    finally:
+        conn.close()
+
+
+def _mp_context():
+    # forkserver evita hacer fork de un proceso con hilos (el servidor Flask);
+    # si no existe en la plataforma, spawn.
+    # Con forkserver se precarga solo este módulo: los hijos no repiten el
+    # import de pypdf (el `__main__` del padre sí se reimporta en cada hijo).
+    if "forkserver" in mp.get_all_start_methods():
+        ctx = mp.get_context("forkserver")
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+    return mp.get_context("spawn")
+
+
+def extract_documents(
+    paths: Sequence[Path],
+    workers: int = DEFAULT_WORKERS,
+    timeout: float = DEFAULT_TIMEOUT,
+    on_done: Optional[Callable[[int, int], None]] = None,
+) -> List[Optional[List[str]]]:
+    """
+    Extrae el texto por página de cada archivo de `paths`, en paralelo.
+    Devuelve una lista alineada con `paths`: lista vacía si el archivo no tiene
+    texto, y None si falló (no se pudo leer, excedió `timeout` segundos o tumbó
+    a su proceso). `on_done(hechos, total)` se llama cada vez que termina un archivo.
+    """
+    n = len(paths)
+    results: List[Optional[List[str]]] = [None] * n
+    if n == 0:
+        return results
+
+    if workers <= 1 or n == 1:
+        for i, p in enumerate(paths):
+            results[i] = read_document_pages(p)
+            if on_done:
+                on_done(i + 1, n)
+        return results
+
+    ctx = _mp_context()
+    pending = deque(enumerate(paths))
+    running: Dict[object, Tuple[int, mp.Process, float]] = {}
+    done = 0
+
+    def finish(conn, i: int, proc, pages: Optional[List[str]]) -> None:
+        nonlocal done
+        running.pop(conn, None)
+        conn.close()
+        proc.join()
+        results[i] = pages
+        done += 1
+        if on_done:
+            on_done(done, n)
+
+    while pending or running:
+        while pending and len(running) < workers:
+            i, p = pending.popleft()
+            recv_conn, send_conn = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=_extract_worker, args=(str(p), send_conn), daemon=True)
+            proc.start()
+            send_conn.close()  # el padre solo lee
+            running[recv_conn] = (i, proc, time.monotonic())
+
+        now = time.monotonic()
+        next_deadline = min(started + timeout for _, _, started in running.values())
+        for conn in wait(list(running), timeout=max(0.0, next_deadline - now)):
+            i, proc, _ = running[conn]
+            try:
+                pages = conn.recv()
+            except (EOFError, OSError):
+                # El proceso murió sin responder (PDF corrupto, falta de memoria, ...)
+                log.warning("[extract] El proceso que leía %s terminó inesperadamente", paths[i].name)
+                pages = None
+            finish(conn, i, proc, pages)
+
+        now = time.monotonic()
+        for conn, (i, proc, started) in list(running.items()):
+            if now - started > timeout:
+                log.warning("[extract] %s excedió %gs; se omite", paths[i].name, timeout)
+                proc.terminate()
+                finish(conn, i, proc, None)
+
+    return results
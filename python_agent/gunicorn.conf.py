@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+gunicorn.conf.py
+
+Configuración de producción del API del agente (ver wsgi.py).
+- Varios procesos (workers) con varios hilos cada uno: una llamada de OCR
+  larga ocupa un hilo, no el servidor completo, y /ask sigue respondiendo
+- `preload_app`: el índice y las tablas se calientan una vez antes del fork
+- Apagado ordenado: al recibir SIGTERM los workers terminan las solicitudes
+  en curso (hasta `graceful_timeout` segundos) antes de salir
+
+Todo se puede ajustar con variables de entorno (ver README.md).
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PYTHON_API_PORT', '5001')}"
+
+worker_class = "gthread"
+workers = int(os.getenv("EVITY_WEB_WORKERS", str(min(4, multiprocessing.cpu_count() * 2 + 1))))
+threads = int(os.getenv("EVITY_WEB_THREADS", "8"))
+
+# Segundos que un worker puede quedarse sin responder antes de reiniciarlo.
+# Con gthread el hilo principal sigue vivo mientras un hilo espera a OpenAI,
+# así que el tope real de cada llamada lo ponen los timeouts de openai_client.py.
+timeout = int(os.getenv("EVITY_REQUEST_TIMEOUT", "300"))
+graceful_timeout = int(os.getenv("EVITY_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("EVITY_HTTP_KEEPALIVE", "5"))
+
+# Reciclar workers de vez en cuando evita que crezca la memoria (PDFs, imágenes)
+max_requests = int(os.getenv("EVITY_MAX_REQUESTS", "1000"))
+max_requests_jitter = max_requests // 10
+
+preload_app = True
+accesslog = "-"
+errorlog = "-"
+
+
+def when_ready(server):
+    server.log.info(f"Agente Evity listo: {workers} workers x {threads} hilos en {bind}")
+
+
+def post_worker_init(worker):
+    # Los hilos de la cola de OCR se arrancan en cada worker (no sobreviven al fork del maestro)
+    from ocr_jobs import OCR_JOBS
+
+    OCR_JOBS.start()
+
+
+def worker_exit(server, worker):
+    # Devuelve a la cola los trabajos de OCR a medias y cierra el pool de conexiones con OpenAI
+    from ocr_jobs import OCR_JOBS
+    from openai_client import reset_openai_clients
+
+    OCR_JOBS.stop()
+    reset_openai_clients()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+index_manifest.py
+
+Manifiesto del índice: qué archivo de `contenidos/` produjo qué filas.
+- Guarda hash de contenido (sha256), tamaño y mtime por archivo
+- Permite reconstrucciones incrementales: solo se re-extraen y re-embeben
+  los archivos nuevos o modificados, y se eliminan las filas de los borrados
+- Tamaño + mtime sirven como atajo: el hash solo se calcula si alguno cambió
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_FORMAT = 1
+
+CONTENT_PATTERNS = ("*.txt", "*.pdf")
+
+
+@dataclass
+class FileEntry:
+    """Estado de un archivo de `contenidos/` en el momento de indexarlo."""
+
+    sha256: str
+    size: int
+    mtime: float
+    passages: int = 0
+    # La extracción falló: `passages` son las filas anteriores que se conservaron
+    # (0 si no había) y la siguiente reconstrucción lo vuelve a intentar
+    failed: bool = False
+
+
+@dataclass
+class ManifestDiff:
+    """Resultado de comparar `contenidos/` contra el manifiesto."""
+
+    unchanged: List[str]
+    changed: List[str]  # nuevos o con contenido distinto
+    removed: List[str]
+    entries: Dict[str, FileEntry]  # estado actual de todos los archivos presentes
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.changed or self.removed)
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def scan_content_files(contenidos_dir: Path) -> Dict[str, Path]:
+    """Archivos indexables de `contenidos/` en orden determinista: .txt y luego .pdf."""
+    files: Dict[str, Path] = {}
+    if not contenidos_dir.exists():
+        return files
+    for pattern in CONTENT_PATTERNS:
+        for p in sorted(contenidos_dir.glob(pattern)):
+            files[p.name] = p
+    return files
+
+
+def load_manifest(out_dir: Path) -> Optional[Dict[str, FileEntry]]:
+    """Lee el manifiesto (o None si no existe o tiene otro formato)."""
+    path = out_dir / MANIFEST_FILENAME
+    try:
+        raw = json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if raw.get("format") != MANIFEST_FORMAT:
+        return None
+    return {name: FileEntry(**entry) for name, entry in raw.get("files", {}).items()}
+
+
+def save_manifest(out_dir: Path, entries: Dict[str, FileEntry]) -> None:
+    """Escribe el manifiesto de forma atómica."""
+    path = out_dir / MANIFEST_FILENAME
+    tmp = out_dir / (MANIFEST_FILENAME + ".tmp")
+    payload = {
+        "format": MANIFEST_FORMAT,
+        "files": {name: asdict(entry) for name, entry in entries.items()},
+    }
+    tmp.write_text(json.dumps(payload, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def stat_changed(files: Dict[str, Path], manifest: Dict[str, FileEntry]) -> bool:
+    """
+    Revisión barata (solo stat): ¿hay archivos nuevos, borrados o con
+    tamaño/mtime distinto al manifiesto? No lee contenido. Un archivo que falló
+    y no ha cambiado no cuenta: se reintenta en la siguiente reconstrucción,
+    sin lanzar una solo por él en cada pregunta.
+    """
+    if set(files) != set(manifest):
+        return True
+    for name, path in files.items():
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return True
+        entry = manifest[name]
+        if st.st_size != entry.size or st.st_mtime != entry.mtime:
+            return True
+    return False
+
+
+def diff_manifest(
+    files: Dict[str, Path], manifest: Optional[Dict[str, FileEntry]]
+) -> ManifestDiff:
+    """
+    Clasifica los archivos en sin cambios / nuevos o modificados / borrados.
+    Solo se calcula el hash de los archivos cuyo tamaño o mtime cambió. Los que
+    fallaron al extraerse la vez anterior cuentan como modificados.
+    """
+    manifest = manifest or {}
+    unchanged: List[str] = []
+    changed: List[str] = []
+    entries: Dict[str, FileEntry] = {}
+
+    for name, path in files.items():
+        st = path.stat()
+        prev = manifest.get(name)
+        if prev is not None and prev.failed:
+            prev = None  # se reintenta aunque no haya cambiado
+        if prev is not None and st.st_size == prev.size and st.st_mtime == prev.mtime:
+            unchanged.append(name)
+            entries[name] = prev
+            continue
+
+        digest = file_sha256(path)
+        if prev is not None and digest == prev.sha256:
+            # Solo cambió el mtime (p. ej. se copió o se tocó el archivo)
+            unchanged.append(name)
+            entries[name] = FileEntry(digest, st.st_size, st.st_mtime, prev.passages)
+        else:
+            changed.append(name)
+            entries[name] = FileEntry(digest, st.st_size, st.st_mtime)
+
+    removed = [name for name in manifest if name not in files]
+    return ManifestDiff(unchanged=unchanged, changed=changed, removed=removed, entries=entries)
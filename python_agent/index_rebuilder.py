@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+index_rebuilder.py
+
+Reconstrucción del índice en segundo plano.
+- Las preguntas se siguen respondiendo con el índice anterior mientras se construye el nuevo
+- Varias solicitudes simultáneas se combinan en una sola reconstrucción
+- Expone el progreso y el estado de la última reconstrucción
+"""
+
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Firma esperada: build_fn(base, full=..., progress=...)
+# progress(stage, done, total) se llama conforme avanza la construcción.
+ProgressFn = Callable[[str, int, int], None]
+BuildFn = Callable[..., None]
+
+
+class IndexRebuilder:
+    """Ejecuta `build_fn` en un hilo de fondo, uno a la vez por carpeta base."""
+
+    def __init__(self, build_fn: BuildFn):
+        self._build_fn = build_fn
+        self._lock = threading.Lock()
+        self._threads: Dict[Path, threading.Thread] = {}
+        self._status: Dict[Path, Dict[str, Any]] = {}
+
+    def trigger(self, base: Path, full: bool = False, reason: str = "") -> Tuple[bool, Dict[str, Any]]:
+        """
+        Pide una reconstrucción. Si ya hay una en curso para esa carpeta,
+        no se lanza otra: se devuelve (False, estado de la que está corriendo).
+        """
+        base = base.resolve()
+        with self._lock:
+            thread = self._threads.get(base)
+            if thread is not None and thread.is_alive():
+                status = self._status[base]
+                status["coalesced"] += 1
+                return False, dict(status)
+
+            prev = self._status.get(base, {})
+            status = {
+                "state": "running",
+                "stage": "iniciando",
+                "done": 0,
+                "total": 0,
+                "full": full,
+                "reason": reason,
+                "started_at": time.time(),
+                "finished_at": None,
+                "duration_s": None,
+                "error": None,
+                "coalesced": 0,
+                "builds": prev.get("builds", 0) + 1,
+            }
+            self._status[base] = status
+            thread = threading.Thread(
+                target=self._run,
+                args=(base, full, status),
+                name=f"index-rebuild-{base.name}",
+                daemon=True,
+            )
+            self._threads[base] = thread
+            thread.start()
+            return True, dict(status)
+
+    def _run(self, base: Path, full: bool, status: Dict[str, Any]) -> None:
+        def progress(stage: str, done: int, total: int) -> None:
+            with self._lock:
+                status.update(stage=stage, done=done, total=total)
+
+        state, error = "done", None
+        try:
+            self._build_fn(base, full=full, progress=progress)
+        except Exception as e:
+            print(f"[index] ⚠️ Error reconstruyendo índice: {e}")
+            state, error = "error", str(e)
+        finally:
+            with self._lock:
+                finished = time.time()
+                status.update(
+                    state=state,
+                    error=error,
+                    finished_at=finished,
+                    duration_s=round(finished - status["started_at"], 3),
+                )
+
+    def status(self, base: Path) -> Dict[str, Any]:
+        """Estado de la reconstrucción en curso o de la última que terminó."""
+        with self._lock:
+            return dict(self._status.get(base.resolve(), {"state": "idle", "builds": 0}))
+
+    def is_running(self, base: Path) -> bool:
+        thread = self._threads.get(base.resolve())
+        return thread is not None and thread.is_alive()
+
+    def wait(self, base: Path, timeout: Optional[float] = None) -> bool:
+        """Espera a que termine la reconstrucción en curso. True si ya no hay ninguna."""
+        thread = self._threads.get(base.resolve())
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+index_store.py
+
+Formato en disco del índice (v2), sin pickle y abierto con memmap.
+
+    vector_index/
+    ├── CURRENT                  # nombre de la carpeta vigente (se reemplaza de golpe)
+    └── index-v2-<versión>/
+        ├── meta.json            # formato, versión, filas, dimensión, dtype
+        ├── embeddings.f32|.f16  # matriz (n, d) ya normalizada, bytes crudos
+        ├── rows.i64             # (n, 5): doc_id, pág. inicio, pág. fin, char inicio, char fin
+        ├── texts.bin            # texto de todos los pasajes en UTF-8, concatenado
+        ├── texts.idx            # (n + 1) offsets int64 dentro de texts.bin
+        └── docs.json            # nombres de documento (doc_id -> nombre)
+
+Abrir el índice cuesta lo mismo sin importar su tamaño: solo se leen meta.json
+y docs.json; embeddings y offsets se mapean en memoria, y el texto de cada
+pasaje se lee del blob cuando se necesita.
+
+Uso como script (convierte un index_evity.npz antiguo):
+    python3 index_store.py --convert vector_index/ [--dtype float16]
+"""
+
+import argparse
+import contextlib
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+INDEX_FORMAT = 2
+CURRENT_FILE = "CURRENT"
+BUILD_LOCK_FILE = ".build.lock"
+LEGACY_NPZ = "index_evity.npz"
+ROW_FIELDS = 5  # doc_id, page_start, page_end, char_start, char_end
+
+# Carpetas cuyo candado ya tiene este hilo (build_lock es reentrante: el builder
+# llama a open_index con el candado tomado)
+_held_locks = threading.local()
+
+_DTYPES = {"float32": (np.float32, "f32"), "float16": (np.float16, "f16")}
+_EPS = 1e-12
+
+
+class TextBlob(Sequence[str]):
+    """Textos de pasajes leídos bajo demanda desde texts.bin."""
+
+    def __init__(self, blob_path: Path, offsets: np.ndarray):
+        self._offsets = offsets
+        self._mm: Optional[mmap.mmap] = None
+        if blob_path.stat().st_size > 0:
+            with open(blob_path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        if self._mm is None or start == end:
+            return ""
+        return self._mm[start:end].decode("utf-8")
+
+
+class RowNames(Sequence[str]):
+    """Nombre del documento de origen de cada fila (doc_id -> nombre)."""
+
+    def __init__(self, doc_ids: np.ndarray, docs: List[str]):
+        self._doc_ids = doc_ids
+        self._docs = docs
+
+    def __len__(self) -> int:
+        return len(self._doc_ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._docs[int(self._doc_ids[int(i)])]
+
+
+@dataclass(frozen=True)
+class DiskIndex:
+    """Índice v2 abierto. Embeddings, filas y offsets son memmaps de solo lectura."""
+
+    path: Path
+    version: str
+    names: RowNames
+    texts: TextBlob
+    embeddings: np.ndarray  # (n, d), normalizada
+    pages: np.ndarray  # (n, 2)
+    offsets: np.ndarray  # (n, 2)
+
+    def __len__(self) -> int:
+        return self.embeddings.shape[0]
+
+
+# ---------------------------------------------------------------------------
+# Lectura
+# ---------------------------------------------------------------------------
+
+
+def _current_dir(out_dir: Path) -> Optional[Path]:
+    try:
+        name = (out_dir / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    path = out_dir / name
+    return path if (path / "meta.json").exists() else None
+
+
+def index_exists(out_dir: Path) -> bool:
+    """¿Hay un índice (v2 o .npz antiguo) en `out_dir`?"""
+    return _current_dir(out_dir) is not None or (out_dir / LEGACY_NPZ).exists()
+
+
+def _memmap(path: Path, dtype, shape) -> np.ndarray:
+    if shape[0] == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+def open_index(out_dir: Path) -> DiskIndex:
+    """
+    Abre el índice vigente. Si solo existe un index_evity.npz antiguo,
+    lo convierte primero al formato v2 (una sola vez).
+    """
+    path = _current_dir(out_dir)
+    if path is None:
+        if not (out_dir / LEGACY_NPZ).exists():
+            raise FileNotFoundError(f"No se encontró el índice: {out_dir / LEGACY_NPZ}")
+        # Varios workers pueden llegar aquí a la vez: convierte solo el primero,
+        # los demás esperan el candado y abren lo que él publicó
+        with build_lock(out_dir):
+            path = _current_dir(out_dir) or convert_npz(out_dir)
+
+    meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    if meta.get("format") != INDEX_FORMAT:
+        raise ValueError(f"Formato de índice no soportado: {meta.get('format')}")
+    n, dim = meta["count"], meta["dim"]
+    dtype, ext = _DTYPES[meta["dtype"]]
+
+    rows = _memmap(path / "rows.i64", np.int64, (n, ROW_FIELDS))
+    offsets = _memmap(path / "texts.idx", np.int64, (n + 1,))
+    docs = json.loads((path / "docs.json").read_text(encoding="utf-8"))
+
+    return DiskIndex(
+        path=path,
+        version=meta["version"],
+        names=RowNames(rows[:, 0], docs),
+        texts=TextBlob(path / "texts.bin", offsets),
+        embeddings=_memmap(path / f"embeddings.{ext}", dtype, (n, dim)),
+        pages=rows[:, 1:3],
+        offsets=rows[:, 3:5],
+    )
+
+
+def read_all_rows(out_dir: Path) -> Optional[Dict[str, object]]:
+    """
+    Carga todas las columnas en memoria (para reconstrucciones incrementales).
+    Devuelve None si no hay índice.
+    """
+    if not index_exists(out_dir):
+        return None
+    disk = open_index(out_dir)
+    return {
+        "names": list(disk.names),
+        "texts": list(disk.texts),
+        "embeddings": np.array(disk.embeddings, dtype=np.float32),
+        "pages": np.array(disk.pages, dtype=np.int32),
+        "offsets": np.array(disk.offsets, dtype=np.int64),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Escritura
+# ---------------------------------------------------------------------------
+
+
+def write_index(
+    out_dir: Path,
+    names: Sequence[str],
+    texts: Sequence[str],
+    embeddings: np.ndarray,
+    pages: np.ndarray,
+    offsets: np.ndarray,
+    version: str,
+    dtype: str = "float32",
+) -> Path:
+    """
+    Escribe una nueva versión del índice en su propia carpeta y la vuelve vigente
+    reemplazando CURRENT de golpe. Quien tenga abierta la versión anterior la
+    sigue leyendo sin problema.
+    """
+    np_dtype, ext = _DTYPES[dtype]
+    n = len(names)
+    embs = np.array(embeddings, dtype=np.float32).reshape(n, -1)
+    embs /= np.linalg.norm(embs, axis=1, keepdims=True) + _EPS
+
+    folder = f"index-v{INDEX_FORMAT}-{version.replace('.', '_')}"
+    path = out_dir / folder
+    tmp = out_dir / (folder + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    docs: List[str] = []
+    doc_ids: Dict[str, int] = {}
+    rows = np.zeros((n, ROW_FIELDS), dtype=np.int64)
+    text_offsets = np.zeros(n + 1, dtype=np.int64)
+    with open(tmp / "texts.bin", "wb") as blob:
+        pos = 0
+        for i, (name, text) in enumerate(zip(names, texts)):
+            if name not in doc_ids:
+                doc_ids[name] = len(docs)
+                docs.append(name)
+            data = text.encode("utf-8")
+            blob.write(data)
+            pos += len(data)
+            text_offsets[i + 1] = pos
+            rows[i, 0] = doc_ids[name]
+    if n:
+        rows[:, 1:3] = np.asarray(pages).reshape(n, 2)
+        rows[:, 3:5] = np.asarray(offsets).reshape(n, 2)
+
+    embs.astype(np_dtype).tofile(tmp / f"embeddings.{ext}")
+    rows.tofile(tmp / "rows.i64")
+    text_offsets.tofile(tmp / "texts.idx")
+    (tmp / "docs.json").write_text(json.dumps(docs, ensure_ascii=False), encoding="utf-8")
+    meta = {
+        "format": INDEX_FORMAT,
+        "version": version,
+        "count": n,
+        "dim": int(embs.shape[1]) if n else 0,
+        "dtype": dtype,
+        "created": time.time(),
+    }
+    (tmp / "meta.json").write_text(json.dumps(meta, indent=1), encoding="utf-8")
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    current_tmp = out_dir / (CURRENT_FILE + ".tmp")
+    current_tmp.write_text(folder, encoding="utf-8")
+    os.replace(current_tmp, out_dir / CURRENT_FILE)
+
+    _cleanup_old_versions(out_dir, keep=folder)
+    return path
+
+
+@contextlib.contextmanager
+def build_lock(out_dir: Path) -> Iterator[None]:
+    """
+    Candado entre procesos para construir el índice (p. ej. varios workers de
+    gunicorn): solo uno construye; los demás esperan y después ven que ya no
+    hay cambios pendientes. Es reentrante dentro del mismo hilo.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    key = str(out_dir.resolve())
+    held = _held_locks.__dict__.setdefault("dirs", set())
+    if key in held:
+        yield
+        return
+    with open(out_dir / BUILD_LOCK_FILE, "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        held.add(key)
+        try:
+            yield
+        finally:
+            held.discard(key)
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _cleanup_old_versions(out_dir: Path, keep: str) -> None:
+    """
+    Borra carpetas de versiones anteriores. En Linux los memmaps ya abiertos
+    siguen siendo válidos aunque se borre el archivo.
+    """
+    for p in out_dir.glob(f"index-v{INDEX_FORMAT}-*"):
+        if p.is_dir() and p.name != keep:
+            shutil.rmtree(p, ignore_errors=True)
+
+
+def convert_npz(out_dir: Path, dtype: str = "float32") -> Path:
+    """Convierte un index_evity.npz antiguo (arrays con pickle) al formato v2."""
+    npz_path = out_dir / LEGACY_NPZ
+    npz = np.load(npz_path, allow_pickle=True)
+    names = [str(x) for x in npz["names"]]
+    n = len(names)
+    pages = npz["pages"] if "pages" in npz.files else np.zeros((n, 2), dtype=np.int64)
+    offsets = npz["offsets"] if "offsets" in npz.files else np.zeros((n, 2), dtype=np.int64)
+    try:
+        version = (out_dir / "index_ts").read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        version = str(npz_path.stat().st_mtime)
+    path = write_index(
+        out_dir,
+        names,
+        [str(x) for x in npz["texts"]],
+        np.asarray(npz["embeddings"], dtype=np.float32),
+        pages,
+        offsets,
+        version,
+        dtype=dtype,
+    )
+    print(f"[index] Convertido {npz_path.name} al formato v{INDEX_FORMAT}: {path}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Herramientas del índice en disco de Evity")
+    parser.add_argument("--convert", type=str, required=True, help="Carpeta vector_index/ con index_evity.npz")
+    parser.add_argument("--dtype", choices=sorted(_DTYPES), default="float32")
+    args = parser.parse_args()
+    out_dir = Path(args.convert).resolve()
+    with build_lock(out_dir):
+        convert_npz(out_dir, dtype=args.dtype)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+lab_json.py
+
+JSON de la extracción de laboratorios: esquema estricto, lectura incremental y reparación.
+- `lab_response_format`: `response_format` de tipo json_schema (strict) generado desde
+  PREDEFINED_ANALYTES; `nombre` es un enum con los nombres de la tabla, así que el
+  modelo no puede inventar analitos ni renombrarlos, y `valor` siempre es número o null
+- `AnalyteStreamParser`: recibe los fragmentos del modelo conforme llegan (stream) y
+  devuelve cada analito en cuanto se cierra su objeto, sin esperar el JSON completo
+- `repair_json`: arregla localmente las fallas típicas (bloque ```json, comas
+  colgantes, None/True/False de Python, comillas simples, respuesta cortada por
+  max_tokens) en lugar de descartar la respuesta y obligar a volver a subir el archivo
+"""
+
+import json
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from analyte_ranges import ANALYTE_NAMES, ANALYTE_TABLE_VERSION
+
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+# Literales fuera de strings que json.loads no acepta
+_LITERALS = {"None": "null", "True": "true", "False": "false", "NaN": "null", "undefined": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+@lru_cache(maxsize=64)
+def _schema_for(table_version: str, names: Tuple[str, ...]) -> Dict[str, Any]:
+    nullable_string = {"type": ["string", "null"]}
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "lab_results",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "additionalProperties": False,
+                "required": [
+                    "tipo_estudio", "nombre_estudio", "nombre_paciente",
+                    "nombre_laboratorio", "fecha_estudio", "analitos",
+                ],
+                "properties": {
+                    "tipo_estudio": {"type": "string", "enum": ["laboratorio", "estudio_imagen", "documento_medico"]},
+                    "nombre_estudio": nullable_string,
+                    "nombre_paciente": nullable_string,
+                    "nombre_laboratorio": nullable_string,
+                    "fecha_estudio": {**nullable_string, "description": "YYYY-MM-DD"},
+                    "analitos": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "additionalProperties": False,
+                            "required": ["nombre", "valor", "unidad", "observaciones"],
+                            "properties": {
+                                "nombre": {"type": "string", "enum": list(names)},
+                                "valor": {"type": ["number", "null"]},
+                                "unidad": nullable_string,
+                                "observaciones": nullable_string,
+                            },
+                        },
+                    },
+                },
+            },
+        },
+    }
+
+
+def lab_response_format(names: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    `response_format` para chat.completions con el esquema de la extracción.
+    Con `names` (prompt compacto), el enum de `nombre` se limita a esos analitos.
+    Se arma una vez por versión de la tabla y lista de nombres.
+    """
+    if names is None:
+        return _schema_for(ANALYTE_TABLE_VERSION, tuple(ANALYTE_NAMES))
+    wanted = set(names)
+    return _schema_for(ANALYTE_TABLE_VERSION, tuple(n for n in ANALYTE_NAMES if n in wanted))
+
+
+class AnalyteStreamParser:
+    """
+    Lector incremental del JSON de la extracción. `feed(fragmento)` devuelve los
+    analitos de `"analitos": [...]` que se completaron con ese fragmento;
+    `result()` devuelve el documento completo (reparado si hace falta).
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._key: Optional[str] = None
+        self._analitos_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+
+    def feed(self, chunk: Optional[str]) -> List[dict]:
+        if not chunk:
+            return []
+        self.text += chunk
+        done: List[dict] = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start + 1 : i]
+                continue
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ":":
+                self._key = self._last_string
+            elif c in "{[":
+                self._stack.append(c)
+                depth = len(self._stack)
+                if c == "[" and depth == 2 and self._key == "analitos":
+                    self._analitos_depth = depth
+                elif c == "{" and self._analitos_depth is not None and depth == self._analitos_depth + 1:
+                    self._item_start = i
+            elif c in "}]" and self._stack:
+                depth = len(self._stack)
+                self._stack.pop()
+                if c == "}" and self._item_start is not None and depth == (self._analitos_depth or 0) + 1:
+                    item = _loads_or_repair(text[self._item_start : i + 1])
+                    if isinstance(item, dict):
+                        done.append(item)
+                    self._item_start = None
+                elif c == "]" and depth == self._analitos_depth:
+                    self._analitos_depth = None
+        self._pos = len(text)
+        return done
+
+    def result(self) -> Optional[dict]:
+        return _loads_or_repair(self.text)
+
+
+def _loads_or_repair(text: str) -> Optional[Any]:
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return repair_json(text)
+
+
+def _normalize(raw: str) -> Tuple[str, List[Tuple[int, List[str]]], List[str], bool]:
+    """
+    Reescribe `raw` como JSON válido hasta donde llegue: comillas simples -> dobles,
+    literales de Python -> JSON, sin comas colgantes; se detiene al cerrar el
+    objeto de primer nivel y descarta lo que venga después. Devuelve el texto, los puntos
+    donde se puede cortar (tras un elemento completo, con la pila de ese momento),
+    la pila abierta al final y si quedó un string abierto.
+    """
+    out: List[str] = []  # un carácter por elemento: las posiciones de corte son índices del texto
+    stack: List[str] = []
+    cuts: List[Tuple[int, List[str]]] = []
+    quote: Optional[str] = None
+    escape = False
+    i = 0
+    n = len(raw)
+    while i < n:
+        c = raw[i]
+        if quote is not None:
+            if escape:
+                escape = False
+                out.append(c)
+            elif c == "\\":
+                escape = True
+                out.append(c)
+            elif c == quote:
+                quote = None
+                out.append('"')
+            elif c == '"':
+                out.extend('\\"')  # comilla doble dentro de un string con comillas simples
+            elif c == "\n":
+                out.extend("\\n")
+            else:
+                out.append(c)
+            i += 1
+            continue
+        if c in "\"'":
+            quote = c
+            out.append('"')
+        elif c in "{[":
+            stack.append(c)
+            out.append(c)
+        elif c in "}]":
+            while out and out[-1] in " \t\r\n,":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(c)
+            cuts.append((len(out), list(stack)))
+            if not stack:
+                break  # el objeto terminó: lo que sigue es texto del modelo ('Espero que sirva.', otro JSON)
+        elif c == ",":
+            while out and out[-1] in " \t\r\n":
+                out.pop()
+            if out and out[-1] not in "{[,":
+                cuts.append((len(out), list(stack)))
+                out.append(c)
+        elif c.isalpha() or c == "_":
+            j = i
+            while j < n and (raw[j].isalnum() or raw[j] == "_"):
+                j += 1
+            word = raw[i:j]
+            out.extend(_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(c)
+        i += 1
+    return "".join(out), cuts, stack, quote is not None
+
+
+def repair_json(raw: str, max_attempts: int = 64) -> Optional[dict]:
+    """
+    El objeto JSON de una respuesta mal formada, o None si no hay nada rescatable.
+    Si la respuesta se cortó, conserva todo lo que estaba completo (los analitos
+    anteriores al corte) y cierra los objetos y arreglos abiertos.
+    """
+    if not raw:
+        return None
+    text = _FENCE_RE.sub("", raw)
+    start = text.find("{")
+    if start < 0:
+        return None
+    fixed, cuts, stack, open_string = _normalize(text[start:])
+
+    closed = fixed + ('"' if open_string else "") + "".join(_CLOSERS[c] for c in reversed(stack))
+    if not stack and not open_string:
+        candidates = [closed]
+    else:
+        # Cortada: primero se descarta el elemento a medias (un 'valor': 1 podía ser 123)
+        candidates = [
+            fixed[:cut] + "".join(_CLOSERS[c] for c in reversed(cut_stack))
+            for cut, cut_stack in reversed(cuts[-max_attempts:])
+        ]
+        candidates.append(closed)
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(data, dict):
+            continue
+        if candidate is not closed and isinstance(data.get("analitos"), list):
+            # Un analito cortado a la mitad (sin `valor`) no se reporta
+            data["analitos"] = [a for a in data["analitos"] if isinstance(a, dict) and "valor" in a]
+        return data
+    return None
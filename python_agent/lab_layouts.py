@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+lab_layouts.py
+
+Perfiles de formato por laboratorio para leer sus reportes sin modelo.
+- La mayoría de los reportes vienen de pocos laboratorios cuyo formato no
+  cambia: cada perfil describe cómo reconocerlo (marcas en el texto), cómo
+  vienen sus renglones (patrón por renglón o columnas en bloques) y sus
+  convenciones de unidades
+- Se detecta el perfil con la capa de texto del PDF; si ninguno aplica (o el
+  perfil no cuadra con el documento), lab_ocr.py sigue con el parser genérico
+  de lab_text.py y, al final, con el modelo
+- La salida tiene la misma forma que el JSON del modelo (y de lab_text.py)
+
+Para agregar un laboratorio: crear un `LabProfile` y pasarlo a `register_profile`.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Pattern, Sequence, Tuple
+
+from lab_text import fold, parse_header, parse_number, resolve_label, unit_fits
+
+# Renglones que solo separan filas en los reportes ('-----', '+', '____')
+_SEPARATOR_RE = re.compile(r"^[-_=+.\s]*$")
+# Puntos guía entre el nombre y el resultado: 'HEMOGLOBINA  .    .    .'
+_DOT_LEADERS_RE = re.compile(r"(?:\s+\.)+\s*$")
+
+
+@dataclass(frozen=True)
+class LabProfile:
+    key: str
+    lab_name: str
+    # Textos (ya normalizados con `fold`) que identifican al laboratorio; basta uno
+    markers: Tuple[str, ...]
+    # "rows": nombre, resultado y unidad en el mismo renglón (`row_re`)
+    # "columns": la columna de nombres, la de unidades/referencias y la de resultados
+    #            salen en bloques separados, en el mismo orden
+    layout: str
+    row_re: Optional[Pattern] = None
+    patient_re: Optional[Pattern] = None
+    # Renglones que nunca son filas de resultados (encabezados, notas, métodos)
+    skip_re: Optional[Pattern] = None
+    # Unidades propias del laboratorio -> unidad estándar
+    unit_aliases: Dict[str, str] = field(default_factory=dict)
+    # Analitos cuyo nombre depende de la unidad: {unidad: {analito: analito real}}
+    # (p. ej. 'LEUCOCITOS 3 por campo' en el urianálisis es Leucocitos/CPA, no la biometría)
+    unit_analytes: Dict[str, Dict[str, str]] = field(default_factory=dict)
+
+    def matches(self, folded_text: str) -> bool:
+        return any(marker in folded_text for marker in self.markers)
+
+
+def _clean_unit(profile: LabProfile, unit: str) -> str:
+    unit = re.sub(r"\s*/\s*", "/", unit.strip())
+    return profile.unit_aliases.get(unit, unit)
+
+
+def _analyte_for(profile: LabProfile, name: str, unit: str) -> str:
+    return profile.unit_analytes.get(fold(unit), {}).get(name, name)
+
+
+def _add(found: Dict[str, dict], label: str, name: str, value: float, unit: str) -> None:
+    """
+    Guarda el analito una sola vez; una fila con el nombre exacto reemplaza a una
+    leída por sinónimo ('UREA' gana sobre 'NITROGENO UREICO', que la tabla mapea a Urea).
+    """
+    exact = fold(re.sub(r"\([^)]*\)", "", label)) == fold(re.sub(r"\([^)]*\)", "", name))
+    if name in found and (not exact or found[name]["_exact"]):
+        return
+    found[name] = {"nombre": name, "valor": value, "unidad": unit, "observaciones": None, "_exact": exact}
+
+
+def _analytes(found: Dict[str, dict]) -> List[dict]:
+    return [{k: v for k, v in entry.items() if k != "_exact"} for entry in found.values()]
+
+
+def _patient(profile: LabProfile, text: str) -> Optional[str]:
+    if profile.patient_re is not None:
+        match = profile.patient_re.search(text)
+        if match:
+            return re.sub(r"\s+", " ", match.group(1)).strip()
+    return parse_header(text)["nombre_paciente"]
+
+
+# ---------------------------------------------------------------------------
+# Formato por renglones
+# ---------------------------------------------------------------------------
+
+
+def _parse_rows(profile: LabProfile, lines: Sequence[str]) -> List[dict]:
+    """Un analito por renglón que cumple `row_re`; el valor puede venir en el renglón siguiente."""
+    found: Dict[str, dict] = {}
+    pending: Optional[str] = None
+    for line in lines:
+        if _SEPARATOR_RE.match(line) or (profile.skip_re and profile.skip_re.search(line)):
+            continue
+        match = profile.row_re.match(line.strip())
+        label = match.group("label") if match else None
+        if match is None and pending is not None:
+            # 'BILIRRUBINA DIRECTA' / '-----' / '0.13 mg/dL 0.00 - 0.20+'
+            match = profile.row_re.match(f"{pending} {line.strip()}")
+            label = pending if match else None
+        pending = None
+        name = resolve_label(label) if label else None
+        if name is None:
+            pending = line.strip() if resolve_label(line) else None
+            continue
+        value = parse_number(match.group("value"))
+        unit = _clean_unit(profile, match.group("unit") or "")
+        name = _analyte_for(profile, name, unit)
+        if value is not None and unit_fits(name, unit):
+            _add(found, label, name, value, unit)
+    return _analytes(found)
+
+
+# ---------------------------------------------------------------------------
+# Formato por columnas en bloques
+# ---------------------------------------------------------------------------
+
+_UNIT_LINE_RE = re.compile(
+    r"^(?:(?:ALTO|BAJO)\s+)?(?:%|[ƒf]l|pg|(?:mg|g|ug|µg|ng|UI|U|mEq|mmol|miles|mill|cel)/\S*)(?:\s|$)",
+    re.IGNORECASE,
+)
+
+
+def _is_single_value(line: str) -> bool:
+    tokens = line.split()
+    return len(tokens) == 1 and (parse_number(tokens[0]) is not None or tokens[0].isalpha())
+
+
+def _row_label(line: str) -> Optional[str]:
+    """Nombre de la fila si el renglón es una fila (mayúsculas, sin ser unidad ni valor suelto)."""
+    label = _DOT_LEADERS_RE.sub("", line).strip()
+    letters = [c for c in label if c.isalpha()]
+    if not letters or _UNIT_LINE_RE.match(label):
+        return None
+    if label.split()[0] != "pH" and sum(c.isupper() for c in letters) < 0.8 * len(letters):
+        return None
+    return label
+
+
+def _resolve_row(label: str) -> Tuple[Optional[str], str, str]:
+    """
+    (analito, nombre tal como viene, unidad en la misma fila) de una fila 'NOMBRE [unidad] [referencia]':
+    prueba el nombre completo y luego prefijos más cortos, siempre que lo que
+    sigue no sea otra palabra del nombre ('NEUTROFILOS EN BANDA' no es 'Neutrófilos').
+    """
+    tokens = label.split()
+    for k in range(len(tokens), 0, -1):
+        nxt = tokens[k] if k < len(tokens) else ""
+        if nxt and nxt.isalpha() and nxt.isupper() and len(nxt) > 2:
+            continue
+        name = resolve_label(" ".join(tokens[:k]))
+        if name is not None:
+            return name, " ".join(tokens[:k]), nxt if _UNIT_LINE_RE.match(nxt) else ""
+    return None, label, ""
+
+
+def _parse_columns(profile: LabProfile, pages: Sequence[str]) -> Optional[List[dict]]:
+    """
+    Cada página: N filas (nombres), luego N renglones de unidad/referencia y al
+    final N resultados sueltos, en el mismo orden. Si en alguna página no cuadran
+    los conteos, el perfil no aplica (None) y se sigue con otra etapa.
+    """
+    found: Dict[str, dict] = {}
+    for page in pages:
+        # pypdf deja espacios duros (\xa0) dentro de los nombres: 'EXAMEN\xa0GENERAL'
+        lines = [" ".join(line.split()) for line in page.splitlines() if line.strip()]
+        lines = [line for line in lines if not (profile.skip_re and profile.skip_re.search(line))]
+        # La columna de resultados es la racha más larga de valores sueltos
+        best_start, best_len, start = 0, 0, None
+        for i, line in enumerate(lines + [""]):
+            if line and _is_single_value(line):
+                start = i if start is None else start
+                continue
+            if start is not None and i - start > best_len:
+                best_start, best_len = start, i - start
+            start = None
+        if best_len == 0:
+            continue
+        values = lines[best_start : best_start + best_len]
+        body = lines[:best_start]
+        rows = [label for label in map(_row_label, body) if label]
+        if len(rows) != len(values):
+            print(f"[layouts] {profile.key}: {len(rows)} filas y {len(values)} resultados; no cuadra")
+            return None
+        units = [line for line in body if _UNIT_LINE_RE.match(line)]
+        for i, (label, raw_value) in enumerate(zip(rows, values)):
+            name, label, unit = _resolve_row(label)
+            value = parse_number(raw_value)
+            if name is None or value is None:
+                continue
+            if not unit and len(units) == len(rows):
+                unit = next(t for t in units[i].split() if t not in ("ALTO", "BAJO"))
+            unit = _clean_unit(profile, unit)
+            if unit_fits(name, unit):
+                _add(found, label, name, value, unit)
+    return _analytes(found)
+
+
+# ---------------------------------------------------------------------------
+# Perfiles
+# ---------------------------------------------------------------------------
+
+PROFILES: List[LabProfile] = []
+
+
+def register_profile(profile: LabProfile) -> None:
+    """Agrega un perfil; los registrados después tienen prioridad."""
+    PROFILES.insert(0, profile)
+
+
+register_profile(LabProfile(
+    key="salud_digna",
+    lab_name="Salud Digna",
+    markers=("salud digna", "salud-digna", "centro nacional de referencia monterrey"),
+    layout="rows",
+    # 'HEMOGLOBINA 13.50 g/dL 11.20 - 15.70' / 'NEUTRÓFILOS (%) 32.3 * % 34.0 - 71.1' / 'SODIO 139.0'
+    row_re=re.compile(
+        r"^(?P<label>[A-Za-zÁÉÍÓÚÜÑáéíóúüñ][^*]*?)\s+(?P<value>[<>≤≥]?\d+(?:\.\d+)?)\s*\**\s*"
+        r"(?P<unit>%|por campo|10\^\d+/\S+|[^\s\d<>≤≥-][^\s]*(?:\s/\s\S+)?)?(?:\s+[<>≤≥]?\d.*|\s*)$"
+    ),
+    patient_re=re.compile(r"Paciente:\s*([A-ZÁÉÍÓÚÑ][A-ZÁÉÍÓÚÑ ,]+?)\s*(?:Mujer|Hombre|\n)"),
+    skip_re=re.compile(r"^(?:Tipo de muestra|Método|Equipo|Nota|Fecha|Folio|Paciente|Sexo|Edad|CED\.)", re.I),
+    unit_aliases={"ng/ml": "ng/mL", "mmol/l": "mmol/L"},
+    unit_analytes={
+        "por campo": {"Leucocitos": "Leucocitos/CPA", "Eritrocitos": "Eritrocitos/CPA"},
+    },
+))
+
+register_profile(LabProfile(
+    key="moreira",
+    lab_name="Laboratorio Moreira",
+    markers=("labmoreira", "laboratorio moreira"),
+    layout="columns",
+    patient_re=re.compile(r"Examen de\s+(.+?)\s+Clave\b"),
+    skip_re=re.compile(
+        r"^(?:Examen de|Ordenado por|Gabinete|/|P[ÁA]GINA|La interpretaci|NOTA|PADRE MIER|Ver m[áa]s|"
+        r"ESPECIMEN|METODOLOG|CITOMETR|RESULTADO|PAR[ÁA]METROS|AN[ÁA]LISIS|BIOMETR|EXAMEN GENERAL|PERFIL|"
+        r"LOS INTERVALOS|UNA REVISION|\(nd\)|Dr\.|Direcci)",
+        re.IGNORECASE,
+    ),
+    unit_aliases={"ƒl": "fL"},
+))
+
+
+def detect_profile(pages: Sequence[str]) -> Optional[LabProfile]:
+    folded = fold("\n".join(pages))
+    for profile in PROFILES:
+        if profile.matches(folded):
+            return profile
+    return None
+
+
+def extract_with_profile(pages: Sequence[str]) -> Optional[Tuple[LabProfile, dict]]:
+    """
+    (perfil, datos en la forma del JSON del modelo) si algún perfil reconoce el
+    reporte y lo puede leer; si no, None.
+    """
+    profile = detect_profile(pages)
+    if profile is None:
+        return None
+    if profile.layout == "columns":
+        analytes = _parse_columns(profile, pages)
+    else:
+        analytes = _parse_rows(profile, "\n".join(pages).splitlines())
+    if not analytes:
+        return None
+
+    text = "\n".join(pages)
+    header = parse_header(text)
+    return profile, {
+        "tipo_estudio": "laboratorio",
+        "nombre_estudio": " / ".join(header["paneles"]) or "Estudio de laboratorio",
+        "nombre_paciente": _patient(profile, text),
+        "nombre_laboratorio": profile.lab_name,
+        "fecha_estudio": header["fecha_estudio"],
+        "analitos": analytes,
+    }
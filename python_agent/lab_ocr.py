@@ -7,18 +7,73 @@ Recibe bytes de un archivo de laboratorio (PDF o imagen),
 extrae el texto y pide al modelo que estructure los resultados.
 """
 
+import asyncio
 import base64
 import io
 import json
-import re
+import os
+import queue
+import time
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 
-from openai import OpenAI
+from PIL import Image
 from pypdf import PdfReader
-from pdf2image import convert_from_bytes
-from analyte_ranges import PREDEFINED_ANALYTES, ANALYTE_NAMES, ANALYTE_SYNONYMS, get_analyte_info
+from pdf2image import convert_from_bytes, pdfinfo_from_bytes
+from analyte_ranges import (
+    ANALYTE_NAMES,
+    ANALYTE_SYNONYMS,
+    ANALYTE_TABLE_VERSION,
+    PREDEFINED_ANALYTES,
+    get_analyte_info,
+)
+from lab_json import AnalyteStreamParser, lab_response_format, repair_json
+from lab_layouts import extract_with_profile
+from lab_pages import PAGE_FILTER_ENABLED, classify_image, classify_text, summarize
+from lab_text import PANEL_ANALYTES, detect_panels, extract_from_text, mentioned_analytes, text_layer_ok
+from ocr_cache import OCR_CACHE, OCR_CACHE_ENABLED, ocr_cache_key
+from openai_client import get_async_openai_client, get_openai_client
 
-client = OpenAI()
+# Subir este número al cambiar el prompt, el modelo o las etapas: invalida los resultados en caché
+OCR_PROMPT_VERSION = "9"
+
+# Capa de texto de los PDF digitales antes que visión (ver lab_text.py)
+TEXT_LAYER_ENABLED = os.getenv("EVITY_OCR_TEXT_LAYER", "1") != "0"
+# Analitos reconocidos sin modelo a partir de los cuales no se llama a ningún modelo
+TEXT_MIN_ANALYTES = int(os.getenv("EVITY_OCR_TEXT_MIN_ANALYTES", "3"))
+# Modelo (solo texto, más barato que visión) para PDFs con texto que el parser no reconoce
+TEXT_MODEL = os.getenv("EVITY_OCR_TEXT_MODEL", "gpt-4o-mini")
+TEXT_MAX_CHARS = 60000
+# Prompt compacto (solo los analitos de los paneles detectados) para el modelo de texto
+COMPACT_PROMPT = os.getenv("EVITY_OCR_COMPACT_PROMPT", "1") != "0"
+# Salida estructurada (json_schema strict, ver lab_json.py); `EVITY_OCR_STRUCTURED=0` vuelve a json_object
+STRUCTURED_OUTPUT = os.getenv("EVITY_OCR_STRUCTURED", "1") != "0"
+# Páginas con más KB de dibujo vectorial que esto no se leen como texto (gráficas)
+TEXT_MAX_PAGE_BYTES = int(float(os.getenv("EVITY_OCR_TEXT_MAX_PAGE_KB", "256")) * 1024)
+
+# Rasterizado para visión: cada página se renderiza, reduce y codifica por separado,
+# en paralelo (pdftoppm corre como proceso aparte), con a lo más RENDER_WORKERS
+# páginas en memoria a la vez. 300 DPI y color son los valores con los que se
+# validó la lectura; bajarlos ahorra memoria, pero no se ha medido su efecto
+RENDER_DPI = int(os.getenv("EVITY_OCR_DPI", "300"))
+RENDER_MAX_PAGES = int(os.getenv("EVITY_OCR_MAX_PAGES", "10"))
+RENDER_MAX_SIDE = int(os.getenv("EVITY_OCR_MAX_SIDE", "2048"))
+RENDER_GRAYSCALE = os.getenv("EVITY_OCR_GRAYSCALE", "0") == "1"
+RENDER_FORMAT = os.getenv("EVITY_OCR_IMAGE_FORMAT", "jpeg").lower()
+RENDER_QUALITY = int(os.getenv("EVITY_OCR_IMAGE_QUALITY", "85"))
+RENDER_WORKERS = max(1, int(os.getenv("EVITY_OCR_RENDER_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+# PDFs a visión: una solicitud por grupo de páginas, en paralelo, y se unen los
+# resultados (ver _merge_pages). `EVITY_OCR_FANOUT=0` manda todas en una sola solicitud
+FANOUT_ENABLED = os.getenv("EVITY_OCR_FANOUT", "1") != "0"
+FANOUT_PAGES_PER_REQUEST = max(1, int(os.getenv("EVITY_OCR_PAGES_PER_REQUEST", "1")))
+FANOUT_CONCURRENCY = max(1, int(os.getenv("EVITY_OCR_PAGE_CONCURRENCY", "4")))
+# Reintentos de un grupo que falla (error de red o respuesta que no es JSON), sin repetir los demás
+FANOUT_RETRIES = int(os.getenv("EVITY_OCR_PAGE_RETRIES", "2"))
 
 CBC_VALUE_RANGES = {
     "Eritrocitos": {"min": 3.5, "max": 7.0, "typical_unit": "mill/mm³"},
@@ -96,103 +151,296 @@ def _validate_and_correct_cbc(analytes: list) -> list:
     return list(corrected.values())
 
 
-def _read_pdf_text(file_bytes: bytes) -> str:
-    """Extrae texto de un PDF en memoria."""
+def _form_bytes(obj, depth: int = 0) -> int:
+    """Tamaño de los dibujos vectoriales (XObject /Form) de una página, con los anidados."""
+    resources = obj.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources is not None else None
+    if not xobjects:
+        return 0
+    total = 0
+    for ref in xobjects.get_object().values():
+        xobj = ref.get_object()
+        if xobj.get("/Subtype") == "/Form":
+            total += len(xobj.get_data()) + (_form_bytes(xobj, depth + 1) if depth < 3 else 0)
+    return total
+
+
+def _read_pdf_pages(file_bytes: bytes) -> List[str]:
+    """
+    Texto embebido de cada página de un PDF en memoria ('' si la página es imagen).
+    Las páginas con gráficas vectoriales enormes (p. ej. el resumen histórico de
+    Salud Digna) se omiten: pypdf tarda segundos en recorrerlas y no traen la tabla.
+    """
     reader = PdfReader(io.BytesIO(file_bytes))
-    pages_text = []
+    pages = []
     for page in reader.pages:
-        txt = page.extract_text() or ""
-        pages_text.append(txt)
-    return "\n\n".join(pages_text).strip()
+        if _form_bytes(page) > TEXT_MAX_PAGE_BYTES:
+            pages.append("")
+            continue
+        pages.append(page.extract_text() or "")
+    return pages
+
+
+def _read_pdf_text(file_bytes: bytes) -> str:
+    """Extrae texto de un PDF en memoria."""
+    return "\n\n".join(_read_pdf_pages(file_bytes)).strip()
 
 
-def _pdf_to_images(file_bytes: bytes) -> list:
-    """Convierte páginas de PDF a imágenes base64 de alta resolución."""
-    images = convert_from_bytes(file_bytes, dpi=300)
-    base64_images = []
-    for img in images:
-        img_buffer = io.BytesIO()
-        img.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-        encoded = base64.b64encode(img_buffer.read()).decode('utf-8')
-        base64_images.append(encoded)
-    return base64_images
+def _encode_image(img: Image.Image) -> str:
+    """Reduce (lado mayor <= RENDER_MAX_SIDE), pasa a grises si aplica y codifica como data URL."""
+    if RENDER_GRAYSCALE and img.mode != "L":
+        img = img.convert("L")
+    elif img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    if max(img.size) > RENDER_MAX_SIDE:
+        img.thumbnail((RENDER_MAX_SIDE, RENDER_MAX_SIDE), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    if RENDER_FORMAT == "webp":
+        img.save(buffer, format="WEBP", quality=RENDER_QUALITY, method=4)
+        mime = "image/webp"
+    elif RENDER_FORMAT == "png":
+        img.save(buffer, format="PNG", optimize=True)
+        mime = "image/png"
+    else:
+        img.save(buffer, format="JPEG", quality=RENDER_QUALITY, optimize=True)
+        mime = "image/jpeg"
+    return f"data:{mime};base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}"
 
 
-def ocr_and_extract_labs(file_bytes: bytes, filename: str):
+def _render_page(file_bytes: bytes, page: int, classify: bool) -> Tuple[str, Optional[dict]]:
     """
-    Procesa un archivo de laboratorio (PDF o imagen) y devuelve
-    un dict con datos listos para la BD / gráficas.
+    Renderiza una sola página (1-based) y la devuelve ya codificada; la imagen no
+    sale de aquí. Con `classify`, también la decisión de lab_pages a partir de la imagen.
+    """
+    images = convert_from_bytes(
+        file_bytes, dpi=RENDER_DPI, first_page=page, last_page=page, grayscale=RENDER_GRAYSCALE
+    )
+    if not images:
+        raise ValueError(f"pdftoppm no devolvió la página {page}.")
+    try:
+        decision = classify_image(page, images[0]) if classify else None
+        return _encode_image(images[0]), decision
+    finally:
+        images[0].close()
 
-    Devuelve algo tipo:
-    {
-      "analitos": [
-        {"nombre": "Glucosa", "valor": 90, "unidad": "mg/dL", "fecha": "2024-01-10"},
-        ...
-      ]
-    }
+
+def _plan_pages(
+    file_bytes: bytes, total: int, report: dict, texts: Optional[List[str]] = None
+) -> List[Tuple[int, bool]]:
+    """
+    Páginas a rasterizar, como (página, falta juzgarla por la imagen). Las que la
+    capa de texto ya descarta no se rasterizan; el tope RENDER_MAX_PAGES cuenta
+    solo las que quedan. `texts` es la capa de texto ya leída (ver
+    `_read_text_layer`); si no viene, se lee aquí.
+    """
+    if not PAGE_FILTER_ENABLED:
+        texts = []
+    elif texts is None:
+        try:
+            texts = _read_pdf_pages(file_bytes)
+        except Exception as e:
+            print(f"[ocr] Sin capa de texto para clasificar páginas: {e}")
+            texts = []
+    plan: List[Tuple[int, bool]] = []
+    for page in range(1, total + 1):
+        decision = classify_text(page, texts[page - 1]) if page <= len(texts) else None
+        if decision is not None:
+            report["classified"].append(decision)
+            if decision["decision"] == "skip":
+                continue
+        elif not PAGE_FILTER_ENABLED:
+            report["classified"].append({"page": page, "decision": "lab", "reason": "filtro desactivado", "by": None})
+        if len(plan) == RENDER_MAX_PAGES:
+            report["classified"].append({
+                "page": page, "decision": "skip", "reason": "fuera del tope de páginas", "by": None,
+            })
+            continue
+        plan.append((page, decision is None and PAGE_FILTER_ENABLED))
+    if len(plan) == RENDER_MAX_PAGES and plan[-1][0] < total:
+        print(f"[ocr] PDF de {total} páginas: solo se mandan {RENDER_MAX_PAGES} a visión")
+    return plan
+
+
+def _iter_pdf_images(
+    file_bytes: bytes, report: Optional[dict] = None, texts: Optional[List[str]] = None
+) -> Iterator[Tuple[int, str]]:
+    """
+    (página, data URL) de las páginas con resultados, en orden. Renderiza hasta
+    RENDER_WORKERS páginas a la vez. En `report` quedan el total de páginas y la
+    decisión de cada una (ver lab_pages.py).
+    """
+    report = report if report is not None else {}
+    report.update(total=int(pdfinfo_from_bytes(file_bytes).get("Pages", 0)), classified=[])
+    plan = _plan_pages(file_bytes, report["total"], report, texts)
+
+    sent = 0
+    fallback: Optional[Tuple[int, str, dict]] = None
+
+    def keep(page: int, data_url: str, decision: Optional[dict]) -> bool:
+        nonlocal sent, fallback
+        if decision is not None:
+            report["classified"].append(decision)
+            if decision["decision"] == "skip":
+                if decision["text_lines"] > (fallback[2]["text_lines"] if fallback else 0):
+                    fallback = (page, data_url, decision)
+                return False
+        sent += 1
+        return True
+
+    with ThreadPoolExecutor(max_workers=max(1, min(RENDER_WORKERS, len(plan))), thread_name_prefix="ocr-render") as pool:
+        # Ventana de RENDER_WORKERS páginas: no se adelanta más trabajo del que se consume
+        pending: List[Tuple[int, Future]] = []
+
+        def settle(limit: int) -> Iterator[Tuple[int, str]]:
+            while len(pending) > limit:
+                page, future = pending.pop(0)
+                data_url, decision = future.result()
+                if keep(page, data_url, decision):
+                    yield page, data_url
+
+        for page, classify in plan:
+            pending.append((page, pool.submit(_render_page, file_bytes, page, classify)))
+            yield from settle(RENDER_WORKERS - 1)
+        yield from settle(0)
+
+    # Si el filtro por imagen descartó todo (sin ser páginas en blanco), se manda la página con
+    # más renglones: ante la duda, el modelo decide
+    if sent == 0 and fallback is not None:
+        page, data_url, decision = fallback
+        decision.update(decision="lab", reason=f"{decision['reason']}; se manda porque ninguna otra pasó el filtro")
+        yield page, data_url
+
+
+def _pdf_to_images(
+    file_bytes: bytes, report: Optional[dict] = None, texts: Optional[List[str]] = None
+) -> List[str]:
+    """Convierte las páginas de PDF con resultados a imágenes (data URLs) para el modelo de visión."""
+    return [data_url for _, data_url in _iter_pdf_images(file_bytes, report, texts)]
+
+
+# Instrucciones del prompt de sistema: no dependen de la tabla ni del reporte, y van
+# primero para que el prefijo sea idéntico en todas las llamadas (caché de prompt del proveedor)
+_PROMPT_INSTRUCTIONS = (
+    "You are an expert clinical laboratory analysis assistant. "
+    "Your task is to CAREFULLY extract lab results from the document, reading each row precisely.\n\n"
+    "Only extract the analytes listed under PREDEFINED ANALYTES at the end of these instructions.\n\n"
+    "CBC (Biometría Hemática) NAME MAPPINGS with EXPECTED VALUE RANGES:\n"
+    "1. ERITROCITOS (RBC/Red Blood Cells) -> 'Eritrocitos' - values typically 4.0-6.5 mill/mm³\n"
+    "2. HEMOGLOBINA (HGB/Hemoglobin) -> 'Hemoglobina' - values typically 12-18 g/dL\n"
+    "3. HEMATOCRITO (HCT/Hematocrit) -> 'Hematocrito' - values typically 36-54%\n"
+    "4. VOLUMEN CORPUSCULAR MEDIO (MCV) -> 'VCM' - values typically 80-100 fL\n"
+    "5. HEMOGLOBINA CORPUSCULAR MEDIA (MCH) -> 'HCM' - values typically 26-34 pg\n"
+    "6. CONCENTRACION MEDIA DE HEMOGLOBINA (MCHC/CHCM) -> 'CHCM' - values typically 31-37 g/dL or %\n"
+    "7. ANCHURA DE DISTRIBUCION DE ERITROCITOS (RDW) -> 'RDW' - values typically 11-16%\n"
+    "8. LEUCOCITOS (WBC/White Blood Cells) -> 'Leucocitos' - values typically 4-11 miles/mm³\n"
+    "9. LINFOCITOS -> 'Linfocitos' - values typically 15-50%\n"
+    "10. MONOCITOS -> 'Monocitos' - values typically 2-10%\n"
+    "11. BASOFILOS -> 'Basófilos' - values typically 0-2%\n"
+    "12. EOSINOFILOS -> 'Eosinófilos' - values typically 0-7%\n"
+    "13. NEUTROFILOS -> 'Neutrófilos' - values typically 40-75%\n"
+    "14. PLAQUETAS (PLT/Platelets) -> 'Plaquetas' - values typically 150-400 miles/mm³\n"
+    "15. VOLUMEN PLAQUETARIO MEDIO (MPV) -> 'VPM' - values typically 7-12 fL\n\n"
+    "READING INSTRUCTIONS:\n"
+    "- Read each ROW of the lab results table CAREFULLY from left to right\n"
+    "- The FIRST column contains the test NAME\n"
+    "- The RESULT column contains the NUMERIC VALUE\n"
+    "- Match each result value to its corresponding test name on the SAME row\n"
+    "- Use the expected value ranges above to VALIDATE your extraction\n\n"
+    "FIRST: Classify the document type:\n"
+    "- 'laboratorio': Blood tests, urine tests, chemistry panels with numeric analyte values\n"
+    "- 'estudio_imagen': Ultrasound, X-ray, MRI, CT scan (descriptive reports without numeric analytes)\n"
+    "- 'documento_medico': Other medical documents\n\n"
+    "Return ONLY a JSON with this structure:\n"
+    "{\n"
+    '  "tipo_estudio": "laboratorio",\n'
+    '  "nombre_estudio": "BIOMETRIA HEMATICA" or "ULTRASONIDO ABDOMINAL" etc.,\n'
+    '  "nombre_paciente": "Patient Name",\n'
+    '  "nombre_laboratorio": "Lab Name",\n'
+    '  "fecha_estudio": "YYYY-MM-DD",\n'
+    '  "analitos": [\n'
+    '    {"nombre": "Eritrocitos", "valor": 5.57, "unidad": "mill/mm3", "observaciones": null},\n'
+    '    {"nombre": "Hemoglobina", "valor": 16.5, "unidad": "g/dL", "observaciones": null}\n'
+    "  ]\n"
+    "}\n\n"
+    "For 'estudio_imagen' or 'documento_medico', return empty analitos array: \"analitos\": []\n\n"
+    "CRITICAL RULES:\n"
+    "- Read the table row by row, matching each test name with its result value\n"
+    "- Each analyte appears ONLY ONCE - no duplicates\n"
+    "- Validate values against expected ranges to ensure correct name-value pairing\n"
+    "- Use exact names from the list (e.g., 'Eritrocitos' not 'ERITROCITOS')\n"
+    "- For '<3.0' extract 3.0, for '>200' extract 200\n"
+    "- The 'valor' must be numeric\n"
+    "- Respond ONLY with valid JSON\n\n"
+)
+
+
+@lru_cache(maxsize=64)
+def _prompt_for(table_version: str, names: Tuple[str, ...]) -> str:
+    """Prompt armado una sola vez por versión de la tabla y lista de analitos."""
+    return _PROMPT_INSTRUCTIONS + "PREDEFINED ANALYTES (only extract these):\n" + ", ".join(names)
+
+
+def _lab_prompt(names: Optional[Sequence[str]] = None) -> str:
+    """
+    Prompt de sistema para extraer analitos (el mismo para visión y para texto).
+    Con `names`, la variante compacta: solo esos analitos, en el orden de la tabla.
+    """
+    if names is None:
+        return _prompt_for(ANALYTE_TABLE_VERSION, tuple(ANALYTE_NAMES))
+    wanted = set(names)
+    return _prompt_for(ANALYTE_TABLE_VERSION, tuple(n for n in ANALYTE_NAMES if n in wanted))
+
+
+def _compact_names(text: str) -> Optional[List[str]]:
+    """
+    Analitos del prompt compacto para un texto: los de los paneles cuyo título
+    aparece más los que el texto nombra. None (prompt completo) si no se reconoce
+    ningún panel.
+    """
+    if not COMPACT_PROMPT:
+        return None
+    panels = detect_panels(text)
+    if not panels:
+        return None
+    names = set(mentioned_analytes(text))
+    for panel in panels:
+        names.update(PANEL_ANALYTES[panel])
+    return sorted(names)
+
+
+def _response_format(names: Optional[Sequence[str]] = None) -> dict:
+    """Esquema estricto de la extracción (con el mismo enum de nombres que el prompt), o json_object."""
+    if not STRUCTURED_OUTPUT:
+        return {"type": "json_object"}
+    return lab_response_format(names)
+
+
+# Se arman al importar: la primera solicitud ya no paga unirlos
+_lab_prompt()
+_response_format()
+
+
+def _build_ocr_request(
+    file_bytes: bytes, filename: str, report: Optional[dict] = None, texts: Optional[List[str]] = None
+) -> Optional[dict]:
+    """
+    Arma los parámetros de la llamada al modelo (prompt + imágenes).
+    Es la parte pesada en CPU (PDF -> imágenes) y no hace red.
+    En PDFs, `report` recibe la clasificación de páginas; devuelve None si
+    ninguna página trae resultados (no hace falta llamar al modelo).
+    `texts` es la capa de texto ya leída, para no volver a parsear el PDF.
     """
     ext = Path(filename or "").suffix.lower()
 
-    analyte_list_str = ", ".join(ANALYTE_NAMES)
-    
-    prompt_text = (
-        "You are an expert clinical laboratory analysis assistant. "
-        "Your task is to CAREFULLY extract lab results from the document, reading each row precisely.\n\n"
-        "PREDEFINED ANALYTES (only extract these):\n"
-        f"{analyte_list_str}\n\n"
-        "CBC (Biometría Hemática) NAME MAPPINGS with EXPECTED VALUE RANGES:\n"
-        "1. ERITROCITOS (RBC/Red Blood Cells) -> 'Eritrocitos' - values typically 4.0-6.5 mill/mm³\n"
-        "2. HEMOGLOBINA (HGB/Hemoglobin) -> 'Hemoglobina' - values typically 12-18 g/dL\n"
-        "3. HEMATOCRITO (HCT/Hematocrit) -> 'Hematocrito' - values typically 36-54%\n"
-        "4. VOLUMEN CORPUSCULAR MEDIO (MCV) -> 'VCM' - values typically 80-100 fL\n"
-        "5. HEMOGLOBINA CORPUSCULAR MEDIA (MCH) -> 'HCM' - values typically 26-34 pg\n"
-        "6. CONCENTRACION MEDIA DE HEMOGLOBINA (MCHC/CHCM) -> 'CHCM' - values typically 31-37 g/dL or %\n"
-        "7. ANCHURA DE DISTRIBUCION DE ERITROCITOS (RDW) -> 'RDW' - values typically 11-16%\n"
-        "8. LEUCOCITOS (WBC/White Blood Cells) -> 'Leucocitos' - values typically 4-11 miles/mm³\n"
-        "9. LINFOCITOS -> 'Linfocitos' - values typically 15-50%\n"
-        "10. MONOCITOS -> 'Monocitos' - values typically 2-10%\n"
-        "11. BASOFILOS -> 'Basófilos' - values typically 0-2%\n"
-        "12. EOSINOFILOS -> 'Eosinófilos' - values typically 0-7%\n"
-        "13. NEUTROFILOS -> 'Neutrófilos' - values typically 40-75%\n"
-        "14. PLAQUETAS (PLT/Platelets) -> 'Plaquetas' - values typically 150-400 miles/mm³\n"
-        "15. VOLUMEN PLAQUETARIO MEDIO (MPV) -> 'VPM' - values typically 7-12 fL\n\n"
-        "READING INSTRUCTIONS:\n"
-        "- Read each ROW of the lab results table CAREFULLY from left to right\n"
-        "- The FIRST column contains the test NAME\n"
-        "- The RESULT column contains the NUMERIC VALUE\n"
-        "- Match each result value to its corresponding test name on the SAME row\n"
-        "- Use the expected value ranges above to VALIDATE your extraction\n\n"
-        "FIRST: Classify the document type:\n"
-        "- 'laboratorio': Blood tests, urine tests, chemistry panels with numeric analyte values\n"
-        "- 'estudio_imagen': Ultrasound, X-ray, MRI, CT scan (descriptive reports without numeric analytes)\n"
-        "- 'documento_medico': Other medical documents\n\n"
-        "Return ONLY a JSON with this structure:\n"
-        "{\n"
-        '  "tipo_estudio": "laboratorio",\n'
-        '  "nombre_estudio": "BIOMETRIA HEMATICA" or "ULTRASONIDO ABDOMINAL" etc.,\n'
-        '  "nombre_paciente": "Patient Name",\n'
-        '  "nombre_laboratorio": "Lab Name",\n'
-        '  "fecha_estudio": "YYYY-MM-DD",\n'
-        '  "analitos": [\n'
-        '    {"nombre": "Eritrocitos", "valor": 5.57, "unidad": "mill/mm3", "observaciones": null},\n'
-        '    {"nombre": "Hemoglobina", "valor": 16.5, "unidad": "g/dL", "observaciones": null}\n'
-        "  ]\n"
-        "}\n\n"
-        "For 'estudio_imagen' or 'documento_medico', return empty analitos array: \"analitos\": []\n\n"
-        "CRITICAL RULES:\n"
-        "- Read the table row by row, matching each test name with its result value\n"
-        "- Each analyte appears ONLY ONCE - no duplicates\n"
-        "- Validate values against expected ranges to ensure correct name-value pairing\n"
-        "- Use exact names from the list (e.g., 'Eritrocitos' not 'ERITROCITOS')\n"
-        "- For '<3.0' extract 3.0, for '>200' extract 200\n"
-        "- The 'valor' must be numeric\n"
-        "- Respond ONLY with valid JSON"
-    )
+    prompt_text = _lab_prompt()
 
     if ext == ".pdf":
-        pdf_images = _pdf_to_images(file_bytes)
+        report = report if report is not None else {}
+        pdf_images = _pdf_to_images(file_bytes, report, texts)
         if not pdf_images:
+            if report.get("classified"):
+                return None
             raise ValueError("No se pudo convertir el PDF a imágenes.")
         
         image_content = [
@@ -201,11 +449,11 @@ def ocr_and_extract_labs(file_bytes: bytes, filename: str):
                 "text": "Analiza estas imágenes de un reporte de laboratorio clínico y extrae los analitos:"
             }
         ]
-        for encoded_img in pdf_images:
+        for data_url in pdf_images:
             image_content.append({
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/png;base64,{encoded_img}"
+                    "url": data_url
                 }
             })
         
@@ -243,50 +491,96 @@ def ocr_and_extract_labs(file_bytes: bytes, filename: str):
         )
 
     model_to_use = "gpt-4o"
-    
-    response = client.chat.completions.create(
-        model=model_to_use,
-        messages=messages,
-        temperature=0.0,  # Zero temperature for maximum accuracy
-        max_tokens=8000
-    )
 
-    raw_output = response.choices[0].message.content or ""
+    return {
+        "model": model_to_use,
+        "messages": messages,
+        "response_format": _response_format(),
+        "temperature": 0.0,  # Zero temperature for maximum accuracy
+        "max_tokens": 8000,
+    }
+
+
+def _build_text_request(text: str) -> dict:
+    """
+    Llamada solo con texto (sin imágenes) para PDFs digitales que el parser no
+    reconoce; si el texto trae títulos de panel, con el prompt compacto.
+    """
+    text = text[:TEXT_MAX_CHARS]
+    names = _compact_names(text)
+    return {
+        "model": TEXT_MODEL,
+        "messages": [
+            {"role": "system", "content": _lab_prompt(names)},
+            {
+                "role": "user",
+                "content": "Texto extraído de un reporte de laboratorio clínico; extrae los analitos:\n\n" + text,
+            },
+        ],
+        "response_format": _response_format(names),
+        "temperature": 0.0,
+        "max_tokens": 4000,
+    }
+
 
+def _load_model_json(raw_output: str) -> Optional[dict]:
+    """
+    El objeto JSON de la respuesta del modelo, o None. Si no es JSON válido (texto
+    alrededor, comas colgantes, respuesta cortada) se repara localmente con
+    lab_json.repair_json en lugar de descartarla.
+    """
     try:
         data = json.loads(raw_output)
     except json.JSONDecodeError:
-        match = re.search(r"\{.*\}", raw_output, re.DOTALL)
-        if match:
-            try:
-                data = json.loads(match.group(0))
-            except json.JSONDecodeError:
-                data = {"analitos": [], "tipo_estudio": "documento_medico"}
-        else:
-            data = {"analitos": [], "tipo_estudio": "documento_medico"}
+        data = repair_json(raw_output)
+        if isinstance(data, dict):
+            print(f"[ocr] JSON reparado localmente ({len(data.get('analitos') or [])} analitos)")
+    return data if isinstance(data, dict) else None
+
+
+def _parse_ocr_output(raw_output: str, filename: str, source: str = "vision") -> dict:
+    """Interpreta la respuesta del modelo y arma el resultado para la BD / gráficas."""
+    data = _load_model_json(raw_output)
+    if data is None:
+        data = {"analitos": [], "tipo_estudio": "documento_medico"}
+    return _build_result(data, filename, raw_output, source)
+
+
+def _process_analyte(analyte) -> Optional[dict]:
+    """Un analito del modelo con el nombre, la unidad y los rangos de la tabla; None si no está en ella."""
+    if not isinstance(analyte, dict):
+        return None
+    analyte_info = get_analyte_info(analyte.get("nombre") or "")
+    if not analyte_info:
+        return None
+    return {
+        "nombre": analyte_info["name"],
+        "valor": analyte.get("valor"),
+        "unidad": analyte_info.get("unit") or analyte.get("unidad", ""),
+        "observaciones": analyte.get("observaciones"),
+        "rango_normal": analyte_info.get("normal"),
+        "riesgo_moderado": analyte_info.get("moderate_risk"),
+        "riesgo_elevado": analyte_info.get("high_risk"),
+    }
 
+
+def _build_result(
+    data: dict, filename: str, raw_output: Optional[str], source: str, layout: Optional[str] = None
+) -> dict:
+    """
+    Arma el resultado para la BD / gráficas a partir de los datos en la forma del
+    JSON del modelo. `source`: "layout" (perfil del laboratorio), "text_layer"
+    (parser genérico), "text_model", "vision" o "page_filter" (ninguna página con
+    resultados); `layout`: clave del perfil usado.
+    """
     if "analitos" not in data or not isinstance(data["analitos"], list):
         data["analitos"] = []
     
     if not data.get("tipo_estudio"):
         data["tipo_estudio"] = "laboratorio" if data["analitos"] else "estudio_imagen"
 
-    raw_processed = []
-    for analyte in data["analitos"]:
-        analyte_info = get_analyte_info(analyte.get("nombre", ""))
-        if analyte_info:
-            name = analyte_info["name"]
-            processed_analyte = {
-                "nombre": name,
-                "valor": analyte.get("valor"),
-                "unidad": analyte_info.get("unit") or analyte.get("unidad", ""),
-                "observaciones": analyte.get("observaciones"),
-                "rango_normal": analyte_info.get("normal"),
-                "riesgo_moderado": analyte_info.get("moderate_risk"),
-                "riesgo_elevado": analyte_info.get("high_risk"),
-            }
-            raw_processed.append(processed_analyte)
-    
+    raw_processed = [a for a in map(_process_analyte, data["analitos"]) if a is not None]
+
     processed_analytes = _validate_and_correct_cbc(raw_processed)
     data["analitos"] = processed_analytes
 
@@ -316,4 +610,652 @@ def ocr_and_extract_labs(file_bytes: bytes, filename: str):
         "parsed": data,
         "export_json": export_data,
         "raw_model_output": raw_output,
+        "source": source,
+        "layout": layout,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Visión por páginas
+# ---------------------------------------------------------------------------
+
+
+def _page_groups(pages: Iterator[Tuple[int, str]]) -> Iterator[Tuple[List[int], List[str]]]:
+    """(páginas, data URLs) en grupos de FANOUT_PAGES_PER_REQUEST, conforme se rasterizan."""
+    numbers: List[int] = []
+    group: List[str] = []
+    for page, data_url in pages:
+        numbers.append(page)
+        group.append(data_url)
+        if len(group) == FANOUT_PAGES_PER_REQUEST:
+            yield numbers, group
+            numbers, group = [], []
+    if group:
+        yield numbers, group
+
+
+def _pages_label(pages: List[int]) -> str:
+    if len(pages) == 1:
+        return f"página {pages[0]}"
+    if pages == list(range(pages[0], pages[-1] + 1)):
+        return f"páginas {pages[0]}-{pages[-1]}"
+    return "páginas " + ", ".join(map(str, pages))
+
+
+def _build_page_request(data_urls: List[str], pages: List[int]) -> dict:
+    """Solicitud de visión para un grupo de páginas; el prompt es el mismo que el del PDF completo."""
+    label = _pages_label(pages)
+    pages_text = f"la {label}" if len(pages) == 1 else f"las {label}"
+    content = [{
+        "type": "text",
+        "text": (
+            f"Analiza {pages_text} de un reporte de laboratorio clínico y extrae los analitos. "
+            "Si en estas páginas no hay analitos, devuelve \"analitos\": []."
+        ),
+    }]
+    content += [{"type": "image_url", "image_url": {"url": url}} for url in data_urls]
+    return {
+        "model": "gpt-4o",
+        "messages": [
+            {"role": "system", "content": _lab_prompt()},
+            {"role": "user", "content": content},
+        ],
+        "response_format": _response_format(),
+        "temperature": 0.0,
+        "max_tokens": 4000,
+    }
+
+
+def _analyte_key(analyte: dict) -> str:
+    info = get_analyte_info(str(analyte.get("nombre") or ""))
+    return info["name"] if info else str(analyte.get("nombre") or "").strip().casefold()
+
+
+def _most_common(values: List[Optional[str]]) -> Optional[str]:
+    """El valor que más se repite entre páginas (sin mayúsculas ni espacios extra); empate: el de la primera."""
+    present = [" ".join(v.split()) for v in values if isinstance(v, str) and v.strip()]
+    if not present:
+        return None
+    counts = Counter(v.casefold() for v in present)
+    best = max(counts.values())
+    return next(v for v in present if counts[v.casefold()] == best)
+
+
+def _merge_pages(parts: List[Tuple[int, dict]]) -> dict:
+    """
+    Une los JSON de cada grupo de páginas en uno con la forma del modelo, siempre
+    igual sin importar el orden en que terminaron las solicitudes:
+    - analitos en orden de página; si uno se repite (p. ej. la hoja de resumen de
+      resultados fuera de rango) queda la primera aparición con valor
+    - paciente, laboratorio y fecha: el valor más repetido entre páginas
+    - nombre del estudio: los distintos, en orden de página
+    """
+    parts = sorted(parts, key=lambda part: part[0])
+    analytes: Dict[str, dict] = {}
+    for _, data in parts:
+        for analyte in data.get("analitos") or []:
+            if not isinstance(analyte, dict):
+                continue
+            key = _analyte_key(analyte)
+            if key not in analytes or (analytes[key].get("valor") is None and analyte.get("valor") is not None):
+                analytes[key] = analyte
+
+    studies: List[str] = []
+    for _, data in parts:
+        name = data.get("nombre_estudio")
+        if isinstance(name, str) and name.strip() and name.strip() not in studies:
+            studies.append(name.strip())
+
+    merged_analytes = list(analytes.values())
+    types = [data.get("tipo_estudio") for _, data in parts if data.get("tipo_estudio")]
+    return {
+        "tipo_estudio": "laboratorio" if merged_analytes else _most_common(types),
+        "nombre_estudio": " / ".join(studies) or None,
+        "nombre_paciente": _most_common([data.get("nombre_paciente") for _, data in parts]),
+        "nombre_laboratorio": _most_common([data.get("nombre_laboratorio") for _, data in parts]),
+        "fecha_estudio": _most_common([data.get("fecha_estudio") for _, data in parts]),
+        "analitos": merged_analytes,
+    }
+
+
+
+
+def _no_lab_pages_result(filename: str, report: dict) -> dict:
+    """Ninguna página pasó el filtro de lab_pages.py: se responde sin llamar al modelo."""
+    print(f"[ocr] {filename}: ninguna de sus {report['total']} páginas trae resultados; no se llama al modelo")
+    result = _build_result({"analitos": [], "tipo_estudio": "documento_medico"}, filename, None, "page_filter")
+    result["pages"] = {**summarize(report["classified"], report["total"]), "failed": []}
+    return result
+
+
+def _fanout_result(
+    filename: str,
+    report: dict,
+    parts: List[Tuple[int, dict]],
+    raws: List[Tuple[int, str]],
+    failed: List[int],
+) -> dict:
+    if not parts:
+        raise RuntimeError(f"Falló el OCR de todas las páginas de {filename}.")
+    raw_output = "\n\n".join(raw for _, raw in sorted(raws))
+    result = _build_result(_merge_pages(parts), filename, raw_output, "vision")
+    result["pages"] = {**summarize(report["classified"], report["total"]), "failed": sorted(failed)}
+    return result
+
+
+def _collect_page(
+    filename: str,
+    pages: List[int],
+    outcome,
+    parts: List[Tuple[int, dict]],
+    raws: List[Tuple[int, str]],
+    failed: List[int],
+) -> Optional[dict]:
+    """Acumula la respuesta de un grupo (o su error) y devuelve su JSON, o None si falló."""
+    if isinstance(outcome, BaseException):
+        print(f"[ocr] {filename}: {_pages_label(pages)} sin resultado: {outcome}")
+        failed.extend(pages)
+        return None
+    data, raw = outcome
+    parts.append((pages[0], data))
+    raws.append((pages[0], raw))
+    return data
+
+
+def _page_results(
+    client, file_bytes: bytes, report: dict, texts: Optional[List[str]] = None
+) -> Iterator[Tuple[List[int], object]]:
+    """
+    (páginas, (JSON, texto) o error) de cada grupo, en el orden en que terminan:
+    cada grupo se manda en cuanto se rasteriza y los que ya respondieron se
+    entregan sin esperar a los demás.
+    """
+    done: "queue.Queue[Tuple[List[int], Future]]" = queue.Queue()
+    submitted = delivered = 0
+    with ThreadPoolExecutor(max_workers=FANOUT_CONCURRENCY, thread_name_prefix="ocr-page") as pool:
+        for pages, group in _page_groups(_iter_pdf_images(file_bytes, report, texts)):
+            future = pool.submit(_call_page_group, client, group, pages)
+            future.add_done_callback(lambda f, pages=pages: done.put((pages, f)))
+            submitted += 1
+            while not done.empty():
+                pages_done, finished = done.get_nowait()
+                delivered += 1
+                yield pages_done, finished.exception() or finished.result()
+        while delivered < submitted:
+            pages_done, finished = done.get()
+            delivered += 1
+            yield pages_done, finished.exception() or finished.result()
+
+
+async def _page_results_async(client, file_bytes: bytes, report: dict, texts: Optional[List[str]] = None):
+    """
+    Versión asíncrona de `_page_results`: un hilo rasteriza y pasa cada grupo por
+    una asyncio.Queue, y la solicitud de cada grupo arranca en cuanto el grupo
+    está completo, mientras se rasterizan los siguientes. Entrega los grupos en
+    el orden en que terminan.
+    """
+    loop = asyncio.get_running_loop()
+    groups: asyncio.Queue = asyncio.Queue()
+    done: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(FANOUT_CONCURRENCY)
+
+    def produce() -> None:
+        try:
+            for item in _page_groups(_iter_pdf_images(file_bytes, report, texts)):
+                loop.call_soon_threadsafe(groups.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(groups.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(groups.put_nowait, None)
+
+    async def run(pages: List[int], group: List[str]) -> None:
+        async with semaphore:
+            try:
+                outcome = await _call_page_group_async(client, group, pages)
+            except Exception as e:
+                outcome = e
+        done.put_nowait((pages, outcome))
+
+    producer = asyncio.ensure_future(asyncio.to_thread(produce))
+    tasks: List[asyncio.Task] = []
+    delivered = 0
+    try:
+        while True:
+            item = await groups.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            tasks.append(asyncio.ensure_future(run(*item)))
+            while not done.empty():
+                delivered += 1
+                yield done.get_nowait()
+        while delivered < len(tasks):
+            delivered += 1
+            yield await done.get()
+    finally:
+        # Solo queda algo pendiente si quien consume dejó de leer (o falló el rasterizado)
+        for task in tasks:
+            task.cancel()
+        await producer
+
+
+def _pages_result(
+    filename: str,
+    report: dict,
+    parts: List[Tuple[int, dict]],
+    raws: List[Tuple[int, str]],
+    failed: List[int],
+) -> dict:
+    if not parts and not failed:
+        if report.get("classified"):
+            return _no_lab_pages_result(filename, report)
+        raise ValueError("No se pudo convertir el PDF a imágenes.")
+    return _fanout_result(filename, report, parts, raws, failed)
+
+
+def _read_text_layer(file_bytes: bytes, filename: str) -> Optional[List[str]]:
+    """
+    Capa de texto de un PDF, leída una sola vez por solicitud: la usan tanto
+    `_try_text_layer` como la clasificación de páginas de visión (`_plan_pages`).
+    None si no es PDF o ninguna de las dos la necesita; [] si no se pudo leer.
+    """
+    if not (TEXT_LAYER_ENABLED or PAGE_FILTER_ENABLED) or Path(filename or "").suffix.lower() != ".pdf":
+        return None
+    try:
+        return _read_pdf_pages(file_bytes)
+    except Exception as e:
+        print(f"[ocr] No pude leer la capa de texto de {filename}: {e}")
+        return []
+
+
+def _try_text_layer(pages: Optional[List[str]], filename: str) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Primera etapa para PDFs: la capa de texto (`pages`, de `_read_text_layer`).
+    Devuelve (resultado, texto):
+    - (resultado, None): un perfil de lab_layouts.py reconoció el formato del laboratorio,
+      o el parser genérico reconoció suficientes analitos; sin llamar a ningún modelo
+    - (None, texto): hay texto utilizable; basta el modelo de texto
+    - (None, None): es un escaneo (o no es PDF); hace falta visión
+    """
+    if not TEXT_LAYER_ENABLED or not pages:
+        return None, None
+    if not text_layer_ok(pages):
+        return None, None
+
+    matched = extract_with_profile(pages)
+    if matched is not None:
+        profile, data = matched
+        print(f"[ocr] {filename}: {len(data['analitos'])} analitos con el perfil '{profile.key}' (sin modelo)")
+        return _build_result(data, filename, None, "layout", layout=profile.key), None
+
+    data = extract_from_text(pages)
+    if len(data["analitos"]) >= TEXT_MIN_ANALYTES:
+        print(f"[ocr] {filename}: {len(data['analitos'])} analitos desde la capa de texto (sin modelo)")
+        return _build_result(data, filename, None, "text_layer"), None
+    return None, "\n\n".join(pages)
+
+
+def _cache_key(file_bytes: bytes, use_cache: bool):
+    if not (use_cache and OCR_CACHE_ENABLED):
+        return None
+    return ocr_cache_key(file_bytes, OCR_PROMPT_VERSION, ANALYTE_TABLE_VERSION)
+
+
+def _from_cache(key, filename: str):
+    """Resultado guardado para el mismo archivo, con el nombre de esta subida."""
+    if key is None:
+        return None
+    result = OCR_CACHE.get(key)
+    if result is None:
+        return None
+    print(f"[ocr] Resultado desde caché para {filename}")
+    result.update(filename=filename, cached=True)
+    return result
+
+
+def _store(key, result: dict) -> dict:
+    result["cached"] = False
+    # Sin analitos suele ser una mala lectura: no se guarda, para que volver a subir el archivo lo reintente
+    if key is not None and result["parsed"]["analitos"]:
+        OCR_CACHE.put(key, {k: v for k, v in result.items() if k not in ("filename", "cached")})
+    return result
+
+
+def _stream_analytes(parser: AnalyteStreamParser, chunk) -> List[dict]:
+    """Analitos (ya con nombre y rangos de la tabla) que se completaron con un fragmento del stream."""
+    delta = chunk.choices[0].delta.content if chunk.choices else None
+    return [a for a in map(_process_analyte, parser.feed(delta)) if a is not None]
+
+
+def _new_analytes(data: Optional[dict], seen: set) -> List[dict]:
+    """
+    Analitos con valor de una página que ninguna página anterior (en orden de
+    llegada) ya adelantó; uno sin valor puede venir completo en otra página.
+    """
+    fresh = []
+    for analyte in (data or {}).get("analitos") or []:
+        processed = _process_analyte(analyte)
+        if processed is not None and processed["valor"] is not None and processed["nombre"] not in seen:
+            seen.add(processed["nombre"])
+            fresh.append(processed)
+    return fresh
+
+
+
+# ---------------------------------------------------------------------------
+# Etapas como pasos: una sola secuencia para las versiones sync, async y stream
+# ---------------------------------------------------------------------------
+#
+# Los generadores `_*_steps` describen el OCR sin hacer E/S: producen pasos
+# (trabajo bloqueante, una solicitud al modelo, una espera, el siguiente grupo
+# de páginas de visión), reciben su resultado con `send` (o el error con
+# `throw`) y regresan el resultado final. También producen eventos
+# ("analito", {...}) para quien consume el stream. `_drive` los ejecuta con el
+# cliente síncrono y `_drive_async` con el asíncrono.
+
+
+@dataclass
+class _Blocking:
+    """CPU o disco (caché, capa de texto, rasterizado): en async corre en un hilo."""
+
+    fn: Callable
+    args: tuple
+
+
+@dataclass
+class _ModelRequest:
+    """Una solicitud a chat.completions; el paso recibe el texto de la respuesta."""
+
+    params: dict
+
+
+@dataclass
+class _Sleep:
+    seconds: float
+
+
+@dataclass
+class _NextPage:
+    """El siguiente grupo de páginas que terminó: (páginas, (JSON, texto) o error), o None al acabar."""
+
+    file_bytes: bytes
+    report: dict
+    texts: Optional[List[str]]
+
+
+def _page_group_steps(data_urls: List[str], pages: List[int]):
+    """Una solicitud por grupo, reintentada sola si falla; los demás grupos no se repiten."""
+    params = _build_page_request(data_urls, pages)
+    for attempt in range(FANOUT_RETRIES + 1):
+        try:
+            raw = yield _ModelRequest(params)
+            data = _load_model_json(raw)
+            if data is not None:
+                return data, raw
+            error: Exception = ValueError("la respuesta no es JSON")
+        except Exception as e:
+            error = e
+        print(f"[ocr] {_pages_label(pages)}: intento {attempt + 1} falló ({error})")
+        if attempt < FANOUT_RETRIES:
+            yield _Sleep(0.5 * 2 ** attempt)
+    raise error
+
+
+def _pdf_pages_steps(file_bytes: bytes, filename: str, texts: Optional[List[str]] = None):
+    """
+    Visión por grupos de páginas en paralelo: cada grupo se manda en cuanto se
+    rasteriza, así que el tiempo total se acerca al de la página más lenta. Los
+    analitos nuevos de cada página salen como eventos en cuanto esta termina.
+    """
+    report: dict = {}
+    parts: List[Tuple[int, dict]] = []
+    raws: List[Tuple[int, str]] = []
+    failed: List[int] = []
+    seen: set = set()
+    while True:
+        item = yield _NextPage(file_bytes, report, texts)
+        if item is None:
+            break
+        pages, outcome = item
+        for analyte in _new_analytes(_collect_page(filename, pages, outcome, parts, raws, failed), seen):
+            yield "analito", analyte
+    return _pages_result(filename, report, parts, raws, failed)
+
+
+def _single_request_steps(file_bytes: bytes, filename: str, texts: Optional[List[str]]):
+    """Todo el archivo en una sola solicitud de visión (imágenes sueltas, o PDFs con EVITY_OCR_FANOUT=0)."""
+    report: dict = {}
+    params = yield _Blocking(_build_ocr_request, (file_bytes, filename, report, texts))
+    if params is None:
+        return _no_lab_pages_result(filename, report)
+    raw = yield _ModelRequest(params)
+    result = _parse_ocr_output(raw, filename)
+    if report:
+        result["pages"] = {**summarize(report["classified"], report["total"]), "failed": []}
+    return result
+
+
+def _announce(result: dict):
+    """Resultado que no salió del modelo (caché, capa de texto): todos sus analitos de una vez."""
+    for analyte in result["parsed"]["analitos"]:
+        yield "analito", analyte
+    return result
+
+
+def _ocr_steps(file_bytes: bytes, filename: str, use_cache: bool):
+    """caché → capa de texto (perfil o parser genérico) → modelo de texto → visión → caché."""
+    key = _cache_key(file_bytes, use_cache)
+    cached = yield _Blocking(_from_cache, (key, filename))
+    if cached is not None:
+        return (yield from _announce(cached))
+
+    texts = yield _Blocking(_read_text_layer, (file_bytes, filename))
+    result, text = yield _Blocking(_try_text_layer, (texts, filename))
+    if result is not None:
+        result = yield _Blocking(_store, (key, result))
+        return (yield from _announce(result))
+
+    if text is not None:
+        raw = yield _ModelRequest(_build_text_request(text))
+        result = _parse_ocr_output(raw, filename, "text_model")
+    elif FANOUT_ENABLED and Path(filename or "").suffix.lower() == ".pdf":
+        result = yield from _pdf_pages_steps(file_bytes, filename, texts)
+    else:
+        result = yield from _single_request_steps(file_bytes, filename, texts)
+    return (yield _Blocking(_store, (key, result)))
+
+
+def _drive(steps, client_fn: Callable, stream: bool = False) -> Iterator[Tuple[str, object]]:
+    """
+    Ejecuta `steps` con llamadas bloqueantes. Entrega sus eventos (y con
+    `stream`, un ("analito", ...) por cada objeto que el modelo termina de
+    escribir) y al final ("result", lo que regresó `steps`). El cliente se pide
+    a `client_fn` solo si algún paso llama al modelo.
+    """
+    client = None
+    page_results = None
+    advance, value = steps.send, None
+    try:
+        while True:
+            try:
+                step = advance(value)
+            except StopIteration as stop:
+                yield "result", stop.value
+                return
+            advance, value = steps.send, None
+            if isinstance(step, tuple):
+                yield step
+                continue
+            try:
+                if isinstance(step, _Blocking):
+                    value = step.fn(*step.args)
+                elif isinstance(step, _Sleep):
+                    time.sleep(step.seconds)
+                else:
+                    client = client or client_fn()
+                    if isinstance(step, _NextPage):
+                        if page_results is None:
+                            page_results = _page_results(client, step.file_bytes, step.report, step.texts)
+                        value = next(page_results, None)
+                    elif stream:
+                        parser = AnalyteStreamParser()
+                        for chunk in client.chat.completions.create(**step.params, stream=True):
+                            for analyte in _stream_analytes(parser, chunk):
+                                yield "analito", analyte
+                        value = parser.text
+                    else:
+                        response = client.chat.completions.create(**step.params)
+                        value = response.choices[0].message.content or ""
+            except Exception as e:
+                advance, value = steps.throw, e
+    finally:
+        if page_results is not None:
+            page_results.close()
+
+
+async def _drive_async(steps, client_fn: Callable, stream: bool = False):
+    """
+    Versión asíncrona de `_drive` (mismos eventos): el trabajo bloqueante corre
+    en hilos y la espera al modelo no ocupa ninguno.
+    """
+    client = None
+    page_results = None
+    advance, value = steps.send, None
+    try:
+        while True:
+            try:
+                step = advance(value)
+            except StopIteration as stop:
+                yield "result", stop.value
+                return
+            advance, value = steps.send, None
+            if isinstance(step, tuple):
+                yield step
+                continue
+            try:
+                if isinstance(step, _Blocking):
+                    value = await asyncio.to_thread(step.fn, *step.args)
+                elif isinstance(step, _Sleep):
+                    await asyncio.sleep(step.seconds)
+                else:
+                    client = client or client_fn()
+                    if isinstance(step, _NextPage):
+                        if page_results is None:
+                            page_results = _page_results_async(client, step.file_bytes, step.report, step.texts)
+                        value = await page_results.__anext__()
+                    elif stream:
+                        parser = AnalyteStreamParser()
+                        async for chunk in await client.chat.completions.create(**step.params, stream=True):
+                            for analyte in _stream_analytes(parser, chunk):
+                                yield "analito", analyte
+                        value = parser.text
+                    else:
+                        response = await client.chat.completions.create(**step.params)
+                        value = response.choices[0].message.content or ""
+            except StopAsyncIteration:
+                value = None
+            except Exception as e:
+                advance, value = steps.throw, e
+    finally:
+        if page_results is not None:
+            await page_results.aclose()
+
+
+def _final(events: Iterator[Tuple[str, object]]):
+    """Lo que trae el último evento ("result", ...)."""
+    data = None
+    for _, data in events:
+        pass
+    return data
+
+
+async def _final_async(events):
+    data = None
+    async for _, data in events:
+        pass
+    return data
+
+
+def _call_page_group(client, data_urls: List[str], pages: List[int]) -> Tuple[dict, str]:
+    return _final(_drive(_page_group_steps(data_urls, pages), lambda: client))
+
+
+async def _call_page_group_async(client, data_urls: List[str], pages: List[int]) -> Tuple[dict, str]:
+    return await _final_async(_drive_async(_page_group_steps(data_urls, pages), lambda: client))
+
+
+def _ocr_pdf_pages(client, file_bytes: bytes, filename: str, texts: Optional[List[str]] = None) -> dict:
+    return _final(_drive(_pdf_pages_steps(file_bytes, filename, texts), lambda: client))
+
+
+async def _ocr_pdf_pages_async(
+    client, file_bytes: bytes, filename: str, texts: Optional[List[str]] = None
+) -> dict:
+    return await _final_async(_drive_async(_pdf_pages_steps(file_bytes, filename, texts), lambda: client))
+
+
+# ---------------------------------------------------------------------------
+# Entradas públicas
+# ---------------------------------------------------------------------------
+
+
+def ocr_and_extract_labs(file_bytes: bytes, filename: str, use_cache: bool = True):
+    """
+    Procesa un archivo de laboratorio (PDF o imagen) y devuelve
+    un dict con datos listos para la BD / gráficas.
+
+    En PDFs digitales se lee primero la capa de texto: si se reconocen los
+    analitos no se llama a ningún modelo, y si no, basta un modelo de texto.
+    Visión (imágenes de cada página) queda para escaneos e imágenes; en PDFs
+    solo se mandan las páginas que lab_pages.py clasifica como resultados, una
+    solicitud por página, en paralelo, y se unen los resultados. `"pages"` trae
+    la decisión de cada página (`classified`), las que se mandaron (`sent`) y
+    las que fallaron aun después de reintentarlas (`failed`).
+
+    Si el mismo archivo ya se procesó (mismo contenido, prompt y tabla de
+    analitos), devuelve el resultado guardado sin llamar al modelo
+    (`"cached": true`). `use_cache=False` fuerza el OCR.
+
+    Devuelve algo tipo:
+    {
+      "analitos": [
+        {"nombre": "Glucosa", "valor": 90, "unidad": "mg/dL", "fecha": "2024-01-10"},
+        ...
+      ]
     }
+    """
+    # Cliente compartido (pool de conexiones y timeout/reintentos para OCR)
+    return _final(_drive(_ocr_steps(file_bytes, filename, use_cache), lambda: get_openai_client("ocr")))
+
+
+async def ocr_and_extract_labs_async(file_bytes: bytes, filename: str, use_cache: bool = True):
+    """
+    Versión asíncrona de `ocr_and_extract_labs` (mismo resultado y misma caché).
+    La conversión del PDF y la caché corren en hilos; la espera al modelo no ocupa ninguno.
+    """
+    steps = _ocr_steps(file_bytes, filename, use_cache)
+    return await _final_async(_drive_async(steps, lambda: get_async_openai_client("ocr")))
+
+
+def ocr_and_extract_labs_stream(
+    file_bytes: bytes, filename: str, use_cache: bool = True
+) -> Iterator[Tuple[str, dict]]:
+    """
+    Igual que `ocr_and_extract_labs`, pero como eventos (evento, datos):
+    - ("analito", {...}) por cada analito en cuanto el modelo cierra su objeto;
+      en PDFs por páginas, al terminar cada página (sin repetir analitos)
+    - ("result", resultado) al final, el mismo dict que `ocr_and_extract_labs`
+
+    El resultado final es el que cuenta: la validación de la biometría y la unión
+    de páginas pueden corregir o descartar lo que se adelantó.
+    """
+    steps = _ocr_steps(file_bytes, filename, use_cache)
+    yield from _drive(steps, lambda: get_openai_client("ocr"), stream=True)
+
+
+async def ocr_and_extract_labs_stream_async(file_bytes: bytes, filename: str, use_cache: bool = True):
+    """Versión asíncrona de `ocr_and_extract_labs_stream` (mismos eventos)."""
+    steps = _ocr_steps(file_bytes, filename, use_cache)
+    async for event in _drive_async(steps, lambda: get_async_openai_client("ocr"), stream=True):
+        yield event
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+lab_pages.py
+
+Clasificación local de páginas antes de mandarlas al modelo de visión.
+- Muchos PDFs traen portada, avisos, hoja de firmas o la interpretación de un
+  estudio de imagen: cada página de esas es una imagen más que se paga en
+  tokens y en latencia sin aportar ningún analito
+- Si la página tiene capa de texto, se buscan nombres de analitos (tabla de
+  analyte_ranges.py) y números; sin texto (escaneo), se mira la imagen ya
+  rasterizada: cuánta tinta tiene y cuántos renglones de texto
+- Cada decisión queda en la respuesta (`pages.classified`) con su motivo
+
+Es deliberadamente conservador: ante la duda la página se manda.
+"""
+
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from lab_text import mentioned_analytes, parse_number
+
+# `EVITY_OCR_PAGE_FILTER=0` manda todas las páginas (hasta EVITY_OCR_MAX_PAGES)
+PAGE_FILTER_ENABLED = os.getenv("EVITY_OCR_PAGE_FILTER", "1") != "0"
+# Nombres de analitos distintos para considerar que una página con texto trae resultados
+MIN_ANALYTE_HITS = int(os.getenv("EVITY_OCR_PAGE_MIN_ANALYTES", "2"))
+# Renglones de texto (en la imagen) por debajo de los cuales un escaneo es portada o firma
+MIN_TEXT_LINES = int(os.getenv("EVITY_OCR_PAGE_MIN_LINES", "8"))
+# Menos texto que esto en la capa de texto: la página se juzga por su imagen
+MIN_TEXT_CHARS = 200
+# Fracción de pixeles oscuros por debajo de la cual la página está en blanco
+MIN_INK = 0.002
+# Ancho al que se reduce la imagen para medirla: unos 50 DPI en carta, basta para contar renglones
+_PROBE_WIDTH = 425
+
+
+def classify_text(page: int, text: str) -> Optional[Dict]:
+    """
+    Decisión para una página con capa de texto, o None si casi no trae texto
+    (escaneo) y hay que juzgarla por la imagen.
+    """
+    if len(text.strip()) < MIN_TEXT_CHARS:
+        return None
+    hits = len(mentioned_analytes(text))
+    numbers = sum(1 for token in text.split() if parse_number(token) is not None)
+    lab = hits >= MIN_ANALYTE_HITS
+    return {
+        "page": page,
+        "decision": "lab" if lab else "skip",
+        "reason": "analitos en la capa de texto" if lab else "la capa de texto no nombra analitos",
+        "by": "text",
+        "analyte_hits": hits,
+        "numbers": numbers,
+    }
+
+
+def image_features(img: Image.Image) -> Dict:
+    """Tinta (fracción de pixeles oscuros) y renglones de texto de una página rasterizada."""
+    gray = img if img.mode == "L" else img.convert("L")
+    if gray.width > _PROBE_WIDTH:
+        gray = gray.resize((_PROBE_WIDTH, max(1, round(gray.height * _PROBE_WIDTH / gray.width))), Image.BOX)
+    dark = np.asarray(gray, dtype=np.uint8) < 160
+    ink = float(dark.mean())
+    # Perfil horizontal: cada racha de filas con tinta es un renglón (o una línea de la tabla)
+    inked_rows = dark.mean(axis=1) > 0.01
+    edges = np.diff(inked_rows.astype(np.int8), prepend=0)
+    lines = int((edges == 1).sum())
+    return {"ink": round(ink, 4), "text_lines": lines}
+
+
+def classify_image(page: int, img: Image.Image) -> Dict:
+    """Decisión para una página sin capa de texto, a partir de la imagen ya rasterizada."""
+    features = image_features(img)
+    if features["ink"] < MIN_INK:
+        decision, reason = "skip", "página en blanco"
+    elif features["text_lines"] < MIN_TEXT_LINES:
+        decision, reason = "skip", "pocos renglones de texto (portada, firma o logotipo)"
+    else:
+        decision, reason = "lab", "renglones suficientes para una tabla de resultados"
+    return {"page": page, "decision": decision, "reason": reason, "by": "image", **features}
+
+
+def summarize(decisions: List[Dict], total: int) -> Dict:
+    """Bloque `pages` de la respuesta: páginas del PDF, las que se mandaron y por qué."""
+    decisions = sorted(decisions, key=lambda d: d["page"])
+    return {
+        "total": total,
+        "sent": [d["page"] for d in decisions if d["decision"] == "lab"],
+        "classified": decisions,
+    }
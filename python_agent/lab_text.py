@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+lab_text.py
+
+Extracción de analitos desde la capa de texto de un PDF digital, sin modelo.
+- Los reportes que salen del sistema del laboratorio traen el texto embebido:
+  leerlo cuesta milisegundos, contra segundos (y tokens) de rasterizar y usar visión
+- Cada renglón "NOMBRE  valor  unidad  referencia" se compara contra
+  PREDEFINED_ANALYTES y ANALYTE_SYNONYMS con nombres normalizados (sin acentos,
+  sin "en suero", sin paréntesis); lo que no se reconoce se ignora
+- El resultado tiene la misma forma que la respuesta JSON del modelo, así que
+  lab_ocr.py lo procesa igual (rangos, validación de la biometría, export_json)
+
+Si el PDF es un escaneo (casi sin texto) o no se reconocen suficientes
+analitos, lab_ocr.py sigue con el modelo.
+"""
+
+import re
+import unicodedata
+from typing import Dict, List, Optional, Sequence, Set
+
+from analyte_ranges import ANALYTE_NAMES, ANALYTE_SYNONYMS, PREDEFINED_ANALYTES
+
+# Nombres largos que usan los reportes (los mismos del prompt de visión) -> nombre estándar
+_LABEL_ALIASES = {
+    "volumen corpuscular medio": "VCM",
+    "volumen corpuscular": "VCM",
+    "hemoglobina corpuscular media": "HCM",
+    "concentracion media de hemoglobina corpuscular": "CHCM",
+    "concentracion media de hemoglobina corp": "CHCM",
+    "conc media de hb corpuscular": "CHCM",
+    "anchura de distribucion de eritrocitos": "RDW",
+    "volumen plaquetario medio": "VPM",
+    "nitrogeno ureico": "Urea",
+    "relacion bun/creatinina": "Ratio BUN / Creatinina",
+    "relacion a/g": "Relación albúmina/globulina",
+    "proteina total": "Proteínas totales",
+    "cloruro": "Cloro",
+    "gravedad especifica": "Densidad",
+    "reaccion ph": "pH",
+    "alanino aminotransferasa": "ALT",
+    "indice de resistencia a la insulina": "HOMA-IR",
+}
+
+# Calificativos que no cambian el analito ("CREATININA EN SUERO" = "Creatinina")
+_QUALIFIERS_RE = re.compile(r"\b(?:en suero|en sangre|en plasma|sericas?|sericos?)\b")
+_PARENS_RE = re.compile(r"\([^)]*\)")
+_NUMBER_RE = re.compile(r"^[<>≤≥]?=?(\d+(?:[.,]\d+)?|[.,]\d+)$")
+_SEPARATOR_RE = re.compile(r"^[-_=+.\s]*$")
+
+# Analitos de cada panel (nombres de PREDEFINED_ANALYTES), para el prompt compacto de lab_ocr.py
+PANEL_ANALYTES = {
+    "biometria": (
+        "Eritrocitos", "Hemoglobina", "Hematocrito", "VCM", "HCM", "CHCM", "Leucocitos", "Linfocitos",
+        "Monocitos", "Basófilos", "Eosinófilos", "Neutrófilos", "Plaquetas", "VPM",
+    ),
+    "quimica": (
+        "Glucosa", "Urea", "Creatinina", "Ratio BUN / Creatinina", "Ácido úrico", "Colesterol total",
+        "Triglicéridos", "HDL-C", "LDL-C", "Non-HDL-C", "Proteínas totales", "Albúmina", "Globulinas",
+        "Relación albúmina/globulina", "Bilirrubina", "Bilirrubina total", "ALT", "Calcio", "Fósforo",
+        "Magnesio", "Sodio", "Potasio", "Cloro", "Hierro", "Amilasa (U/L)", "Lipasa (U/L)",
+        "TFG (mL/min/1.73m²)",
+    ),
+    "lipidos": (
+        "Colesterol total", "Triglicéridos", "HDL-C", "LDL-C", "Non-HDL-C", "TC/HDL", "TG/HDL-C",
+        "Apo A1 (mg/dL)", "Apo B (mg/dL)", "Apo B/A1",
+    ),
+    "orina": (
+        "Color", "Aspecto", "Densidad", "pH", "Esterasa leucocitaria", "Nitritos", "Proteinas", "Glucosa",
+        "Cetonas", "Bilirrubina", "Urobilinógeno", "Hemoglobina en orina", "Eritrocitos/µL",
+        "Eritrocitos/CPA", "Leucocitos/µL", "Leucocitos/CPA", "Bacterias/CPA",
+        "Células epiteliales escamosas", "Células epiteliales transicionales", "Filamento mucoso",
+    ),
+    "tiroides": (
+        "TSH (ng/dL)", "T3", "T4", "T4 libre", "Captación TU", "Índice de tiroxina libre",
+        "Anticuerpos anti-tiroglobulina", "Anticuerpos antiperoxidasa tiroidea",
+    ),
+    "diabetes": ("Glucosa", "HbA1c (%)", "HOMA-IR", "Péptido C (ng/mL)"),
+}
+# Títulos de panel en el texto ya normalizado con `fold`
+_PANEL_TITLES = {
+    "biometria": re.compile(r"biometria hematica|hemograma|citometria hematica"),
+    "quimica": re.compile(r"quimica (?:clinica|sanguinea)|perfil bioquimico|quimica de \d+ elementos"),
+    "lipidos": re.compile(r"perfil (?:de )?lipid"),
+    "orina": re.compile(r"examen general de orina|urianalisis"),
+    "tiroides": re.compile(r"perfil tiroideo|funcion tiroidea"),
+    "diabetes": re.compile(r"hemoglobina glucosilada|hba1c"),
+}
+
+_MONTHS = {
+    "ene": 1, "feb": 2, "mar": 3, "abr": 4, "may": 5, "jun": 6,
+    "jul": 7, "ago": 8, "sep": 9, "oct": 10, "nov": 11, "dic": 12,
+}
+_DATE_RE = re.compile(
+    r"fecha(?:\s+de\s+(?:toma|muestra|estudio|recepci[oó]n))?\s*:?\s*"
+    r"(\d{1,2})[/-]([a-z]{3}|\d{1,2})[/-](\d{4})",
+    re.IGNORECASE,
+)
+_PATIENT_RE = re.compile(r"paciente\s*:\s*([^\n:]*[a-záéíóúñ][^\n:]*?)\s*(?:\n|$)", re.IGNORECASE)
+_PANEL_RE = re.compile(
+    r"^(BIOMETR[IÍ]A HEM[AÁ]TICA(?: COMPLETA)?|QU[IÍ]MICA CL[IÍ]NICA|QU[IÍ]MICA SANGU[IÍ]NEA|"
+    r"PERFIL [A-ZÁÉÍÓÚ ]+|EXAMEN GENERAL DE ORINA|INMUNOLOG[IÍ]A|HORMONAS)\s*$"
+)
+
+
+def fold(text: str) -> str:
+    """Minúsculas, sin acentos ni puntos y con espacios simples: 'CONC. MEDIA  (%)' -> 'conc media (%)'."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c) and c != ".")
+    return re.sub(r"\s+", " ", text).strip(" :").casefold()
+
+
+def _build_lookup() -> Dict[str, str]:
+    lookup: Dict[str, str] = {}
+    for name in ANALYTE_NAMES:
+        lookup.setdefault(fold(name), name)
+        lookup.setdefault(fold(_PARENS_RE.sub("", name)), name)
+    for synonym, name in ANALYTE_SYNONYMS.items():
+        if name in PREDEFINED_ANALYTES:
+            lookup.setdefault(fold(synonym), name)
+    for alias, name in _LABEL_ALIASES.items():
+        if name in PREDEFINED_ANALYTES:
+            lookup[fold(alias)] = name
+    return lookup
+
+
+_LOOKUP = _build_lookup()
+
+
+def resolve_label(label: str) -> Optional[str]:
+    """
+    Nombre estándar del analito para la etiqueta de un renglón, o None.
+    A diferencia de `get_analyte_info`, no acepta coincidencias parciales:
+    'HEMOGLOBINA CORPUSCULAR MEDIA' no debe leerse como 'Hemoglobina'.
+    """
+    folded = fold(label)
+    candidates = [folded, fold(_PARENS_RE.sub("", folded))]
+    candidates.append(fold(_QUALIFIERS_RE.sub("", candidates[-1])))
+    for candidate in list(candidates):
+        candidates += [candidate + "s", candidate.rstrip("s")]
+    # 'ALANINO AMINOTRANSFERASA (TGP)(ALT)': las siglas entre paréntesis también cuentan
+    candidates += [fold(inner) for inner in reversed(re.findall(r"\(([^)]*)\)", folded))]
+    for candidate in candidates:
+        if candidate in _LOOKUP:
+            return _LOOKUP[candidate]
+    return None
+
+
+def mentioned_analytes(text: str) -> Set[str]:
+    """Analitos nombrados al inicio de algún renglón ('HEMOGLOBINA 13.5 g/dL', 'GLUCOSA . . .')."""
+    found = set()
+    for line in text.splitlines():
+        tokens = []
+        for token in line.split():
+            if parse_number(token) is not None or not re.search(r"[^\W\d_]", token):
+                break
+            tokens.append(token)
+        for k in range(min(len(tokens), 6), 0, -1):
+            name = resolve_label(" ".join(tokens[:k]))
+            if name is not None:
+                found.add(name)
+                break
+    return found
+
+
+def detect_panels(text: str) -> List[str]:
+    """Paneles ("biometria", "quimica", ...) cuyo título aparece en el texto del reporte."""
+    folded = fold(text)
+    return [panel for panel, title in _PANEL_TITLES.items() if title.search(folded)]
+
+
+def parse_number(token: str) -> Optional[float]:
+    """'13.50' -> 13.5, '<3.0' -> 3.0, '1,5' -> 1.5; cualquier otra cosa -> None."""
+    match = _NUMBER_RE.match(token.strip())
+    if not match:
+        return None
+    return float(match.group(1).replace(",", "."))
+
+
+def _norm_unit(unit: str) -> str:
+    return fold(unit).replace(" ", "").replace("μ", "u").replace("µ", "u").replace("mcg", "ug")
+
+
+def unit_fits(name: str, unit: str) -> bool:
+    """
+    Descarta valores en otra unidad que la de la tabla: los diferenciales vienen en %
+    y en absolutos (la tabla guarda el %), y si el nombre fija la unidad
+    ('Vitamina D (ng/ml)') el renglón debe traer esa misma.
+    """
+    if not unit:
+        return True
+    expected = PREDEFINED_ANALYTES[name].get("unit") or ""
+    if expected == "%":
+        return unit == "%"
+    pinned = re.search(r"\(([^)]*/[^)]*)\)\s*$", name)
+    return pinned is None or _norm_unit(pinned.group(1)) == _norm_unit(unit)
+
+
+def _split_row(tokens: List[str]):
+    """(analito, valor, unidad) si el renglón es 'etiqueta valor [*] [unidad] ...', si no None."""
+    for i in range(1, len(tokens)):
+        value = parse_number(tokens[i])
+        if value is None:
+            continue
+        name = resolve_label(" ".join(tokens[:i]))
+        if name is None:
+            continue
+        rest = [t for t in tokens[i + 1 :] if t not in ("*", "**", "+")]
+        if len(rest) >= 2 and rest[0] == "-" and parse_number(rest[1]) is not None:
+            return None  # 'DENSIDAD 1.003 - 1.035' es el intervalo de referencia, no el resultado
+        unit = rest[0] if rest and parse_number(rest[0]) is None else ""
+        return name, value, unit
+    return None
+
+
+def parse_lab_lines(lines: Sequence[str]) -> List[dict]:
+    """
+    Analitos de los renglones de texto, en el formato de la respuesta del modelo.
+    Acepta el valor en el mismo renglón que la etiqueta o en el siguiente
+    (saltando líneas separadoras). Cada analito se toma una sola vez.
+    """
+    analytes: List[dict] = []
+    seen = set()
+    pending_name: Optional[str] = None
+
+    def add(name: str, value: float, unit: str) -> None:
+        if name in seen or not unit_fits(name, unit):
+            return
+        seen.add(name)
+        analytes.append({"nombre": name, "valor": value, "unidad": unit, "observaciones": None})
+
+    for line in lines:
+        if _SEPARATOR_RE.match(line):
+            continue
+        tokens = line.split()
+        row = _split_row(tokens)
+        if row is not None:
+            add(*row)
+            pending_name = None
+            continue
+        if pending_name is not None:
+            value = parse_number(tokens[0])
+            if value is not None:
+                rest = [t for t in tokens[1:] if t not in ("*", "**", "+")]
+                unit = rest[0] if rest and parse_number(rest[0]) is None else ""
+                add(pending_name, value, unit)
+                pending_name = None
+                continue
+        # Etiqueta sola: el valor puede venir en el siguiente renglón
+        pending_name = resolve_label(line)
+    return analytes
+
+
+def parse_header(text: str) -> dict:
+    """Paciente, fecha del estudio (YYYY-MM-DD) y paneles del reporte, si se encuentran."""
+    header = {"nombre_paciente": None, "fecha_estudio": None, "paneles": []}
+    match = _PATIENT_RE.search(text)
+    if match:
+        header["nombre_paciente"] = match.group(1).strip()
+    for match in _DATE_RE.finditer(text):
+        day, month, year = match.groups()
+        month_num = _MONTHS.get(month.lower()[:3]) if not month.isdigit() else int(month)
+        if month_num and 1 <= int(day) <= 31 and 1 <= month_num <= 12:
+            header["fecha_estudio"] = f"{year}-{month_num:02d}-{int(day):02d}"
+            break
+    for line in text.splitlines():
+        match = _PANEL_RE.match(line.strip())
+        if match and match.group(1) not in header["paneles"]:
+            header["paneles"].append(match.group(1))
+    return header
+
+
+def text_layer_ok(pages: Sequence[str], min_chars_per_page: int = 200) -> bool:
+    """
+    True si el PDF trae una capa de texto utilizable: la mayoría de las páginas
+    con texto y mayormente letras y números (no basura de un OCR previo).
+    """
+    if not pages:
+        return False
+    with_text = [p for p in pages if len(p.strip()) >= min_chars_per_page]
+    if len(with_text) * 2 < len(pages):
+        return False
+    # Sin espacios ni renglones separadores ('-----'), que no dicen nada de la calidad
+    chars = re.sub(r"[\s\-_=.]+", "", "".join(with_text))
+    if not chars:
+        return False
+    alnum = sum(1 for c in chars if c.isalnum())
+    return alnum / len(chars) >= 0.5
+
+
+def extract_from_text(pages: Sequence[str]) -> dict:
+    """Datos con la misma forma que el JSON que devuelve el modelo de visión."""
+    text = "\n".join(pages)
+    header = parse_header(text)
+    analytes = parse_lab_lines(text.splitlines())
+    return {
+        "tipo_estudio": "laboratorio" if analytes else "documento_medico",
+        "nombre_estudio": " / ".join(header["paneles"]) or "Estudio de laboratorio",
+        "nombre_paciente": header["nombre_paciente"],
+        "nombre_laboratorio": None,
+        "fecha_estudio": header["fecha_estudio"],
+        "analitos": analytes,
+    }
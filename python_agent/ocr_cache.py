@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ocr_cache.py
+
+Caché de resultados de OCR de laboratorios por contenido.
+- La llave es el hash (sha256) de los bytes del archivo + la versión del prompt
+  + la versión de la tabla de analitos: volver a subir el mismo PDF (o que Node
+  reintente /labs/ocr) responde al instante y sin llamar al modelo
+- Cambiar el prompt o la tabla de analitos invalida las entradas viejas sin borrarlas a mano
+- En disco se usa SQLite con tope de tamaño: al pasarse, se eliminan primero
+  las entradas usadas hace más tiempo (ver sqlite_store.py)
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from sqlite_store import SqliteLRUStore
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / "cache" / "ocr_results.sqlite3"
+
+# `EVITY_OCR_CACHE=0` desactiva la caché en todo el proceso
+OCR_CACHE_ENABLED = os.getenv("EVITY_OCR_CACHE", "1") != "0"
+
+
+def ocr_cache_key(file_bytes: bytes, prompt_version: str, table_version: str) -> str:
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    return hashlib.sha256(f"{digest}\0{prompt_version}\0{table_version}".encode("utf-8")).hexdigest()
+
+
+class OcrResultCache(SqliteLRUStore):
+    """Resultados de OCR (el JSON de /labs/ocr) en una tabla SQLite acotada por tamaño."""
+
+    TABLE = "ocr_results"
+    COLUMNS = "result TEXT NOT NULL, nbytes INTEGER NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL"
+    LAST_USED_INDEX = "idx_ocr_last_used"
+    LABEL = "OCR"
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH, max_bytes: int = 64 * 1024 * 1024):
+        super().__init__(path, max_bytes)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            conn = self._db()
+            row = conn.execute("SELECT result FROM ocr_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE ocr_results SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        blob = json.dumps(result, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            old = conn.execute("SELECT nbytes FROM ocr_results WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO ocr_results (key, result, nbytes, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now),
+            )
+            self._disk_bytes += len(blob) - (old[0] if old else 0)
+            self._evict_if_needed(conn)
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"disk_bytes": self._disk_bytes, "hits": self.hits, "misses": self.misses}
+
+
+# Caché compartida por todo el proceso
+OCR_CACHE = OcrResultCache(
+    path=Path(os.getenv("EVITY_OCR_CACHE_PATH", str(DEFAULT_CACHE_PATH))),
+    max_bytes=int(float(os.getenv("EVITY_OCR_CACHE_MAX_MB", "64")) * 1024 * 1024),
+)
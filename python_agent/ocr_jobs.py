@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ocr_jobs.py
+
+Cola de trabajos de OCR de laboratorios (POST /labs/ocr/jobs).
+- Subir el archivo responde de inmediato con un id de trabajo; el OCR corre
+  después en un pool acotado de hilos (EVITY_OCR_WORKERS por proceso)
+- Los trabajos viven en SQLite y el archivo en disco: si el proceso se cae o
+  se reinicia, los trabajos que quedaron a medias vuelven a la cola
+- Varios procesos (workers de gunicorn o hypercorn) comparten la misma cola;
+  cada trabajo lo toma uno solo
+- Las ráfagas se quedan formadas en la cola en lugar de agotar timeouts;
+  solo se rechazan si la cola pasa de EVITY_OCR_QUEUE_MAX trabajos pendientes
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from lab_ocr import ocr_and_extract_labs
+
+# Firma esperada: process_fn(file_bytes, filename, use_cache=...) -> dict (lo mismo que devuelve /labs/ocr)
+ProcessFn = Callable[..., Dict[str, Any]]
+
+DEFAULT_DB_PATH = Path(__file__).parent / "cache" / "ocr_jobs.sqlite3"
+DEFAULT_SPOOL_DIR = Path(__file__).parent / "cache" / "ocr_jobs"
+DEFAULT_WORKERS = int(os.getenv("EVITY_OCR_WORKERS", "2"))
+DEFAULT_MAX_QUEUED = int(os.getenv("EVITY_OCR_QUEUE_MAX", "500"))
+# Veces que se reintenta un trabajo cuyo proceso murió a medias (no los errores del OCR)
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("EVITY_OCR_MAX_ATTEMPTS", "3"))
+# Horas que se conservan los resultados de trabajos terminados
+DEFAULT_RETENTION_H = float(os.getenv("EVITY_OCR_JOB_RETENTION_H", "72"))
+
+_FIELDS = "id, status, filename, size, created, started, finished, attempts, error"
+
+
+class QueueFullError(RuntimeError):
+    """La cola ya tiene demasiados trabajos pendientes."""
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class OcrJobQueue:
+    """
+    Cola persistente de trabajos de OCR. Estados: queued -> running -> done | error.
+    Los hilos de trabajo se arrancan con `start()` en cada proceso que sirve tráfico
+    (no en el maestro de gunicorn: los hilos no sobreviven al fork).
+    """
+
+    def __init__(
+        self,
+        process_fn: ProcessFn,
+        path: Path = DEFAULT_DB_PATH,
+        spool_dir: Path = DEFAULT_SPOOL_DIR,
+        workers: int = DEFAULT_WORKERS,
+        max_queued: int = DEFAULT_MAX_QUEUED,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retention_s: float = DEFAULT_RETENTION_H * 3600,
+        poll_interval: float = 1.0,
+    ):
+        self.process_fn = process_fn
+        self.path = Path(path)
+        self.spool_dir = Path(spool_dir)
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.max_attempts = max(1, max_attempts)
+        self.retention_s = retention_s
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None  # la conexión no se hereda en un fork
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._pid: Optional[int] = None  # proceso donde corren los hilos
+
+    # ------------------------------------------------------------------
+    # Almacenamiento
+    # ------------------------------------------------------------------
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None or self._conn_pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Autocommit: las transacciones se abren a mano con BEGIN IMMEDIATE
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " filename TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " file_path TEXT,"
+                " created REAL NOT NULL,"
+                " started REAL,"
+                " finished REAL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " owner_pid INTEGER,"
+                " error TEXT,"
+                " result TEXT,"
+                " use_cache INTEGER NOT NULL DEFAULT 1)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "use_cache" not in columns:  # colas creadas antes de la caché de OCR
+                conn.execute("ALTER TABLE jobs ADD COLUMN use_cache INTEGER NOT NULL DEFAULT 1")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created)")
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _public(self, row: tuple) -> Dict[str, Any]:
+        job = dict(zip([f.strip() for f in _FIELDS.split(",")], row))
+        job["job_id"] = job.pop("id")
+        if job["status"] == "queued":
+            (ahead,) = self._db().execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created < ?", (job["created"],)
+            ).fetchone()
+            job["queue_position"] = ahead + 1
+        if job["finished"] and job["started"]:
+            job["duration_s"] = round(job["finished"] - job["started"], 3)
+        return job
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    def submit(self, file_bytes: bytes, filename: str, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Guarda el archivo y forma el trabajo. Devuelve su estado (status='queued').
+        `use_cache=False` se pasa tal cual a `process_fn` (forzar el OCR).
+        """
+        job_id = uuid.uuid4().hex
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        file_path = self.spool_dir / f"{job_id}{Path(filename).suffix.lower()}"
+        with self._lock:
+            conn = self._db()
+            (pending,) = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()
+            if pending >= self.max_queued:
+                raise QueueFullError(f"La cola de OCR está llena ({pending} trabajos pendientes)")
+            file_path.write_bytes(file_bytes)
+            conn.execute(
+                "INSERT INTO jobs (id, status, filename, size, file_path, created, use_cache) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, filename, len(file_bytes), str(file_path), time.time(), int(use_cache)),
+            )
+            self._purge_expired(conn)
+        self._wakeup.set()
+        print(f"[ocr-jobs] Trabajo {job_id} en cola: {filename} ({len(file_bytes)} bytes)")
+        return self.status(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado del trabajo, o None si no existe (o ya se purgó)."""
+        with self._lock:
+            row = self._db().execute(f"SELECT {_FIELDS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return self._public(row) if row else None
+
+    def result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Resultado del OCR (el mismo JSON que /labs/ocr) si el trabajo terminó bien."""
+        with self._lock:
+            row = self._db().execute(
+                "SELECT result FROM jobs WHERE id = ? AND status = 'done'", (job_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        return {s: counts.get(s, 0) for s in ("queued", "running", "done", "error")}
+
+    # ------------------------------------------------------------------
+    # Hilos de trabajo
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Arranca los hilos en este proceso (idempotente) y recupera trabajos huérfanos."""
+        with self._lock:
+            if self._pid == os.getpid() and any(t.is_alive() for t in self._threads):
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._recover_orphans(self._db())
+            self._threads = [
+                threading.Thread(target=self._worker_loop, name=f"ocr-job-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+        print(f"[ocr-jobs] {self.workers} hilos de OCR listos (pid {os.getpid()})")
+
+    def stop(self) -> None:
+        """
+        Deja de tomar trabajos y devuelve a la cola los que este proceso tenía a
+        medias, para que otro proceso (o el siguiente arranque) los termine.
+        """
+        self._stop.set()
+        self._wakeup.set()
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            conn = self._db()
+            released = conn.execute(
+                "UPDATE jobs SET status = 'queued', owner_pid = NULL, started = NULL "
+                "WHERE status = 'running' AND owner_pid = ?",
+                (os.getpid(),),
+            ).rowcount
+            self._pid = None
+        if released:
+            print(f"[ocr-jobs] {released} trabajos devueltos a la cola al apagar")
+
+    def _recover_orphans(self, conn: sqlite3.Connection) -> None:
+        """Trabajos 'running' cuyo proceso ya no existe: a la cola, o a error si ya se reintentaron demasiado."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, owner_pid, attempts FROM jobs WHERE status = 'running'"
+            ).fetchall()
+            requeued = failed = 0
+            for job_id, owner_pid, attempts in rows:
+                if owner_pid != os.getpid() and _pid_alive(owner_pid):
+                    continue
+                if attempts >= self.max_attempts:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'error', finished = ?, owner_pid = NULL, error = ? WHERE id = ?",
+                        (time.time(), f"El proceso se interrumpió {attempts} veces procesando el archivo", job_id),
+                    )
+                    failed += 1
+                else:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', owner_pid = NULL, started = NULL WHERE id = ?",
+                        (job_id,),
+                    )
+                    requeued += 1
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if requeued or failed:
+            print(f"[ocr-jobs] Trabajos interrumpidos: {requeued} devueltos a la cola, {failed} marcados con error")
+
+    def _claim(self) -> Optional[tuple]:
+        """Toma el trabajo más antiguo de la cola. BEGIN IMMEDIATE evita que dos procesos tomen el mismo."""
+        with self._lock:
+            conn = self._db()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, filename, file_path, use_cache FROM jobs "
+                    "WHERE status = 'queued' ORDER BY created LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', started = ?, owner_pid = ?, attempts = attempts + 1 "
+                        "WHERE id = ?",
+                        (time.time(), os.getpid(), row[0]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return row
+
+    def _finish(self, job_id: str, file_path: Optional[str], result=None, error: Optional[str] = None) -> None:
+        # Si el trabajo se devolvió a la cola (stop) y otro proceso lo tomó, no se pisa su estado
+        # ni se borra su archivo: ese proceso todavía lo va a leer
+        with self._lock:
+            updated = self._db().execute(
+                "UPDATE jobs SET status = ?, finished = ?, owner_pid = NULL, result = ?, error = ?, file_path = NULL "
+                "WHERE id = ? AND status = 'running' AND owner_pid = ?",
+                (
+                    "error" if error is not None else "done",
+                    time.time(),
+                    json.dumps(result, ensure_ascii=False) if result is not None else None,
+                    error,
+                    job_id,
+                    os.getpid(),
+                ),
+            ).rowcount
+        if updated != 1:
+            print(f"[ocr-jobs] Trabajo {job_id} ya no es de este proceso (se devolvió a la cola); no se guarda el resultado")
+            return
+        if file_path:
+            Path(file_path).unlink(missing_ok=True)
+
+    def _worker_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"[ocr-jobs] ⚠️ Error leyendo la cola: {e}")
+                job = None
+            if job is None:
+                # Se despierta al formar un trabajo en este proceso; los de otros procesos se ven al sondear
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            job_id, filename, file_path, use_cache = job
+            start = time.perf_counter()
+            try:
+                file_bytes = Path(file_path).read_bytes()
+                result = self.process_fn(file_bytes, filename, use_cache=bool(use_cache))
+            except Exception as e:
+                print(f"[ocr-jobs] ⚠️ Trabajo {job_id} con error: {e}")
+                self._finish(job_id, file_path, error=str(e))
+                continue
+            self._finish(job_id, file_path, result=result)
+            print(f"[ocr-jobs] Trabajo {job_id} listo en {time.perf_counter() - start:.1f}s")
+
+    def _purge_expired(self, conn: sqlite3.Connection) -> None:
+        """Borra los trabajos terminados hace más de `retention_s` segundos."""
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'error') AND finished < ?",
+            (time.time() - self.retention_s,),
+        )
+
+
+# Cola compartida por todo el proceso (api_server.py y api_async.py)
+OCR_JOBS = OcrJobQueue(
+    process_fn=ocr_and_extract_labs,
+    path=Path(os.getenv("EVITY_OCR_JOBS_PATH", str(DEFAULT_DB_PATH))),
+)
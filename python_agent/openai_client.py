@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+openai_client.py
+
+Cliente de OpenAI compartido por todo el proceso (agente QA y OCR).
+- Un solo pool de conexiones HTTP con keep-alive: las llamadas reutilizan
+  conexiones TLS abiertas en lugar de negociar una nueva cada vez
+- Límites del pool configurables por variables de entorno
+- Timeout y número de reintentos por tipo de llamada (chat, embeddings,
+  traducción, OCR); todos comparten el mismo pool
+- Versión asíncrona (`get_async_openai_client`) para el servicio asyncio
+  (api_async.py), con su propio pool más grande
+
+Uso:
+    from openai_client import get_openai_client
+    client = get_openai_client("chat")
+"""
+
+import asyncio
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from openai import (
+    DEFAULT_CONNECTION_LIMITS,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    DefaultHttpxClient,
+    OpenAI,
+    Timeout,
+)
+
+# Límites del pool con la clase del cliente HTTP que trae el SDK: no se importa
+# httpx directamente (es dependencia del SDK, no de este servicio)
+_Limits = type(DEFAULT_CONNECTION_LIMITS)
+
+
+@dataclass(frozen=True)
+class EndpointPolicy:
+    timeout: float  # segundos para leer la respuesta
+    max_retries: int  # reintentos del SDK (429, 5xx, errores de conexión)
+    connect_timeout: float = 5.0
+
+
+# Defaults por tipo de llamada. Se pueden cambiar con
+# EVITY_OPENAI_TIMEOUT_<TIPO> y EVITY_OPENAI_RETRIES_<TIPO> (p. ej. EVITY_OPENAI_TIMEOUT_OCR=240).
+DEFAULT_POLICIES: Dict[str, EndpointPolicy] = {
+    "chat": EndpointPolicy(timeout=60.0, max_retries=2),
+    # El pipeline de embeddings lleva sus propios reintentos con backoff
+    "embeddings": EndpointPolicy(timeout=30.0, max_retries=2),
+    # Embedding de una pregunta: hay alguien esperando, así que poco margen
+    "query": EndpointPolicy(timeout=10.0, max_retries=1),
+    "translation": EndpointPolicy(timeout=90.0, max_retries=2),
+    # Visión con imágenes grandes: respuestas lentas, reintentar sale caro
+    "ocr": EndpointPolicy(timeout=180.0, max_retries=1),
+}
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def endpoint_policy(endpoint: str) -> EndpointPolicy:
+    if endpoint not in DEFAULT_POLICIES:
+        raise ValueError(f"Tipo de llamada desconocido: {endpoint}")
+    base = DEFAULT_POLICIES[endpoint]
+    key = endpoint.upper()
+    return EndpointPolicy(
+        timeout=_env_float(f"EVITY_OPENAI_TIMEOUT_{key}", base.timeout),
+        max_retries=_env_int(f"EVITY_OPENAI_RETRIES_{key}", base.max_retries),
+        connect_timeout=_env_float("EVITY_OPENAI_CONNECT_TIMEOUT", base.connect_timeout),
+    )
+
+
+def pool_limits(asynchronous: bool = False):
+    # En asyncio un solo proceso puede tener cientos de llamadas esperando a la vez
+    default_max, default_keepalive = (256, 64) if asynchronous else (32, 16)
+    return _Limits(
+        max_connections=_env_int("EVITY_OPENAI_MAX_CONNECTIONS", default_max),
+        max_keepalive_connections=_env_int("EVITY_OPENAI_MAX_KEEPALIVE", default_keepalive),
+        keepalive_expiry=_env_float("EVITY_OPENAI_KEEPALIVE_EXPIRY", 90.0),
+    )
+
+
+_lock = threading.Lock()
+_base: Optional[Tuple[int, OpenAI]] = None  # (pid, cliente)
+_clients: Dict[Tuple[int, str], OpenAI] = {}
+
+
+def _base_client() -> OpenAI:
+    """Cliente base con el pool compartido. Se crea de nuevo en un proceso hijo (fork)."""
+    global _base
+    pid = os.getpid()
+    if _base is None or _base[0] != pid:
+        http_client = DefaultHttpxClient(limits=pool_limits(), timeout=Timeout(60.0, connect=5.0))
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", ""), http_client=http_client)
+        _base = (pid, client)
+        _clients.clear()
+    return _base[1]
+
+
+def get_openai_client(endpoint: str = "chat") -> OpenAI:
+    """
+    Cliente para un tipo de llamada ("chat", "embeddings", "query", "translation", "ocr").
+    Todos comparten el mismo pool de conexiones; solo cambian timeout y reintentos.
+    """
+    with _lock:
+        base = _base_client()
+        key = (os.getpid(), endpoint)
+        client = _clients.get(key)
+        if client is None:
+            policy = endpoint_policy(endpoint)
+            client = base.with_options(
+                timeout=Timeout(policy.timeout, connect=policy.connect_timeout),
+                max_retries=policy.max_retries,
+            )
+            _clients[key] = client
+        return client
+
+
+_async_base: Optional[Tuple[int, int, AsyncOpenAI]] = None  # (pid, id del event loop, cliente)
+_async_clients: Dict[str, AsyncOpenAI] = {}
+
+
+def get_async_openai_client(endpoint: str = "chat") -> AsyncOpenAI:
+    """
+    Igual que `get_openai_client`, pero asíncrono. El pool pertenece al event
+    loop en curso: si cambia el loop (o el proceso), se crea uno nuevo.
+    Debe llamarse desde dentro del loop.
+    """
+    global _async_base
+    loop_id = id(asyncio.get_running_loop())
+    with _lock:
+        pid = os.getpid()
+        if _async_base is None or _async_base[:2] != (pid, loop_id):
+            http_client = DefaultAsyncHttpxClient(
+                limits=pool_limits(asynchronous=True), timeout=Timeout(60.0, connect=5.0)
+            )
+            client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY", ""), http_client=http_client)
+            _async_base = (pid, loop_id, client)
+            _async_clients.clear()
+        client = _async_clients.get(endpoint)
+        if client is None:
+            policy = endpoint_policy(endpoint)
+            client = _async_base[2].with_options(
+                timeout=Timeout(policy.timeout, connect=policy.connect_timeout),
+                max_retries=policy.max_retries,
+            )
+            _async_clients[endpoint] = client
+        return client
+
+
+async def aclose_async_openai_clients() -> None:
+    """Cierra el pool asíncrono (al apagar el servicio asyncio)."""
+    global _async_base
+    with _lock:
+        base, _async_base = _async_base, None
+        _async_clients.clear()
+    if base is not None and base[0] == os.getpid():
+        await base[2].close()
+
+
+def reset_openai_clients() -> None:
+    """Cierra el pool (p. ej. al apagar un worker o en pruebas)."""
+    global _base
+    with _lock:
+        if _base is not None and _base[0] == os.getpid():
+            _base[1].close()
+        _base = None
+        _clients.clear()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+retrieval.py
+
+Motor de búsqueda vectorial para el índice de Evity.
+- Normaliza la matriz de embeddings una sola vez al cargarla (o la usa tal cual
+  si ya viene normalizada desde disco, p. ej. un memmap float32/float16)
+- Calcula similitud coseno con un solo producto matriz-vector (BLAS)
+- Selecciona el top-k con `argpartition` (O(n)) y ordena solo esos k
+- Acepta varias preguntas a la vez (matriz de consultas)
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+_EPS = 1e-12
+
+# Filas por bloque al puntuar matrices que no son float32 (p. ej. float16):
+# se convierten por bloques para no duplicar toda la matriz en memoria.
+_BLOCK_ROWS = 65536
+
+
+def _normalize_rows(mat: np.ndarray) -> np.ndarray:
+    """Normaliza cada fila a norma 1 (in place sobre `mat`)."""
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms += _EPS
+    np.divide(mat, norms, out=mat)
+    return mat
+
+
+class VectorSearchEngine:
+    """
+    Índice de similitud coseno sobre una matriz de embeddings (n, d).
+
+    Si `copy=False` y la matriz ya es float32, se normaliza en su lugar
+    (útil para índices grandes donde no queremos duplicar memoria).
+    Con `normalized=True` la matriz se usa tal cual, sin copiarla ni convertirla
+    (p. ej. un memmap de solo lectura cuyas filas ya tienen norma 1).
+    """
+
+    def __init__(self, embeddings: np.ndarray, copy: bool = True, normalized: bool = False):
+        if normalized:
+            self.matrix = embeddings
+            return
+        if copy:
+            mat = np.array(embeddings, dtype=np.float32)
+        else:
+            mat = np.asarray(embeddings, dtype=np.float32)
+        if mat.ndim != 2:
+            mat = mat.reshape(len(mat), -1) if mat.size else mat.reshape(0, 0)
+        self.matrix = _normalize_rows(mat) if mat.size else mat
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1] if self.matrix.ndim == 2 else 0
+
+    def search(self, query: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca los k vectores más parecidos a una consulta.
+        Devuelve (índices, similitudes), ordenados de mayor a menor similitud.
+        """
+        q = np.asarray(query, dtype=np.float32).ravel()
+        q = q / (np.linalg.norm(q) + _EPS)
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return self._top_k(self._scores(q), k)
+
+    def search_batch(self, queries: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca varias consultas a la vez. `queries` es (m, d).
+        Devuelve (índices, similitudes) con forma (m, k').
+        """
+        q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        q = q / (np.linalg.norm(q, axis=1, keepdims=True) + _EPS)
+        m = q.shape[0]
+        if len(self) == 0:
+            return np.empty((m, 0), dtype=np.int64), np.empty((m, 0), dtype=np.float32)
+        return self._top_k(self._scores(q.T).T, k)
+
+    def _scores(self, q: np.ndarray) -> np.ndarray:
+        """`matrix @ q` en float32; por bloques si la matriz es de otro dtype."""
+        if self.matrix.dtype == np.float32:
+            return np.asarray(self.matrix @ q)
+        n = len(self)
+        out = np.empty((n,) + q.shape[1:], dtype=np.float32)
+        for start in range(0, n, _BLOCK_ROWS):
+            block = np.asarray(self.matrix[start : start + _BLOCK_ROWS], dtype=np.float32)
+            out[start : start + len(block)] = block @ q
+        return out
+
+    @staticmethod
+    def _top_k(sims: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k sobre el último eje de `sims` (1D o 2D)."""
+        n = sims.shape[-1]
+        k = max(0, min(k, n))
+        if k == 0:
+            shape = sims.shape[:-1] + (0,)
+            return np.empty(shape, dtype=np.int64), np.empty(shape, dtype=np.float32)
+
+        if k < n:
+            cand = np.argpartition(-sims, k - 1, axis=-1)[..., :k]
+        else:
+            cand = np.broadcast_to(np.arange(n), sims.shape).copy()
+
+        cand_scores = np.take_along_axis(sims, cand, axis=-1)
+        order = np.argsort(-cand_scores, axis=-1, kind="stable")
+        return (
+            np.take_along_axis(cand, order, axis=-1),
+            np.take_along_axis(cand_scores, order, axis=-1),
+        )
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sqlite_store.py
+
+Base común de las cachés en SQLite (embeddings, OCR, traducciones).
+- Una conexión por instancia, abierta al primer uso, en modo WAL (segura entre
+  hilos y procesos) y protegida por un lock
+- Si la tabla trae `nbytes` y `last_used` y hay tope (`max_bytes`), lleva la
+  cuenta del tamaño en disco y, al pasarse, elimina primero las entradas usadas
+  hace más tiempo
+Cada subclase define su tabla (`TABLE`, `COLUMNS`) y su API pública.
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterator, Optional, Sequence, Tuple
+
+
+class SqliteLRUStore:
+    """Tabla SQLite con llave `key TEXT PRIMARY KEY`, opcionalmente acotada por tamaño."""
+
+    TABLE = ""
+    # Columnas después de `key`, en sintaxis de CREATE TABLE
+    COLUMNS = ""
+    # Índice sobre last_used (solo con tope de tamaño)
+    LAST_USED_INDEX = ""
+    # Nombre para los mensajes de log ("[cache] <LABEL>: ...")
+    LABEL = ""
+
+    def __init__(self, path: Path, max_bytes: Optional[int] = None):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {self.TABLE} (key TEXT PRIMARY KEY, {self.COLUMNS})")
+            if self.max_bytes is not None:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {self.LAST_USED_INDEX} ON {self.TABLE}(last_used)")
+                self._disk_bytes = self._sum_bytes(conn)
+            self._conn = conn
+        return self._conn
+
+    def _sum_bytes(self, conn: sqlite3.Connection) -> int:
+        return conn.execute(f"SELECT COALESCE(SUM(nbytes), 0) FROM {self.TABLE}").fetchone()[0]
+
+    def _select_keys(self, conn: sqlite3.Connection, columns: str, keys: Sequence[str]) -> Iterator[Tuple]:
+        """`SELECT key, <columns> ... WHERE key IN (...)` en trozos de 500 llaves (límite de SQLite)."""
+        key_list = list(dict.fromkeys(keys))
+        for start in range(0, len(key_list), 500):
+            chunk = key_list[start : start + 500]
+            marks = ",".join("?" * len(chunk))
+            yield from conn.execute(f"SELECT key, {columns} FROM {self.TABLE} WHERE key IN ({marks})", chunk)
+
+    def _evict_if_needed(self, conn: sqlite3.Connection) -> None:
+        if self.max_bytes is None or self._disk_bytes <= self.max_bytes:
+            return
+        # Recalcula (otros procesos pueden haber escrito) y baja al 90% del tope
+        self._disk_bytes = self._sum_bytes(conn)
+        target = int(self.max_bytes * 0.9)
+        if self._disk_bytes <= self.max_bytes:
+            return
+        rows = conn.execute(f"SELECT key, nbytes FROM {self.TABLE} ORDER BY last_used ASC").fetchall()
+        to_delete = []
+        for key, nbytes in rows:
+            if self._disk_bytes <= target:
+                break
+            to_delete.append((key,))
+            self._disk_bytes -= nbytes
+        conn.executemany(f"DELETE FROM {self.TABLE} WHERE key = ?", to_delete)
+        print(f"[cache] {self.LABEL}: {len(to_delete)} entradas eliminadas por tamaño")
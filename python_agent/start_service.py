@@ -1,31 +1,71 @@
 #!/usr/bin/env python3
 """
 Script simple para iniciar el servicio del Agente IA
-Uso: python3 start_service.py
+Uso: python3 start_service.py [--mode dev|prod|async]
+
+- dev  (default): servidor de desarrollo de Flask (`api_server.py`)
+- prod: gunicorn con varios workers e hilos (`gunicorn.conf.py` + `wsgi.py`)
+- async: hypercorn con la versión asyncio (`api_async.py`), mismas rutas
+El modo también se puede elegir con la variable EVITY_SERVE_MODE.
 """
 
+import argparse
+import importlib.util
 import subprocess
 import sys
 import os
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inicia el servicio del Agente IA de Evity")
+    parser.add_argument(
+        "--mode",
+        choices=["dev", "prod", "async"],
+        default=os.getenv("EVITY_SERVE_MODE", "dev"),
+        help="dev: servidor de Flask; prod: gunicorn (varios workers, apagado ordenado); "
+        "async: hypercorn + Quart (cientos de solicitudes en vuelo por proceso)",
+    )
+    args = parser.parse_args()
+
     # Cambiar al directorio python_agent
     script_dir = os.path.dirname(os.path.abspath(__file__))
     os.chdir(script_dir)
-    
+
+    port = os.getenv("PYTHON_API_PORT", "5001")
+
+    if args.mode == "prod":
+        if importlib.util.find_spec("gunicorn") is None:
+            print("❌ El modo prod requiere gunicorn: pip install -r requirements.txt")
+            sys.exit(1)
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"]
+    elif args.mode == "async":
+        if importlib.util.find_spec("hypercorn") is None or importlib.util.find_spec("quart") is None:
+            print("❌ El modo async requiere quart y hypercorn: pip install -r requirements.txt")
+            sys.exit(1)
+        command = [
+            sys.executable, "-m", "hypercorn",
+            "--bind", f"0.0.0.0:{port}",
+            "--workers", os.getenv("EVITY_WEB_WORKERS", "2"),
+            "--graceful-timeout", os.getenv("EVITY_GRACEFUL_TIMEOUT", "30"),
+            "--keep-alive", os.getenv("EVITY_HTTP_KEEPALIVE", "5"),
+            "api_async:app",
+        ]
+    else:
+        command = [sys.executable, "api_server.py"]
+
     print("=" * 60)
     print("🚀 Iniciando Agente IA de Longevidad - Evity")
     print("=" * 60)
     print()
-    print("Puerto: 5001")
-    print("Health check: http://localhost:5001/health")
+    print(f"Modo: {args.mode}")
+    print(f"Puerto: {port}")
+    print(f"Health check: http://localhost:{port}/health")
     print()
     print("Para detener el servicio, presiona Ctrl+C")
     print("=" * 60)
     print()
     
     try:
-        subprocess.run([sys.executable, "api_server.py"], check=True)
+        subprocess.run(command, check=True)
     except KeyboardInterrupt:
         print("\n\n✋ Servicio detenido por el usuario")
     except Exception as e:
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""
+Pruebas del agente: los módulos de python_agent/ se importan planos (como en
+api_server.py), así que se agrega la carpeta al path.
+
+    cd python_agent && python -m pytest -q tests
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
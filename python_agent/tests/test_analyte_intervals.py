@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import math
+
+import numpy as np
+
+from analyte_intervals import (
+    HIGH_RISK, MODERATE_RISK, NORMAL, OUT_OF_RANGE, RANGE_ISSUES, UNKNOWN,
+    build_range_index, classify, classify_value,
+)
+
+TABLE = {
+    "ALT": {
+        "normal": "M: 9-46\nF: 6-25",
+        "moderate_risk": "1-3x mayor que el límite superior de la normal",
+        "high_risk": "≥ 3x mayor que el límite superior de la normal",
+    },
+    "Hemoglobina": {"normal": "13-17", "moderate_risk": "Anemia leve: 11-12.9", "high_risk": "≤ 6.5 o ≥ 20"},
+    "Colesterol": {"normal": "20-29 años: < 170\n≥ 30 años: < 200", "moderate_risk": None, "high_risk": None},
+    "RF": {"normal": "5-14", "moderate_risk": "Positivo (título bajo ≤ 3x límite superior de lo normal)"},
+    "Yodo": {"normal": "4-8", "high_risk": "Sugiere hipertiroidismo: > 8-9"},
+    "Orina": {"normal": "Amarillo claro", "moderate_risk": "Δ modestamente > 0"},
+    "Roto": {"normal": "M: 80-180\nF: 60160"},
+    "Raro": {"normal": "entre 3 y 4 ~ 5"},
+}
+
+
+def _index():
+    return build_range_index(TABLE)
+
+
+def test_compiles_sex_bands_and_resolves_uln_per_band():
+    index, _ = _index()
+    alt = index["ALT"]
+    female = alt.intervals("F")
+    assert female["normal"][0].hi == 25
+    assert (female["moderate_risk"][0].lo, female["moderate_risk"][0].hi) == (25, 75)
+    assert female["high_risk"][0].lo == 75
+    assert alt.intervals("M")["high_risk"][0].lo == 3 * 46
+
+
+def test_label_prefix_is_stripped_and_open_ranges_use_the_high_end():
+    index, _ = _index()
+    rf = index["RF"].intervals()["moderate_risk"][0]
+    assert (rf.hi, rf.label) == (42, "Positivo")
+    yodo = index["Yodo"].intervals()["high_risk"][0]
+    assert (yodo.lo, yodo.lo_closed, yodo.label) == (9, False, "Sugiere hipertiroidismo")
+
+
+def test_qualitative_and_unparsed_entries():
+    index, issues = _index()
+    assert index["Orina"].qualitative == {"normal": ["Amarillo claro"], "moderate_risk": ["Δ modestamente > 0"]}
+    assert not index["Orina"].bands
+    assert {(i.analyte, i.level) for i in issues} == {("Roto", "normal"), ("Raro", "normal")}
+    assert "guion" in next(i.reason for i in issues if i.analyte == "Roto")
+
+
+def test_only_titer_entries_remain_unparsed_in_the_table():
+    assert {i.analyte for i in RANGE_ISSUES} == {"Anticuerpos antinucleares", "Factor reumatoide (IU/mL)"}
+    assert classify_value("Hierro", 100, "F") == "normal"
+    assert classify_value("Hierro", 170, "F") == "out_of_range"
+    assert classify_value("Hierro", 170, "M") == "normal"
+    assert classify_value("Yodo proteíco", 10) == "high_risk"
+
+
+def test_classify_vectorized_matches_single_values(monkeypatch):
+    import analyte_intervals
+
+    index, _ = _index()
+    monkeypatch.setattr(analyte_intervals, "RANGE_INDEX", index)
+    values = np.array([5.0, 13.0, 12.0, 20.0, 15.0, math.nan, 18.0])
+    codes = classify("Hemoglobina", values)
+    assert codes.tolist() == [HIGH_RISK, NORMAL, MODERATE_RISK, HIGH_RISK, NORMAL, UNKNOWN, OUT_OF_RANGE]
+    assert codes.tolist() == [int(classify("Hemoglobina", [v])[0]) for v in values]
+
+    sexes = np.array(["mujer", "masculino", "F", None], dtype=object)
+    assert classify("ALT", [30, 30, 80, 30], sexes).tolist() == [MODERATE_RISK, NORMAL, HIGH_RISK, UNKNOWN]
+
+    ages = np.array([25, 45, math.nan])
+    assert classify("Colesterol", [180, 180, 180], age=ages).tolist() == [OUT_OF_RANGE, NORMAL, UNKNOWN]
+    assert classify("No existe", [1.0]).tolist() == [UNKNOWN]
+
+
+def test_adjacent_bands_have_no_gap_at_the_written_precision():
+    assert classify_value("HbA1c (%)", 6.4) == "moderate_risk"
+    assert classify_value("HbA1c (%)", 6.45) == "moderate_risk"
+    assert classify_value("HbA1c (%)", 6.5) == "high_risk"
+    assert classify_value("Colesterol total", 239.5) == "moderate_risk"
+    assert classify_value("Colesterol total", 240) == "high_risk"
+    # '0.2-1.0' se escribió con un decimal: el hueco hasta '2' no es de una unidad
+    assert classify_value("Urobilinógeno", 1.5) == "out_of_range"
+
+    index, _ = build_range_index({"Hb": {"normal": "13-17", "moderate_risk": "Anemia leve: 11-12.9"}})
+    leve = index["Hb"].intervals()["moderate_risk"][0]
+    assert (leve.hi, leve.hi_closed, leve.label) == (13, False, "Anemia leve")
+    assert index["Hb"].bands[next(iter(index["Hb"].bands))]["moderate_risk"][0].hi == 12.9
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from answer_cache import SemanticAnswerCache
+from evity_qa_agent import HISTORY_TURNS, answer_cache_scope
+
+
+def _history(*contents):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": c} for i, c in enumerate(contents)]
+
+
+def test_scope_depends_on_history():
+    base = ("v1", None, False, False)
+    sin_historial = answer_cache_scope(*base)
+    assert answer_cache_scope(*base, []) == sin_historial
+    vacunas = answer_cache_scope(*base, _history("¿Qué vacunas necesito?", "..."))
+    menopausia = answer_cache_scope(*base, _history("¿Qué es la menopausia?", "..."))
+    assert len({sin_historial, vacunas, menopausia}) == 3
+    assert answer_cache_scope(*base, _history("¿Qué vacunas necesito?", "...")) == vacunas
+
+
+def test_scope_only_counts_recent_turns():
+    base = ("v1", None, False, False)
+    reciente = [f"mensaje {i}" for i in range(HISTORY_TURNS)]
+    # Solo cambia un mensaje anterior a los que ve el modelo
+    assert answer_cache_scope(*base, _history("viejo", *reciente)) == answer_cache_scope(
+        *base, _history("otro", *reciente)
+    )
+
+
+def test_scope_depends_on_the_numbers_in_the_question():
+    base = ("v1", None, False, False, None)
+    noventa = answer_cache_scope(*base, "¿Es normal una glucosa de 90?")
+    assert noventa != answer_cache_scope(*base, "¿Es normal una glucosa de 190?")
+    assert noventa == answer_cache_scope(*base, "¿una glucosa de 90 es normal?")
+    assert answer_cache_scope(*base, "colesterol de 7,2") == answer_cache_scope(*base, "colesterol de 7.2")
+    # Los dígitos de un nombre (HbA1c, B12) no separan preguntas
+    assert answer_cache_scope(*base, "¿Qué es la HbA1c?") == answer_cache_scope(*base, "¿Qué es la hemoglobina?")
+
+
+def test_cached_answer_is_not_reused_for_a_different_value():
+    cache = SemanticAnswerCache(threshold=0.95)
+    vec = np.ones(8, dtype=np.float32)  # mismo embedding: solo cambia el número
+    base = ("v1", None, False, False, None)
+    cache.store(vec, answer_cache_scope(*base, "glucosa de 90"), "Está en rango.")
+    assert cache.lookup(vec, answer_cache_scope(*base, "glucosa de 190")) is None
+    assert cache.lookup(vec, answer_cache_scope(*base, "Glucosa de 90"))[0] == "Está en rango."
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import api_server
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, True), (True, True), (False, False), ("false", False), ("False", False),
+    ("0", False), ("no", False), (0, False), ("true", True), (1, True),
+])
+def test_use_cache_flag(monkeypatch, value, expected):
+    seen = {}
+
+    def fake_preguntar_qa(question, **kwargs):
+        seen.update(kwargs)
+        return "respuesta"
+
+    monkeypatch.setattr(api_server, "preguntar_qa", fake_preguntar_qa)
+    body = {"question": "¿Qué es la glucosa?"}
+    if value is not None:
+        body["useCache"] = value
+    response = api_server.app.test_client().post("/ask", json=body)
+    assert response.status_code == 200
+    assert seen["usar_cache"] is expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, False), (False, False), ("false", False), ("0", False), (0, False),
+    (True, True), ("true", True), (1, True),
+])
+def test_rebuild_full_flag(monkeypatch, value, expected):
+    seen = {}
+
+    def trigger(base, full=False, reason=""):
+        seen["full"] = full
+        return True, {}
+
+    monkeypatch.setattr(api_server.REBUILDER, "trigger", trigger)
+    body = {} if value is None else {"full": value}
+    response = api_server.app.test_client().post("/rebuild-index", json=body)
+    assert response.status_code == 202
+    assert seen["full"] is expected
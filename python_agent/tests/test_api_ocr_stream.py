@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+import api_server
+
+
+def _events(fail_first):
+    if fail_first:
+        raise ValueError("Tipo de archivo no soportado: .docx")
+    yield "analito", {"nombre": "Glucosa", "valor": 90}
+    yield "result", {"parsed": {"analitos": []}}
+
+
+def test_stream_reports_errors_before_the_first_event_as_http(monkeypatch):
+    monkeypatch.setattr(api_server, "ocr_and_extract_labs_stream",
+                        lambda file_bytes, filename, use_cache: _events(filename.endswith(".docx")))
+    client = api_server.app.test_client()
+
+    assert client.post("/labs/ocr/stream", data=b"").status_code == 400
+
+    response = client.post("/labs/ocr/stream", data=b"x", headers={"X-File-Name": "a.docx"})
+    assert response.status_code == 500
+    assert "no soportado" in response.get_json()["details"]
+
+    response = client.post("/labs/ocr/stream", data=b"x", headers={"X-File-Name": "a.pdf"})
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert body.startswith("event: analito") and "event: result" in body
+
+
+def test_async_stream_reports_errors_before_the_first_event_as_http(monkeypatch):
+    pytest.importorskip("quart")  # solo para el modo asíncrono (requirements.txt)
+    import api_async
+
+    async def events(file_bytes, filename, use_cache):
+        for event in _events(filename.endswith(".docx")):
+            yield event
+
+    monkeypatch.setattr(api_async, "ocr_and_extract_labs_stream_async", events)
+
+    async def run():
+        client = api_async.app.test_client()
+        empty = await client.post("/labs/ocr/stream", data=b"")
+        failed = await client.post("/labs/ocr/stream", data=b"x", headers={"X-File-Name": "a.docx"})
+        ok = await client.post("/labs/ocr/stream", data=b"x", headers={"X-File-Name": "a.pdf"})
+        return empty.status_code, failed.status_code, ok.status_code, await ok.get_data(as_text=True)
+
+    empty, failed, ok, body = asyncio.run(run())
+    assert (empty, failed, ok) == (400, 500, 200)
+    assert body.startswith("event: analito") and "event: result" in body
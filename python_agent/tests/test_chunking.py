@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from chunking import PAGE_SEPARATOR, approx_tokens, chunk_pages
+
+
+def _pages():
+    sentence = "La glucosa en ayunas se mide en miligramos por decilitro. "
+    return [sentence * 30, "Segunda página sin punto final " * 20, sentence * 10]
+
+
+def test_passages_respect_the_budget_and_cover_every_word():
+    pages = _pages()
+    passages = chunk_pages("guia.pdf", pages, max_tokens=80, overlap_tokens=15)
+    full = PAGE_SEPARATOR.join(pages)
+    assert len(passages) > 3
+    for p in passages:
+        assert p.doc_name == "guia.pdf"
+        assert full[p.char_start:p.char_end] == p.text
+        assert sum(approx_tokens(w) for w in p.text.split()) <= 80
+    assert passages[0].char_start == 0
+    assert passages[-1].char_end == len(full.rstrip())
+    # Cada pasaje empieza antes de que termine el anterior (traslape) y siempre avanza
+    for prev, cur in zip(passages, passages[1:]):
+        assert prev.char_start < cur.char_start < prev.char_end
+
+
+def test_pages_are_tracked_across_the_separator():
+    pages = _pages()
+    passages = chunk_pages("guia.pdf", pages, max_tokens=80, overlap_tokens=15)
+    page2_start = len(pages[0]) + len(PAGE_SEPARATOR)
+    for p in passages:
+        assert 1 <= p.page_start <= p.page_end <= 3
+        if p.char_start < page2_start < p.char_end:
+            assert (p.page_start, p.page_end) == (1, 2)
+    assert passages[-1].page_end == 3
+
+
+def test_prefers_cutting_at_a_sentence_end():
+    passages = chunk_pages("guia.txt", [_pages()[0]], max_tokens=50, overlap_tokens=10)
+    assert all(p.text.endswith(".") for p in passages)
+
+
+def test_edge_cases():
+    assert chunk_pages("vacio.txt", ["", "   "]) == []
+    one = chunk_pages("corto.txt", ["Hola mundo."])
+    assert len(one) == 1 and one[0].text == "Hola mundo." and one[0].page_end == 1
+    # Una palabra más larga que el presupuesto sale sola en vez de atorar el ciclo
+    long = chunk_pages("largo.txt", ["x" * 100 + " fin"], max_tokens=5, overlap_tokens=1)
+    assert [p.text for p in long] == ["x" * 100, "fin"]
+    with pytest.raises(ValueError):
+        chunk_pages("a.txt", ["hola"], max_tokens=10, overlap_tokens=10)
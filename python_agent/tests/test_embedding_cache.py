@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+
+def _disk_sum(cache):
+    return cache._db().execute("SELECT SUM(nbytes) FROM embeddings").fetchone()[0]
+
+
+def test_disk_bytes_ignores_replaced_rows(tmp_path):
+    cache = EmbeddingCache(tmp_path / "e.sqlite3", max_bytes=10_000)
+    vec = np.ones(8, dtype=np.float32)
+    cache.put_many("m", ["glucosa", "insulina"], [vec, vec])
+    for _ in range(5):
+        cache.put_many("m", ["glucosa", "Glucosa "], [vec, vec])  # misma llave normalizada
+    assert cache.stats()["disk_bytes"] == _disk_sum(cache) == 2 * vec.nbytes
+
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""El pipeline de embeddings contra el stub local (embeddings_stub.py), sin red ni cuota."""
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from openai import OpenAI
+from werkzeug.serving import make_server
+
+import embeddings_stub
+from embedding_pipeline import EmbeddingPipeline, estimate_tokens, plan_batches
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setitem(embeddings_stub.CONFIG, "dim", 8)
+    monkeypatch.setitem(embeddings_stub.CONFIG, "latency", 0.05)
+    for key in embeddings_stub.STATS:
+        monkeypatch.setitem(embeddings_stub.STATS, key, 0)
+    server = make_server("127.0.0.1", 0, embeddings_stub.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = OpenAI(api_key="stub", base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    try:
+        yield client
+    finally:
+        server.shutdown()
+        client.close()
+
+
+def _texts(n):
+    return [f"Pasaje {i}: " + "glucosa " * (i % 7 + 1) for i in range(n)]
+
+
+def test_plan_batches_respects_the_token_budget():
+    texts = _texts(40) + ["x " * 500]
+    batches = plan_batches(texts, max_tokens=30, max_items=4)
+    assert batches[0][0] == 0 and batches[-1][1] == len(texts)
+    assert all(a[1] == b[0] for a, b in zip(batches, batches[1:]))  # contiguos, sin huecos
+    for start, end in batches:
+        assert end - start <= 4
+        assert end - start == 1 or sum(estimate_tokens(t) for t in texts[start:end]) <= 30
+    assert batches[-1] == (len(texts) - 1, len(texts))  # el texto enorme va solo
+
+
+def test_pipeline_keeps_order_across_concurrent_batches(stub):
+    texts = _texts(60)
+    pipeline = EmbeddingPipeline(stub, "stub", batch_tokens=25, max_in_flight=3)
+    vecs = pipeline.embed(texts)
+    expected = np.array([embeddings_stub.fake_embedding(t, 8) for t in texts], dtype=np.float32)
+    np.testing.assert_allclose(vecs, expected, rtol=1e-6)
+
+    batches = plan_batches(texts, 25)
+    assert pipeline.stats.requests == embeddings_stub.STATS["requests"] == len(batches) > 3
+    assert embeddings_stub.STATS["inputs"] == len(texts)
+    assert 1 < embeddings_stub.STATS["max_in_flight"] <= 3
+    assert pipeline.stats.retries == 0
+
+
+def test_pipeline_backs_off_on_429_with_retry_after(stub, monkeypatch):
+    # Las dos primeras solicitudes reciben 429 (con retry-after-ms: 200); las demás pasan
+    rolls = itertools.chain([0.0, 0.0], itertools.repeat(0.99))
+    monkeypatch.setattr(embeddings_stub, "random", SimpleNamespace(random=lambda: next(rolls)))
+    monkeypatch.setitem(embeddings_stub.CONFIG, "rate_limit", 0.5)
+
+    texts = _texts(12)
+    pipeline = EmbeddingPipeline(stub, "stub", batch_tokens=25, max_in_flight=1, base_delay=0.01)
+    started = time.monotonic()
+    vecs = pipeline.embed(texts)
+    assert time.monotonic() - started >= 0.4  # se respetó Retry-After en cada reintento
+
+    expected = np.array([embeddings_stub.fake_embedding(t, 8) for t in texts], dtype=np.float32)
+    np.testing.assert_allclose(vecs, expected, rtol=1e-6)
+    assert (pipeline.stats.retries, pipeline.stats.rate_limited) == (2, 2)
+    assert embeddings_stub.STATS["rate_limited"] == 2
+    assert pipeline.stats.requests == len(plan_batches(texts, 25)) + 2
+
+
+def test_pipeline_gives_up_after_max_retries(stub, monkeypatch):
+    monkeypatch.setitem(embeddings_stub.CONFIG, "rate_limit", 1.0)
+    pipeline = EmbeddingPipeline(stub, "stub", max_retries=2, base_delay=0.01, max_delay=0.01)
+    with pytest.raises(Exception) as info:
+        pipeline.embed(["hola"])
+    assert type(info.value).__name__ == "RateLimitError"
+    assert embeddings_stub.STATS["requests"] == 3
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+import numpy as np
+
+import evity_qa_agent
+
+
+class _DictCache:
+    def __init__(self):
+        self.vecs = {}
+
+    def get_many(self, model, texts):
+        return [self.vecs.get((model, t)) for t in texts]
+
+    def put_many(self, model, texts, vecs):
+        self.vecs.update(((model, t), v) for t, v in zip(texts, vecs))
+
+    def embed(self, model, texts, embed_missing):
+        return embed_missing(texts)
+
+
+class _Client:
+    def __init__(self):
+        self.calls = []
+        self.embeddings = SimpleNamespace(create=self._create)
+
+    def _create(self, model, input):
+        self.calls.append(list(input))
+        return SimpleNamespace(data=[SimpleNamespace(index=0, embedding=[0.1, 0.2, 0.3])])
+
+
+def _fake_pipeline(client, texts, model, progress=None):
+    if progress:
+        progress("embeddings", len(texts), len(texts))
+    return np.ones((len(texts), 3), dtype=np.float32)
+
+
+def test_query_embedding_is_one_direct_call_and_cached(monkeypatch):
+    def no_pipeline(*args, **kwargs):
+        raise AssertionError("una pregunta no pasa por el pipeline de batches")
+
+    monkeypatch.setattr(evity_qa_agent, "EMBEDDING_CACHE", _DictCache())
+    monkeypatch.setattr(evity_qa_agent, "embed_with_pipeline", no_pipeline)
+    monkeypatch.setattr(evity_qa_agent, "tqdm", no_pipeline)
+    client = _Client()
+    vec = evity_qa_agent.embed_query(client, "¿Qué es la glucosa?")
+    assert vec.dtype == np.float32 and vec.shape == (3,)
+    evity_qa_agent.embed_query(client, "¿Qué es la glucosa?")
+    assert client.calls == [["¿Qué es la glucosa?"]]
+
+
+def test_index_build_embeddings_show_a_progress_bar(monkeypatch):
+    bars = []
+    monkeypatch.setattr(evity_qa_agent, "EMBEDDING_CACHE", _DictCache())
+    monkeypatch.setattr(evity_qa_agent, "embed_with_pipeline", _fake_pipeline)
+    monkeypatch.setattr(evity_qa_agent, "tqdm", lambda *a, **k: bars.append(k) or _Bar())
+    evity_qa_agent.embed_texts_openai(None, ["a", "b"])
+    assert bars == []
+    evity_qa_agent.embed_texts_openai(None, ["a", "b"], show_progress=True)
+    assert bars == [{"total": 2, "desc": "Creando embeddings"}]
+
+
+class _Bar:
+    n = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def update(self, step):
+        self.n += step
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from extraction import extract_documents
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_failed_files_are_none_and_empty_files_are_empty(tmp_path, workers):
+    good = tmp_path / "guia.txt"
+    good.write_text("La glucosa en ayunas.", encoding="utf-8")
+    empty = tmp_path / "vacio.txt"
+    empty.write_text("   ", encoding="utf-8")
+    broken = tmp_path / "roto.pdf"
+    broken.write_bytes(b"esto no es un PDF")
+
+    done = []
+    results = extract_documents([good, empty, broken], workers=workers, on_done=lambda d, t: done.append(d))
+    assert results == [["La glucosa en ayunas."], [], None]
+    assert done == [1, 2, 3]
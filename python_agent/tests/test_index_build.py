@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+import evity_qa_agent as qa
+from index_manifest import load_manifest, scan_content_files, stat_changed
+from index_store import read_all_rows
+
+
+def _setup(monkeypatch, tmp_path, failing):
+    extracted = []
+
+    def extract_documents(paths, on_done=None):
+        extracted.extend(p.name for p in paths)
+        return [None if p.name in failing else [p.read_text(encoding="utf-8")] for p in paths]
+
+    def embed(client, texts, progress=None, show_progress=False):
+        return np.array([[len(t), 1.0, 0.5] for t in texts], dtype=np.float32)
+
+    monkeypatch.setattr(qa, "extract_documents", extract_documents)
+    monkeypatch.setattr(qa, "embed_texts_openai", embed)
+    monkeypatch.setattr(qa, "get_openai_client", lambda endpoint: None)
+    monkeypatch.setattr(qa, "TRANSLATE_PASSAGES", False)
+    monkeypatch.setattr(qa.INDEX_HOLDER, "publish", lambda base, snapshot: None)
+    (tmp_path / "contenidos").mkdir()
+    return extracted
+
+
+def _indexed(tmp_path):
+    return sorted(set(read_all_rows(tmp_path / "vector_index")["names"]))
+
+
+def test_failed_extraction_is_retried_by_the_next_rebuild(monkeypatch, tmp_path):
+    failing = {"b.txt"}
+    extracted = _setup(monkeypatch, tmp_path, failing)
+    (tmp_path / "contenidos" / "a.txt").write_text("Glucosa en ayunas.", encoding="utf-8")
+    (tmp_path / "contenidos" / "b.txt").write_text("Colesterol total.", encoding="utf-8")
+
+    qa.build_index(tmp_path)
+    manifest = load_manifest(tmp_path / "vector_index")
+    assert _indexed(tmp_path) == ["a.txt"]
+    assert manifest["b.txt"].failed and manifest["b.txt"].passages == 0
+    assert not manifest["a.txt"].failed
+    # Un archivo que falló y no cambió no dispara reconstrucciones automáticas
+    assert not stat_changed(scan_content_files(tmp_path / "contenidos"), manifest)
+
+    failing.clear()
+    extracted.clear()
+    qa.build_index(tmp_path)
+    assert extracted == ["b.txt"]
+    assert _indexed(tmp_path) == ["a.txt", "b.txt"]
+    assert not load_manifest(tmp_path / "vector_index")["b.txt"].failed
+
+
+def test_failed_extraction_keeps_the_previous_rows(monkeypatch, tmp_path):
+    failing = set()
+    _setup(monkeypatch, tmp_path, failing)
+    doc = tmp_path / "contenidos" / "a.txt"
+    doc.write_text("Versión uno.", encoding="utf-8")
+    qa.build_index(tmp_path)
+
+    failing.add("a.txt")
+    doc.write_text("Versión dos, más larga.", encoding="utf-8")
+    qa.build_index(tmp_path)
+    rows = read_all_rows(tmp_path / "vector_index")
+    assert rows["texts"] == ["Versión uno."]
+    entry = load_manifest(tmp_path / "vector_index")["a.txt"]
+    assert entry.failed and entry.passages == 1
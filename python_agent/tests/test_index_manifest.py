@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import os
+
+from index_manifest import (
+    FileEntry, diff_manifest, load_manifest, save_manifest, scan_content_files, stat_changed,
+)
+
+
+def _write(path, text, mtime=None):
+    path.write_text(text, encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def _snapshot(tmp_path):
+    files = scan_content_files(tmp_path)
+    return files, diff_manifest(files, None).entries
+
+
+def test_first_scan_marks_everything_changed(tmp_path):
+    _write(tmp_path / "b.pdf", "pdf")
+    _write(tmp_path / "a.txt", "uno")
+    _write(tmp_path / "notas.md", "no se indexa")
+    files = scan_content_files(tmp_path)
+    assert list(files) == ["a.txt", "b.pdf"]  # .txt primero, luego .pdf
+    diff = diff_manifest(files, None)
+    assert diff.changed == ["a.txt", "b.pdf"] and not diff.unchanged and not diff.removed
+    assert diff.has_changes
+
+
+def test_diff_detects_new_modified_removed_and_touched_files(tmp_path):
+    _write(tmp_path / "igual.txt", "igual", mtime=1_000_000)
+    _write(tmp_path / "tocado.txt", "mismo contenido", mtime=1_000_000)
+    _write(tmp_path / "editado.txt", "antes", mtime=1_000_000)
+    _write(tmp_path / "borrado.txt", "adiós", mtime=1_000_000)
+    files, manifest = _snapshot(tmp_path)
+    manifest = {name: FileEntry(e.sha256, e.size, e.mtime, passages=3) for name, e in manifest.items()}
+    assert not stat_changed(files, manifest)
+
+    (tmp_path / "borrado.txt").unlink()
+    _write(tmp_path / "nuevo.txt", "nuevo")
+    _write(tmp_path / "tocado.txt", "mismo contenido", mtime=2_000_000)
+    _write(tmp_path / "editado.txt", "después", mtime=1_000_000)
+    files = scan_content_files(tmp_path)
+    assert stat_changed(files, manifest)
+
+    diff = diff_manifest(files, manifest)
+    assert sorted(diff.unchanged) == ["igual.txt", "tocado.txt"]
+    assert sorted(diff.changed) == ["editado.txt", "nuevo.txt"]
+    assert diff.removed == ["borrado.txt"]
+    # Un archivo solo tocado conserva sus pasajes y toma el mtime nuevo
+    assert diff.entries["tocado.txt"].passages == 3
+    assert diff.entries["tocado.txt"].mtime == 2_000_000
+    assert diff.entries["editado.txt"].passages == 0
+    assert set(diff.entries) == set(files)
+
+
+def test_manifest_round_trip(tmp_path):
+    _write(tmp_path / "a.txt", "uno")
+    files, entries = _snapshot(tmp_path)
+    out = tmp_path / "index"
+    out.mkdir()
+    assert load_manifest(out) is None
+    save_manifest(out, entries)
+    loaded = load_manifest(out)
+    assert loaded == entries
+    assert not diff_manifest(files, loaded).has_changes
+
+    (out / "manifest.json").write_text('{"format": 999, "files": {}}', encoding="utf-8")
+    assert load_manifest(out) is None
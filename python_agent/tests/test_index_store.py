@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import numpy as np
+
+import index_store
+
+
+def _legacy_npz(out_dir):
+    out_dir.mkdir()
+    np.savez(
+        out_dir / index_store.LEGACY_NPZ,
+        names=np.array(["a.txt", "b.txt"], dtype=object),
+        texts=np.array(["Glucosa.", "Colesterol."], dtype=object),
+        embeddings=np.eye(2, dtype=np.float32),
+    )
+
+
+def test_concurrent_opens_convert_legacy_npz_once(tmp_path, monkeypatch):
+    out_dir = tmp_path / "vector_index"
+    _legacy_npz(out_dir)
+    real_convert = index_store.convert_npz
+    calls = []
+
+    def slow_convert(path, *args, **kwargs):
+        calls.append(path)
+        time.sleep(0.2)  # deja que los demás hilos lleguen a open_index mientras tanto
+        return real_convert(path, *args, **kwargs)
+
+    monkeypatch.setattr(index_store, "convert_npz", slow_convert)
+    opened = []
+    threads = [threading.Thread(target=lambda: opened.append(index_store.open_index(out_dir))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    assert len(calls) == 1
+    assert len(opened) == 4 and len({d.path for d in opened}) == 1
+    assert list(opened[0].texts) == ["Glucosa.", "Colesterol."]
+
+
+def test_open_index_inside_build_lock_does_not_deadlock(tmp_path):
+    out_dir = tmp_path / "vector_index"
+    _legacy_npz(out_dir)
+    with index_store.build_lock(out_dir):
+        disk = index_store.open_index(out_dir)
+    assert list(disk.names) == ["a.txt", "b.txt"]
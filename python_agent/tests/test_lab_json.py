@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import json
+
+from lab_json import AnalyteStreamParser, lab_response_format, repair_json
+
+DOC = {
+    "tipo_estudio": "laboratorio",
+    "nombre_estudio": "QUIMICA CLINICA",
+    "nombre_paciente": None,
+    "nombre_laboratorio": None,
+    "fecha_estudio": "2025-07-07",
+    "analitos": [
+        {"nombre": "Glucosa", "valor": 90, "unidad": "mg/dL", "observaciones": None},
+        {"nombre": "Creatinina", "valor": 0.8, "unidad": "mg/dL", "observaciones": "dato {raro}"},
+        {"nombre": "Urea", "valor": 30, "unidad": "mg/dL", "observaciones": None},
+    ],
+}
+
+
+def test_repair_text_before_and_after():
+    raw = "Aquí está el resultado: " + json.dumps(DOC) + "\nEspero que sirva."
+    assert repair_json(raw) == DOC
+
+
+def test_repair_keeps_first_of_two_objects():
+    assert repair_json(json.dumps(DOC) + ' {"x": 1}') == DOC
+
+
+def test_repair_fences_trailing_commas_and_python_literals():
+    raw = "```json\n{'analitos': [{'nombre': 'Glucosa', 'valor': 90, 'observaciones': None},], 'ok': True,}\n```"
+    assert repair_json(raw) == {
+        "analitos": [{"nombre": "Glucosa", "valor": 90, "observaciones": None}],
+        "ok": True,
+    }
+
+
+def test_repair_truncated_keeps_complete_analytes():
+    text = json.dumps(DOC)
+    cut = text.index('"valor": 30') + len('"valor": 3')  # a media del valor del tercer analito
+    data = repair_json(text[:cut])
+    assert [a["nombre"] for a in data["analitos"]] == ["Glucosa", "Creatinina"]
+
+
+def test_repair_without_json():
+    assert repair_json("No encontré resultados de laboratorio.") is None
+    assert repair_json("") is None
+
+
+def test_stream_parser_emits_each_analyte_once():
+    text = json.dumps(DOC)
+    parser = AnalyteStreamParser()
+    emitted = []
+    for i in range(0, len(text), 5):
+        emitted.extend(parser.feed(text[i:i + 5]))
+    assert emitted == DOC["analitos"]
+    assert parser.result() == DOC
+    assert parser.text == text
+
+
+def test_stream_parser_ignores_nested_arrays_outside_analitos():
+    parser = AnalyteStreamParser()
+    assert parser.feed('{"otros": [{"nombre": "x"}], "analitos": [{"nombre": "Glucosa", "valor": 1}') == [
+        {"nombre": "Glucosa", "valor": 1}
+    ]
+
+
+def test_response_format_limits_names():
+    schema = lab_response_format(["Glucosa", "Urea", "No existe"])
+    item = schema["json_schema"]["schema"]["properties"]["analitos"]["items"]
+    assert item["properties"]["nombre"]["enum"] == ["Glucosa", "Urea"]
+    assert schema["json_schema"]["strict"] is True
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Perfiles de lab_layouts.py contra la capa de texto de reportes reales (tests/fixtures)."""
+import re
+from pathlib import Path
+
+import pytest
+
+import lab_ocr
+from lab_layouts import detect_profile, extract_with_profile
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def _pages(name):
+    """Páginas de un reporte, como las devuelve lab_ocr._read_pdf_pages (separadas por \\f)."""
+    return (FIXTURES / f"{name}.txt").read_text(encoding="utf-8").split("\f")
+
+
+def _rows(data):
+    return {a["nombre"]: (a["valor"], a["unidad"]) for a in data["analitos"]}
+
+
+def test_moreira_columns_profile():
+    profile, data = extract_with_profile(_pages("moreira_bh_qs_ego"))
+    assert (profile.key, profile.layout) == ("moreira", "columns")
+    assert len(data["analitos"]) == 40
+    rows = _rows(data)
+    assert rows["Hemoglobina"] == (14.3, "g/dL")
+    assert rows["VCM"] == (84.2, "fL")  # 'ƒl' del reporte
+    assert rows["Plaquetas"] == (265.0, "miles/mm³")
+    assert rows["Glucosa"] == (82.0, "mg/dL")
+    assert rows["Leucocitos/CPA"] == (0.0, "")  # urianálisis, no la biometría
+    assert data["nombre_laboratorio"] == "Laboratorio Moreira"
+    assert data["nombre_paciente"] == "PACIENTE DE PRUEBA"
+    assert data["fecha_estudio"] == "2023-11-22"
+
+
+def test_moreira_columns_profile_single_page():
+    profile, data = extract_with_profile(_pages("moreira_biometria_2008"))
+    assert profile.key == "moreira"
+    assert len(data["analitos"]) == 14
+    assert _rows(data)["VPM"] == (8.42, "fL")
+    assert data["fecha_estudio"] == "2008-04-10"
+
+
+def test_salud_digna_rows_profile():
+    profile, data = extract_with_profile(_pages("salud_digna_laboratorio"))
+    assert (profile.key, profile.layout) == ("salud_digna", "rows")
+    assert len(data["analitos"]) == 44
+    rows = _rows(data)
+    assert rows["Hemoglobina"] == (13.5, "g/dL")
+    assert rows["Neutrófilos"] == (32.3, "%")
+    assert rows["Leucocitos"] == (4.85, "10^3/µL")
+    assert rows["Leucocitos/CPA"] == (3.0, "por campo")
+    assert rows["Sodio"] == (139.0, "")
+    assert data["nombre_paciente"] == "PRUEBA, PACIENTE"
+    assert data["nombre_estudio"] == "BIOMETRIA HEMATICA / QUÍMICA CLÍNICA / INMUNOLOGÍA / EXAMEN GENERAL DE ORINA"
+
+
+def _unknown_lab():
+    # El mismo reporte de columnas, sin las marcas del laboratorio
+    return [re.sub("labmoreira", "labejemplo", page, flags=re.I) for page in _pages("moreira_bh_qs_ego")]
+
+
+@pytest.mark.parametrize("pages", [_unknown_lab, lambda: _pages("salud_digna_ultrasonido")])
+def test_unknown_layouts_fall_through_to_the_model(monkeypatch, pages):
+    pages = pages()
+    assert extract_with_profile(pages) is None
+    monkeypatch.setattr(lab_ocr, "TEXT_LAYER_ENABLED", True)
+    result, text = lab_ocr._try_text_layer(pages, "a.pdf")
+    assert result is None and text == "\n\n".join(pages)  # se manda el texto al modelo
+
+
+def test_unknown_lab_has_no_profile():
+    assert detect_profile(_unknown_lab()) is None
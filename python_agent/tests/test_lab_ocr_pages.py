@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import lab_ocr
+
+
+def _fake_render(pages, delay, log):
+    def iter_pdf_images(file_bytes, report=None, texts=None):
+        if report is not None:
+            report.update(total=len(pages), classified=[{"page": p, "decision": "lab"} for p in pages])
+        for page in pages:
+            time.sleep(delay)
+            log.append(("rendered", page, time.perf_counter()))
+            yield page, f"data:image/jpeg;base64,{page}"
+    return iter_pdf_images
+
+
+def _page_json(page):
+    return {"nombre_estudio": f"P{page}", "analitos": [{"nombre": "Glucosa" if page == 1 else "Urea", "valor": page}]}
+
+
+def test_async_fanout_starts_requests_while_rendering(monkeypatch):
+    log = []
+    monkeypatch.setattr(lab_ocr, "FANOUT_PAGES_PER_REQUEST", 1)
+    monkeypatch.setattr(lab_ocr, "_iter_pdf_images", _fake_render([1, 2, 3], 0.05, log))
+
+    async def call(client, data_urls, pages):
+        log.append(("request", pages[0], time.perf_counter()))
+        await asyncio.sleep(0.01)
+        return _page_json(pages[0]), "{}"
+
+    monkeypatch.setattr(lab_ocr, "_call_page_group_async", call)
+
+    async def collect():
+        return [item async for item in lab_ocr._page_results_async(None, b"", {})]
+
+    results = asyncio.run(collect())
+    assert sorted(pages[0] for pages, _ in results) == [1, 2, 3]
+    first_request = next(t for kind, page, t in log if kind == "request" and page == 1)
+    last_render = max(t for kind, _, t in log if kind == "rendered")
+    assert first_request < last_render
+
+
+def test_async_fanout_reports_failed_group(monkeypatch):
+    monkeypatch.setattr(lab_ocr, "FANOUT_PAGES_PER_REQUEST", 1)
+    monkeypatch.setattr(lab_ocr, "_iter_pdf_images", _fake_render([1, 2], 0, []))
+
+    async def call(client, data_urls, pages):
+        if pages == [2]:
+            raise TimeoutError("timeout")
+        return _page_json(1), "{}"
+
+    monkeypatch.setattr(lab_ocr, "_call_page_group_async", call)
+    result = asyncio.run(lab_ocr._ocr_pdf_pages_async(None, b"", "a.pdf"))
+    assert [a["nombre"] for a in result["parsed"]["analitos"]] == ["Glucosa"]
+    assert result["pages"]["failed"] == [2]
+
+
+def test_async_fanout_propagates_render_error(monkeypatch):
+    def broken(file_bytes, report=None, texts=None):
+        report.update(total=2, classified=[{"page": 1, "decision": "lab"}, {"page": 2, "decision": "lab"}])
+        yield 1, "data:image/jpeg;base64,1"
+        raise RuntimeError("pdftoppm falló")
+
+    monkeypatch.setattr(lab_ocr, "_iter_pdf_images", broken)
+
+    async def call(client, data_urls, pages):
+        return _page_json(1), "{}"
+
+    monkeypatch.setattr(lab_ocr, "_call_page_group_async", call)
+    with pytest.raises(RuntimeError, match="pdftoppm"):
+        asyncio.run(lab_ocr._ocr_pdf_pages_async(None, b"", "a.pdf"))
+
+
+def test_sync_and_async_fanout_merge_the_same(monkeypatch):
+    monkeypatch.setattr(lab_ocr, "FANOUT_PAGES_PER_REQUEST", 1)
+    monkeypatch.setattr(lab_ocr, "_iter_pdf_images", _fake_render([1, 2, 3], 0, []))
+    lock = threading.Lock()
+
+    def call(client, data_urls, pages):
+        with lock:
+            return _page_json(pages[0]), "{}"
+
+    async def call_async(client, data_urls, pages):
+        return call(client, data_urls, pages)
+
+    monkeypatch.setattr(lab_ocr, "_call_page_group", call)
+    monkeypatch.setattr(lab_ocr, "_call_page_group_async", call_async)
+    sync = lab_ocr._ocr_pdf_pages(None, b"", "a.pdf")
+    async_ = asyncio.run(lab_ocr._ocr_pdf_pages_async(None, b"", "a.pdf"))
+    assert sync["parsed"] == async_["parsed"]
+    assert sync["parsed"]["nombre_estudio"] == "P1 / P2 / P3"
+
+
+def test_scanned_pdf_reads_the_text_layer_once(monkeypatch):
+    reads = []
+
+    def read_pdf_pages(file_bytes):
+        reads.append(file_bytes)
+        return ["", ""]  # escaneo: sin capa de texto
+
+    def render_page(file_bytes, page, classify):
+        return f"data:image/jpeg;base64,{page}", {"page": page, "decision": "lab", "by": "image"}
+
+    def call(client, data_urls, pages):
+        return _page_json(pages[0]), "{}"
+
+    async def call_async(client, data_urls, pages):
+        return call(client, data_urls, pages)
+
+    monkeypatch.setattr(lab_ocr, "PAGE_FILTER_ENABLED", True)
+    monkeypatch.setattr(lab_ocr, "TEXT_LAYER_ENABLED", True)
+    monkeypatch.setattr(lab_ocr, "FANOUT_ENABLED", True)
+    monkeypatch.setattr(lab_ocr, "FANOUT_PAGES_PER_REQUEST", 1)
+    monkeypatch.setattr(lab_ocr, "_read_pdf_pages", read_pdf_pages)
+    monkeypatch.setattr(lab_ocr, "pdfinfo_from_bytes", lambda file_bytes: {"Pages": 2})
+    monkeypatch.setattr(lab_ocr, "_render_page", render_page)
+    monkeypatch.setattr(lab_ocr, "get_openai_client", lambda purpose: None)
+    monkeypatch.setattr(lab_ocr, "get_async_openai_client", lambda purpose: None)
+    monkeypatch.setattr(lab_ocr, "_call_page_group", call)
+    monkeypatch.setattr(lab_ocr, "_call_page_group_async", call_async)
+
+    result = lab_ocr.ocr_and_extract_labs(b"%PDF", "a.pdf", use_cache=False)
+    assert len(reads) == 1
+    assert result["pages"]["sent"] == [1, 2]
+
+    reads.clear()
+    asyncio.run(lab_ocr.ocr_and_extract_labs_async(b"%PDF", "a.pdf", use_cache=False))
+    assert len(reads) == 1
+
+    reads.clear()
+    events = list(lab_ocr.ocr_and_extract_labs_stream(b"%PDF", "a.pdf", use_cache=False))
+    assert events[-1][0] == "result"
+    assert len(reads) == 1
+
+
+_RAW = json.dumps({"tipo_estudio": "laboratorio", "analitos": [
+    {"nombre": "Glucosa", "valor": 90, "unidad": "mg/dL"},
+    {"nombre": "Urea", "valor": 30, "unidad": "mg/dL"},
+]})
+
+
+def _chunks(raw):
+    return [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=raw[i : i + 7]))])
+            for i in range(0, len(raw), 7)]
+
+
+class _Client:
+    def __init__(self):
+        self.calls = []
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, stream=False, **params):
+        self.calls.append(stream)
+        if stream:
+            return iter(_chunks(_RAW))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=_RAW))])
+
+
+class _AsyncClient(_Client):
+    async def create(self, stream=False, **params):
+        response = _Client.create(self, stream, **params)
+        if not stream:
+            return response
+
+        async def chunks():
+            for chunk in response:
+                yield chunk
+        return chunks()
+
+
+@pytest.mark.parametrize("stage", ["text_model", "vision"])
+def test_entry_points_share_the_same_steps(monkeypatch, stage):
+    client, aclient = _Client(), _AsyncClient()
+    monkeypatch.setattr(lab_ocr, "get_openai_client", lambda purpose: client)
+    monkeypatch.setattr(lab_ocr, "get_async_openai_client", lambda purpose: aclient)
+    monkeypatch.setattr(lab_ocr, "_read_text_layer", lambda file_bytes, filename: None)
+    text = "Glucosa 90 mg/dL" if stage == "text_model" else None
+    monkeypatch.setattr(lab_ocr, "_try_text_layer", lambda pages, filename: (None, text))
+    monkeypatch.setattr(lab_ocr, "_build_ocr_request", lambda *args: {"model": "x"})
+
+    async def collect(events):
+        return [event async for event in events]
+
+    args = (b"img", "a.png", False)
+    sync = lab_ocr.ocr_and_extract_labs(*args)
+    async_ = asyncio.run(lab_ocr.ocr_and_extract_labs_async(*args))
+    events = list(lab_ocr.ocr_and_extract_labs_stream(*args))
+    async_events = asyncio.run(collect(lab_ocr.ocr_and_extract_labs_stream_async(*args)))
+
+    assert sync["source"] == stage
+    assert [a["nombre"] for a in sync["parsed"]["analitos"]] == ["Glucosa", "Urea"]
+    for result in (async_, events[-1][1], async_events[-1][1]):
+        assert result["parsed"] == sync["parsed"]
+    assert [kind for kind, _ in events] == [kind for kind, _ in async_events] == ["analito", "analito", "result"]
+    assert client.calls == aclient.calls == [False, True]  # la versión stream pide la respuesta en stream
+
+
+def test_text_layer_result_skips_the_model(monkeypatch):
+    def no_client(purpose):
+        raise AssertionError("no debería pedir el cliente")
+
+    data = {"analitos": [{"nombre": "Glucosa", "valor": 90, "unidad": "mg/dL"}]}
+    monkeypatch.setattr(lab_ocr, "get_openai_client", no_client)
+    monkeypatch.setattr(lab_ocr, "_read_text_layer", lambda file_bytes, filename: ["Glucosa 90"])
+    monkeypatch.setattr(
+        lab_ocr, "_try_text_layer",
+        lambda pages, filename: (lab_ocr._build_result(data, filename, None, "text_layer"), None),
+    )
+    events = list(lab_ocr.ocr_and_extract_labs_stream(b"%PDF", "a.pdf", use_cache=False))
+    assert [kind for kind, _ in events] == ["analito", "result"]
+    assert events[-1][1]["source"] == "text_layer"
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Parser genérico de lab_text.py contra la capa de texto de reportes reales (tests/fixtures)."""
+from pathlib import Path
+
+from lab_text import detect_panels, extract_from_text, parse_header, resolve_label, text_layer_ok
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def _pages(name):
+    return (FIXTURES / f"{name}.txt").read_text(encoding="utf-8").split("\f")
+
+
+def test_rows_report_without_profile():
+    pages = _pages("salud_digna_laboratorio")
+    assert text_layer_ok(pages)
+    data = extract_from_text(pages)
+    assert len(data["analitos"]) == 43
+    rows = {a["nombre"]: (a["valor"], a["unidad"]) for a in data["analitos"]}
+    assert rows["Glucosa"] == (82.5, "mg/dL")
+    assert rows["Colesterol total"] == (189.2, "mg/dL")
+    assert rows["Plaquetas"] == (208.0, "10^3/µL")
+    assert rows["Creatinina"] == (0.71, "mg/dL")
+    assert data["tipo_estudio"] == "laboratorio"
+    assert data["nombre_paciente"] == "PRUEBA, PACIENTE"
+    assert data["fecha_estudio"] == "2025-07-07"
+
+
+def test_header_and_panels():
+    text = "\n".join(_pages("salud_digna_laboratorio"))
+    assert detect_panels(text) == ["biometria", "quimica", "orina"]  # los del prompt compacto
+    header = parse_header(text)
+    assert header["paneles"] == ["BIOMETRIA HEMATICA", "QUÍMICA CLÍNICA", "INMUNOLOGÍA", "EXAMEN GENERAL DE ORINA"]
+    assert (header["nombre_paciente"], header["fecha_estudio"]) == ("PRUEBA, PACIENTE", "2025-07-07")
+
+
+def test_columns_report_needs_its_profile():
+    # Nombres, unidades y resultados en bloques separados: el parser por renglón no los empata
+    pages = _pages("moreira_bh_qs_ego")
+    assert text_layer_ok(pages)
+    data = extract_from_text(pages)
+    assert data["analitos"] == []
+    assert data["fecha_estudio"] == "2023-11-22"
+
+
+def test_report_without_results():
+    pages = _pages("salud_digna_ultrasonido")
+    assert text_layer_ok(pages)
+    assert extract_from_text(pages)["analitos"] == []
+
+
+def test_resolve_label_uses_synonyms():
+    assert resolve_label("HEMOGLOBINA") == "Hemoglobina"
+    assert resolve_label("Glucosa en suero") == "Glucosa"
+    assert resolve_label("Texto cualquiera") is None
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from ocr_jobs import OcrJobQueue, QueueFullError
+
+
+def _queue(tmp_path, process_fn=None, **kwargs) -> OcrJobQueue:
+    return OcrJobQueue(
+        process_fn=process_fn or (lambda file_bytes, filename, use_cache=True: {"filename": filename}),
+        path=tmp_path / "jobs.sqlite3",
+        spool_dir=tmp_path / "spool",
+        poll_interval=0.05,
+        **kwargs,
+    )
+
+
+def test_submit_claim_finish(tmp_path):
+    queue = _queue(tmp_path)
+    first = queue.submit(b"a", "a.pdf")
+    second = queue.submit(b"b", "b.pdf", use_cache=False)
+    assert (first["status"], first["queue_position"]) == ("queued", 1)
+    assert second["queue_position"] == 2
+
+    job_id, filename, file_path, use_cache = queue._claim()
+    assert (job_id, filename, use_cache) == (first["job_id"], "a.pdf", 1)
+    assert queue.status(job_id)["status"] == "running"
+    assert queue.status(second["job_id"])["queue_position"] == 1
+
+    queue._finish(job_id, file_path, result={"ok": True})
+    assert queue.status(job_id)["status"] == "done"
+    assert queue.result(job_id) == {"ok": True}
+    assert not Path(file_path).exists()
+    assert queue.stats() == {"queued": 1, "running": 0, "done": 1, "error": 0}
+
+
+def test_finish_with_error(tmp_path):
+    queue = _queue(tmp_path)
+    job_id = queue.submit(b"a", "a.pdf")["job_id"]
+    _, _, file_path, _ = queue._claim()
+    queue._finish(job_id, file_path, error="PDF dañado")
+    status = queue.status(job_id)
+    assert (status["status"], status["error"]) == ("error", "PDF dañado")
+    assert queue.result(job_id) is None
+
+
+def test_finish_after_requeue_keeps_file_and_state(tmp_path):
+    queue = _queue(tmp_path)
+    job_id = queue.submit(b"a", "a.pdf")["job_id"]
+    queue._pid = os.getpid()
+    _, _, file_path, _ = queue._claim()
+    queue.stop()  # devuelve el trabajo a la cola mientras el hilo sigue procesándolo
+    assert queue.status(job_id)["status"] == "queued"
+
+    queue._finish(job_id, file_path, result={"tarde": True})
+    assert queue.status(job_id)["status"] == "queued"
+    assert Path(file_path).read_bytes() == b"a"  # el siguiente proceso aún lo necesita
+
+
+def test_recover_orphans(tmp_path):
+    queue = _queue(tmp_path, max_attempts=2)
+    retry = queue.submit(b"a", "a.pdf")["job_id"]
+    give_up = queue.submit(b"b", "b.pdf")["job_id"]
+    conn = queue._db()
+    dead_pid = 2 ** 22 + 12345
+    conn.execute("UPDATE jobs SET status = 'running', owner_pid = ?, attempts = 1 WHERE id = ?", (dead_pid, retry))
+    conn.execute("UPDATE jobs SET status = 'running', owner_pid = ?, attempts = 2 WHERE id = ?", (dead_pid, give_up))
+    queue._recover_orphans(conn)
+    assert queue.status(retry)["status"] == "queued"
+    assert queue.status(give_up)["status"] == "error"
+
+
+def test_queue_full(tmp_path):
+    queue = _queue(tmp_path, max_queued=1)
+    queue.submit(b"a", "a.pdf")
+    with pytest.raises(QueueFullError):
+        queue.submit(b"b", "b.pdf")
+
+
+def test_workers_process_jobs(tmp_path):
+    seen = []
+
+    def process(file_bytes, filename, use_cache=True):
+        seen.append((file_bytes, filename, use_cache))
+        return {"filename": filename}
+
+    queue = _queue(tmp_path, process_fn=process, workers=1)
+    queue.start()
+    try:
+        job_id = queue.submit(b"contenido", "lab.png", use_cache=False)["job_id"]
+        deadline = time.time() + 5
+        while queue.status(job_id)["status"] != "done" and time.time() < deadline:
+            time.sleep(0.02)
+    finally:
+        queue.stop()
+    assert queue.result(job_id) == {"filename": "lab.png"}
+    assert seen == [(b"contenido", "lab.png", False)]
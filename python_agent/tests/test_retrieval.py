@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from retrieval import VectorSearchEngine
+
+
+def _brute_force(matrix, query, k):
+    """El ciclo original: coseno fila por fila y orden completo."""
+    q = query / np.linalg.norm(query)
+    sims = [float(row @ q / np.linalg.norm(row)) for row in matrix]
+    order = sorted(range(len(sims)), key=lambda i: -sims[i])[:k]
+    return order, [sims[i] for i in order]
+
+
+@pytest.mark.parametrize("k", [1, 5, 37, 500])
+def test_top_k_matches_brute_force(k):
+    rng = np.random.default_rng(7)
+    matrix = rng.normal(size=(300, 24))
+    queries = rng.normal(size=(4, 24))
+    engine = VectorSearchEngine(matrix)
+
+    batch_idx, batch_sims = engine.search_batch(queries, k)
+    for row, query in enumerate(queries):
+        expected_idx, expected_sims = _brute_force(matrix, query, k)
+        idx, sims = engine.search(query, k)
+        assert idx.tolist() == expected_idx
+        np.testing.assert_allclose(sims, expected_sims, rtol=1e-5, atol=1e-6)
+        assert batch_idx[row].tolist() == expected_idx
+        np.testing.assert_allclose(batch_sims[row], expected_sims, rtol=1e-5, atol=1e-6)
+
+
+def test_prenormalized_and_float16_matrices_give_the_same_ranking(monkeypatch):
+    import retrieval
+
+    rng = np.random.default_rng(3)
+    matrix = rng.normal(size=(200, 16)).astype(np.float32)
+    query = rng.normal(size=16)
+    expected, _ = VectorSearchEngine(matrix).search(query, 10)
+
+    normalized = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+    assert VectorSearchEngine(normalized, normalized=True).search(query, 10)[0].tolist() == expected.tolist()
+
+    monkeypatch.setattr(retrieval, "_BLOCK_ROWS", 64)  # fuerza varios bloques
+    half = VectorSearchEngine(normalized.astype(np.float16), normalized=True)
+    assert set(half.search(query, 10)[0].tolist()) >= set(expected[:5].tolist())
+
+
+def test_copy_false_normalizes_in_place_and_empty_index():
+    matrix = np.array([[3.0, 4.0], [0.0, 2.0]], dtype=np.float32)
+    engine = VectorSearchEngine(matrix, copy=False)
+    assert engine.matrix is matrix
+    np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1.0, rtol=1e-6)
+
+    empty = VectorSearchEngine(np.empty((0, 8)))
+    assert len(empty) == 0
+    assert empty.search(np.ones(8), 3)[0].shape == (0,)
+    assert empty.search_batch(np.ones((2, 8)), 3)[0].shape == (2, 0)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+translation.py
+
+Traducción al español pasaje por pasaje, para indexar documentos completos.
+- El idioma se detecta localmente (palabras vacías y acentos), sin llamar al LLM
+- Solo se traducen los pasajes que no están en español, en batches
+  concurrentes con backoff ante límites de tasa
+- Cada traducción se guarda en SQLite por hash de contenido: reconstruir el
+  índice no vuelve a pagar por pasajes ya traducidos
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from openai import OpenAI
+
+from embedding_cache import normalize_text
+from embedding_pipeline import call_with_backoff
+from sqlite_store import SqliteLRUStore
+
+ProgressFn = Callable[[str, int, int], None]
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / "cache" / "translations.sqlite3"
+TRANSLATION_MODEL = os.getenv("EVITY_TRANSLATE_MODEL", "gpt-4o-mini")
+DEFAULT_BATCH_SIZE = int(os.getenv("EVITY_TRANSLATE_BATCH", "8"))
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("EVITY_TRANSLATE_MAX_IN_FLIGHT", "4"))
+
+# Cambiar el prompt invalida las traducciones guardadas
+PROMPT_VERSION = "1"
+_SYSTEM_PROMPT = (
+    "Eres un traductor médico. Recibirás un objeto JSON con una lista `textos`. "
+    "Traduce cada elemento al español conservando el significado, las cifras y los términos técnicos. "
+    "Responde solo con un objeto JSON {\"traducciones\": [...]} con el mismo número de elementos "
+    "y en el mismo orden."
+)
+
+# ---------------------------------------------------------------------------
+# Detección de idioma
+# ---------------------------------------------------------------------------
+
+_WORD_RE = re.compile(r"[a-záéíóúüñ]+")
+_ES_MARKS_RE = re.compile(r"[ñ¿¡áéíóú]")
+
+_ES_STOPWORDS = frozenset(
+    "de la que el en y los se del las un por con no una su para es al lo como más pero sus le ya "
+    "este porque esta entre cuando muy sin sobre también me hasta hay donde desde todo nos durante "
+    "todos uno les ni contra otros ese eso ante ellos esto antes algunos unos otro otras otra tanto "
+    "esa estos mucho muchos cual poco ella estar estas algunas algo son fue han ser puede pacientes".split()
+)
+_EN_STOPWORDS = frozenset(
+    "the of and to in is that for it with as was on are be by this which or from at an have not were "
+    "has but their its these been can also than more such may other between into who had there would "
+    "after most all during over both those however our we they patients".split()
+)
+
+
+def detect_language(text: str, min_hits: int = 5) -> str:
+    """
+    'es', 'en' o 'und' (indeterminado: muy poco texto, tablas, fórmulas...).
+    Cuenta palabras vacías de cada idioma; las marcas del español (ñ, ¿, acentos) suman a favor.
+    """
+    words = _WORD_RE.findall(text[:4000].lower())
+    es = sum(1 for w in words if w in _ES_STOPWORDS)
+    en = sum(1 for w in words if w in _EN_STOPWORDS)
+    es += min(len(_ES_MARKS_RE.findall(text[:4000].lower())), es + 1)
+    if es + en < min_hits:
+        return "und"
+    return "es" if es >= en else "en"
+
+
+def needs_translation(text: str) -> bool:
+    return detect_language(text) == "en"
+
+
+# ---------------------------------------------------------------------------
+# Caché de traducciones
+# ---------------------------------------------------------------------------
+
+
+def translation_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{PROMPT_VERSION}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class TranslationCache(SqliteLRUStore):
+    """Traducciones en SQLite, llave = hash del texto original (+ modelo y versión del prompt)."""
+
+    TABLE = "translations"
+    COLUMNS = "model TEXT NOT NULL, text TEXT NOT NULL, created REAL NOT NULL"
+    LABEL = "Traducciones"
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH):
+        super().__init__(path)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, str]:
+        with self._lock:
+            conn = self._db()
+            found: Dict[str, str] = dict(self._select_keys(conn, "text", keys))
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, str]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            conn.executemany(
+                "INSERT OR REPLACE INTO translations (key, model, text, created) VALUES (?, ?, ?, ?)",
+                [(key, model, text, now) for key, text in items.items()],
+            )
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+# ---------------------------------------------------------------------------
+# Traducción por batches
+# ---------------------------------------------------------------------------
+
+
+def _translate_batch(client: OpenAI, texts: List[str], model: str) -> List[str]:
+    """Traduce un batch en una sola llamada; si la respuesta no cuadra, uno por uno."""
+
+    def request(batch: List[str]) -> List[str]:
+        resp = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": _SYSTEM_PROMPT},
+                {"role": "user", "content": json.dumps({"textos": batch}, ensure_ascii=False)},
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.0,
+        )
+        data = json.loads(resp.choices[0].message.content or "{}")
+        out = data.get("traducciones")
+        if not isinstance(out, list) or len(out) != len(batch) or not all(isinstance(t, str) for t in out):
+            raise ValueError("respuesta de traducción incompleta")
+        return out
+
+    try:
+        return call_with_backoff(lambda: request(texts), label="trans")
+    except ValueError:
+        if len(texts) == 1:
+            raise
+        return [call_with_backoff(lambda t=t: request([t]), label="trans")[0] for t in texts]
+
+
+def translate_passages(
+    client: OpenAI,
+    texts: Sequence[str],
+    cache: Optional[TranslationCache] = None,
+    model: str = TRANSLATION_MODEL,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    progress: Optional[ProgressFn] = None,
+) -> List[str]:
+    """
+    Devuelve `texts` con los pasajes en inglés traducidos al español (mismo orden).
+    Los que ya están en español o son indeterminados no se tocan. Si un batch
+    falla, sus pasajes se quedan en el idioma original y no se guardan en caché.
+    """
+    cache = cache if cache is not None else TRANSLATION_CACHE
+    out = list(texts)
+    todo = [i for i, t in enumerate(out) if needs_translation(t)]
+    if not todo:
+        return out
+
+    keys = {i: translation_key(model, out[i]) for i in todo}
+    cached = cache.get_many(list(keys.values()))
+    pending: Dict[str, List[int]] = {}
+    for i in todo:
+        if keys[i] in cached:
+            out[i] = cached[keys[i]]
+        else:
+            pending.setdefault(keys[i], []).append(i)
+
+    print(
+        f"[trans] Pasajes en inglés: {len(todo)} "
+        f"({len(todo) - sum(len(v) for v in pending.values())} desde caché, {len(pending)} por traducir)"
+    )
+    if not pending:
+        return out
+
+    unique = list(pending.items())  # [(key, [posiciones])]
+    batches = [unique[s : s + batch_size] for s in range(0, len(unique), batch_size)]
+    client = client.with_options(max_retries=0)
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight), thread_name_prefix="trans") as pool:
+        futures = {
+            pool.submit(_translate_batch, client, [out[idx[0]] for _, idx in batch], model): batch
+            for batch in batches
+        }
+        for fut in as_completed(futures):
+            batch = futures[fut]
+            try:
+                translated = fut.result()
+            except Exception as e:
+                print(f"[trans] ⚠️ Error traduciendo {len(batch)} pasajes; se quedan en su idioma: {e}")
+                translated = None
+            if translated is not None:
+                cache.put_many(model, {key: t for (key, _), t in zip(batch, translated)})
+                for (_, idx), t in zip(batch, translated):
+                    for i in idx:
+                        out[i] = t
+            done += len(batch)
+            if progress:
+                progress("traduciendo", done, len(unique))
+    return out
+
+
+# Caché compartida por todo el proceso
+TRANSLATION_CACHE = TranslationCache(
+    path=Path(os.getenv("EVITY_TRANSLATION_CACHE_PATH", str(DEFAULT_CACHE_PATH))),
+)
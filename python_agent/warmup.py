@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+warmup.py
+
+Calentamiento del proceso antes de aceptar tráfico (wsgi.py y api_async.py):
+abre el índice en disco (memmap), recorre las tablas de analitos y compila
+sus rangos a intervalos (analyte_intervals.py).
+"""
+
+import time
+from pathlib import Path
+
+from analyte_intervals import RANGE_INDEX, range_summary
+from analyte_ranges import ANALYTE_NAMES, get_analyte_info
+from evity_qa_agent import INDEX_HOLDER
+
+
+def warmup(base: Path) -> None:
+    """Abre el índice y recorre las tablas de analitos; nunca impide arrancar."""
+    start = time.perf_counter()
+    try:
+        snap = INDEX_HOLDER.preload(base)
+        if snap is None:
+            print("[warmup] Aún no hay índice; se construirá con la primera pregunta")
+        else:
+            print(f"[warmup] Índice listo: {len(snap.names)} pasajes (versión {snap.version})")
+    except Exception as e:
+        print(f"[warmup] ⚠️ No pude abrir el índice: {e}")
+
+    known = sum(1 for name in ANALYTE_NAMES if get_analyte_info(name))
+    numeric = sum(1 for ranges in RANGE_INDEX.values() if ranges.bands)
+    print(f"[warmup] Tablas de analitos: {known} analitos, {numeric} con rangos numéricos")
+    print(f"[warmup] Rangos: {range_summary()}")
+    print(f"[warmup] Listo en {(time.perf_counter() - start) * 1000:.0f} ms")
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+wsgi.py
+
+Punto de entrada WSGI para producción:
+    gunicorn -c gunicorn.conf.py wsgi:app
+(o `python3 start_service.py --mode prod`)
+
+Al importarse calienta el proceso antes de aceptar tráfico: abre el índice
+(memmap) y carga las tablas de analitos (ver warmup.py). Con `preload_app` de
+gunicorn esto ocurre una sola vez en el proceso maestro y los workers lo
+heredan al hacer fork.
+"""
+
+import sys
+from pathlib import Path
+
+# Agregar el directorio actual al path para importar los módulos del agente
+sys.path.insert(0, str(Path(__file__).parent))
+
+from api_server import BASE_DIR, app
+from warmup import warmup
+
+warmup(BASE_DIR)
+
+__all__ = ["app"]